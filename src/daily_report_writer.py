@@ -11,308 +11,376 @@ CLI 直接書き込みモード
   --mode    plan=計画列(C), result=実績列(F)
   --summary Excel に書き込む文字列（50文字以内に自動切り詰め）
   --date    書き込む日付 MM/DD 形式（省略時は今日）
+  --direct  常駐プロセス（writer_daemon.py）が起動していても直接書き込む
+  --batch   FILE（- なら標準入力）から複数の項目をまとめて書き込む
+  --profile 実行レポート（run_report.py）と一緒に cProfile / tracemalloc の結果を書き出す
+
+一括書き込み（--batch）:
+  1行1項目の JSONL または TSV（# で始まる行と空行は無視）。
+    {"mode": "plan", "date": "2/20", "summary": "設計レビューの準備"}
+    result<TAB>2/21<TAB>テスト完了        （日付が空なら今日）
+  全項目の形式を先に確認し、誤りがあれば何も書き込まずに終了する。
+  ブックごとに1回だけ読み込み・保存し、項目ごとの結果を表で表示する。
+  1件でも失敗すれば終了コード 1。
+
+常駐プロセスが起動していればブックの読み込みを省いてそちらに書き込みを依頼し、
+起動していなければこのプロセスで直接書き込む。
+スプール（write_spool.py）に残っている取り込みの項目（Excel が開かれていて書き込めなかった分）も
+同じブックの読み込み・保存で一緒に書き込む。
+別のプロセス（取り込みや別のスラッシュコマンド）がブックに書き込み中なら、項目をそのプロセスに渡して
+まとめて書き込んでもらい、終わるまで待ってから書き込んだセルを表示する（WORKBOOK_LOCK_TIMEOUT 秒まで）。
+書き込んだセルは取り込みと同じく出所（provenance.py）に記録し、python src/provenance.py --undo <実行ID> で取り消せる。
 """
 
 import argparse
 import json
-import os
-import re
+import sys
 import datetime as dt
 from pathlib import Path
 
-from dotenv import load_dotenv
-from openpyxl import load_workbook
+from report_extractor import resolve_year
+from settings import load_settings
+from workbook_pool import WorkbookPool, excel_path_for
 
-# .env ファイルから環境変数を読み込み
-load_dotenv()
 
-# ===== 設定 =====
-OUTLOOK_FOLDER = os.getenv("OUTLOOK_FOLDER", "Teams日報")
-STATE_FILE = Path("processed_mail_ids.json")
+# ===== ユーティリティ =====
+def parse_date(text: str) -> dt.date:
+    """
+    MM/DD（年は今日から決める）または YYYY-MM-DD を日付にする。
 
-# 現在の月に基づいてファイルパスを動的に生成
-today = dt.date.today()
-year = today.year
-month = today.month
+    年始に 12/31 を指定した場合などは前年として扱う（メール取り込みと同じ規則）。
+    解釈できなければ ValueError。
+    """
+    text = text.strip()
+    if "-" in text:
+        return dt.date.fromisoformat(text)
+    parts = text.split("/")
+    if len(parts) != 2:
+        raise ValueError(text)
+    m, d = int(parts[0]), int(parts[1])
+    return dt.date(resolve_year(m, dt.date.today()), m, d)
+
+
+def place_entry(pool: WorkbookPool, target_date: dt.date, mode: str, summary: str,
+                result: dict | None = None, plan=None, entry_id: str = "cli") -> tuple[str | None, str]:
+    """
+    summary を target_date の日付ブロックに書き込む（保存はしない）。
 
-# 年度計算（4月始まり）
-fiscal_year = year if month >= 4 else year - 1
+    return (セル番地, 表示するメッセージ)。書き込めなかった場合のセル番地は None
+    保存の直前にブックが外部で変更されていて書き込み直した場合は、新しいセル番地を表示して
+    result（一括書き込みの項目）の "cell" を更新する。
+    plan（WritePlan）を指定すると、書き込んだセルを entry_id の項目の編集として plan.edits に加える
+    （保存の後に出所を記録し、provenance.py --undo で取り消せるようにする）。
+    """
+    from write_plan import CellEdit, PlanEntry
 
-# 年度内の月番号（4月=01, 5月=02, ..., 12月=09, 1月=10, 2月=11, 3月=12）
-if month >= 4:
-    fiscal_month_num = month - 3  # 4月=1, 5月=2, ..., 12月=9
-else:
-    fiscal_month_num = month + 9  # 1月=10, 2月=11, 3月=12
+    try:
+        book = pool.get(target_date)
+    except PermissionError:
+        return None, "エラー: Excelファイルが開かれています。閉じてから再実行してください。"
+    except Exception as e:
+        return None, f"エラー: Excelファイルの読み込みに失敗しました。{type(e).__name__}: {e}"
+    if book is None:
+        return None, f"エラー: Excelファイルが見つかりません: {excel_path_for(target_date)}"
 
-# 月フォルダ名（09_12月 形式）
-month_folder = f"{fiscal_month_num:02d}_{month}月"
+    # 書き込む日付の月のシートで日付行を検索
+    index = book.index_for(target_date)
+    date_row = index.find_row(target_date)
+    if date_row is None:
+        return None, f"エラー: {target_date} ({target_date.month}/{target_date.day}) の日付行が見つかりません。"
 
-# ファイル名の月部分
-month_name = f"{month}月"
+    # result モードは先頭行が計画列の数式コピーで埋まるため 2 行目から開始
+    start_offset = 1 if mode == "result" else 0
 
-# ===== Excelファイルパス設定 =====
-# 環境変数 EXCEL_PATH が設定されていればそれを使用
-excel_path_template = os.getenv("EXCEL_PATH", "")
+    # 空き行を探して書き込み（空き行がない場合は最終行に追記）
+    coord, appended = index.write(date_row, mode, summary, start_offset)
+    edit = None
+    if plan is not None:
+        column = index.columns[mode]
+        entry = PlanEntry(entry_id, mode, summary, target_date, start_offset)
+        edit = CellEdit(index.title, int(coord[len(column):]), column, mode, target_date, summary,
+                        appended, [entry], str(book.path))
+        plan.edits.append(edit)
+
+    def rebase(book):
+        # 読み込み直したシートの空き行に書き込み直す
+        index = book.index_for(target_date)
+        date_row = index.find_row(target_date)
+        if date_row is None:
+            print(f"警告: 読み込み直したブックに {target_date} の日付行がないため書き込めません: {summary}")
+            return
+        coord, appended = index.write(date_row, mode, summary, start_offset)
+        print(f"再適用: {coord} ← {summary}")
+        if result is not None:
+            result["cell"] = coord
+        if edit is not None:
+            edit.sheet, edit.row, edit.append = index.title, int(coord[len(edit.column):]), appended
+
+    book.on_rebase(rebase)
+    if appended:
+        return coord, f"追記（空き行なし）: {coord} ← {summary}"
+    return coord, f"書き込み: {coord} ← {summary}"
+
+
+def save_error(e: Exception) -> str:
+    if isinstance(e, PermissionError):
+        return "エラー: Excelファイルの保存に失敗しました。ファイルを閉じてから再実行してください。"
+    return f"エラー: Excelファイルの保存に失敗しました。{type(e).__name__}: {e}"
+
+
+def write_to_excel(target_date: dt.date, mode: str, summary: str,
+                   pool: WorkbookPool | None = None) -> bool:
+    """
+    Excel の計画列(C) または実績列(F) に summary を書き込む。
+    mode: 'plan' → PLAN_COL, 'result' → RESULT_COL
+    pool: 開いたままのブックを使う場合のプール（常駐プロセス）。省略時はこの呼び出しだけで開く
+    """
+    from write_plan import WritePlan
+    from write_spool import WorkbookSession, drain_before
 
-if excel_path_template:
-    # テンプレート文字列の置換
-    excel_path_str = excel_path_template.format(
-        fiscal_year=fiscal_year,
-        month_folder=month_folder,
-        month_name=month_name
-    )
-    EXCEL_PATH = Path(excel_path_str)
-else:
-    # 環境変数からテンプレート要素を取得してパスを生成
-    username = os.getenv("EXCEL_USERNAME") or os.getenv("USERNAME", "username")
-    company = os.getenv("EXCEL_COMPANY", "株式会社サンプル")
-    department = os.getenv("EXCEL_DEPARTMENT", "部署名-01.庶務事項")
-    category = os.getenv("EXCEL_CATEGORY", "業務管理")
-    base_folder = os.getenv("EXCEL_BASE_FOLDER", "業務内容報告書")
-    team = os.getenv("EXCEL_TEAM", "チームA")
-    user_name = os.getenv("EXCEL_USER_NAME", "山田太郎")
-    
-    # OneDriveベースパス
-    onedrive_base = f"C:\\Users\\{username}\\OneDrive - {company}"
-    
-    EXCEL_PATH = Path(
-        f"{onedrive_base}\\{department}\\{category}\\"
-        f"{base_folder}\\{fiscal_year}年度\\{month_folder}\\{team}\\"
-        f"（{month_name}_{user_name}）業務内容報告書.xlsm"
-    )
+    if pool is None:
+        pool = WorkbookPool(*load_settings().columns, max_open=1)
+    session = WorkbookSession(pool)
+    if not session.acquire():
+        # 別のプロセスがブックに書き込み中なら、項目を渡してまとめて書き込んでもらう
+        return hand_off(session, target_date, mode, summary)
+
+    drain = None
+    try:
+        # スプールに残っている取り込みの項目も一緒に書き込む
+        drain = drain_before(pool)
+        plan = WritePlan()
+        coord, message = place_entry(pool, target_date, mode, summary, plan=plan,
+                                     entry_id=f"cli:{session.spool.run_id}")
+        print(message)
+        if coord is None:
+            return False
+
+        # 保存
+        try:
+            pool.save_all()
+        except Exception as e:
+            print(save_error(e))
+            return False
+        finally:
+            if drain is not None:
+                drain.finish()
+        record_provenance(plan, session.spool.run_id)
+        # 書き込みの間に別のプロセスから渡された項目も書き込む
+        session.follow(None, drain)
+        return True
+    finally:
+        session.release(None, drain)
 
-# Excel構造設定
-SHEET_NAME_PATTERN = f"{month}月"
-DATE_COL = os.getenv("DATE_COL", "B")
-PLAN_COL = os.getenv("PLAN_COL", "C")
-RESULT_COL = os.getenv("RESULT_COL", "F")
-ROWS_PER_DAY = int(os.getenv("ROWS_PER_DAY", "6"))
 
+def record_provenance(plan, run_id: str, workbooks=None) -> None:
+    """保存できた書き込みの出所を記録する（取り込みと同じく provenance.py --undo で取り消せる）。"""
+    from provenance import ProvenanceIndex
 
-# ===== ユーティリティ =====
-def load_state():
-    if STATE_FILE.exists():
-        return set(json.loads(STATE_FILE.read_text(encoding="utf-8")))
-    return set()
+    provenance = ProvenanceIndex(run_id=run_id)
+    provenance.record_plan(plan, workbooks)
+    provenance.commit()
 
-def save_state(ids):
-    STATE_FILE.write_text(json.dumps(list(ids), ensure_ascii=False, indent=2), encoding="utf-8")
 
-def extract_daily_reports(text: str, mail_received_date=None):
+def hand_off(session, target_date: dt.date, mode: str, summary: str) -> bool:
     """
-    return list of (kind, summary, date) tuples
-    1つのメッセージから複数の日報（計画・結果）を抽出
-    
-    対応パターン:
-    1. #日報計画 MM/DD 要約:xxxxx
-    2. #日報結果 MM/DD 要約:xxxxx
-    3. #日報計画 MM/DD xxxxx
-    4. #日報結果 MM/DD xxxxx
-    5. #日報 MM/DD xxxxx (結果として扱う)
-    6. 日付なしの場合は None を返す（メール受信日を使用）
-    
-    Note: Teamsのメール本文にはプレビュー部分と実際のメッセージ部分が含まれる。
-          実際のメッセージ部分のみを抽出するため、"Microsoft Teams" 以降を使用。
+    ロックを持っているプロセスに summary を渡し（スプールに追記）、ロックが空くまで待って結果を表示する。
+
+    ロックを持っていたプロセスが書き込まずに終わっていれば、ロックを取ったこのプロセスで書き込む。
     """
-    # Teamsメールの実際のメッセージ部分を抽出
-    # "Microsoft Teams" というテキストの後が実際のメッセージ
-    if "Microsoft Teams" in text:
-        # "Microsoft Teams" の後、発信者名の後から実際のメッセージが始まる
-        parts = text.split("Microsoft Teams")
-        if len(parts) > 1:
-            # 後半部分のみを使用（実際のチャットメッセージ）
-            text = parts[-1]
-    
-    reports = []
-    # メール受信日がある場合はその年を基準に、ない場合は今日の年を使用
-    if mail_received_date:
-        base_year = mail_received_date.year
-    else:
-        base_year = dt.date.today().year
-    
-    # #日報計画を全て抽出（日付付き）
-    for m in re.finditer(r"#日報計画\s+(\d{1,2})/(\d{1,2})\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)", text):
-        month = int(m.group(1))
-        day = int(m.group(2))
-        summary = m.group(3).strip()[:50]
-        if summary:
-            try:
-                # 年をまたぐ場合の処理（メール受信日を基準に判定）
-                if mail_received_date:
-                    # メール受信月と報告月を比較して年を決定
-                    if mail_received_date.month == 12 and month == 1:
-                        # 12月に受信して1月の日付を指定した場合は翌年
-                        year = base_year + 1
-                    elif mail_received_date.month == 1 and month == 12:
-                        # 1月に受信して12月の日付を指定した場合は前年
-                        year = base_year - 1
-                    else:
-                        year = base_year
-                else:
-                    year = base_year
-                report_date = dt.date(year, month, day)
-                reports.append(("plan", summary, report_date))
-            except ValueError:
-                print(f"  警告: 無効な日付 {month}/{day}")
-    
-    # #日報結果を全て抽出（日付付き）
-    for m in re.finditer(r"#日報結果\s+(\d{1,2})/(\d{1,2})\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)", text):
-        month = int(m.group(1))
-        day = int(m.group(2))
-        summary = m.group(3).strip()[:50]
-        if summary:
-            try:
-                # 年をまたぐ場合の処理（メール受信日を基準に判定）
-                if mail_received_date:
-                    # メール受信月と報告月を比較して年を決定
-                    if mail_received_date.month == 12 and month == 1:
-                        # 12月に受信して1月の日付を指定した場合は翌年
-                        year = base_year + 1
-                    elif mail_received_date.month == 1 and month == 12:
-                        # 1月に受信して12月の日付を指定した場合は前年
-                        year = base_year - 1
-                    else:
-                        year = base_year
-                else:
-                    year = base_year
-                report_date = dt.date(year, month, day)
-                reports.append(("result", summary, report_date))
-            except ValueError:
-                print(f"  警告: 無効な日付 {month}/{day}")
-    
-    # #日報（単独）を全て抽出（日付付き、結果として扱う）
-    for m in re.finditer(r"#日報\s+(\d{1,2})/(\d{1,2})\s+(.+?)(?:\n|$)", text):
-        month = int(m.group(1))
-        day = int(m.group(2))
-        summary = m.group(3).strip()[:50]
-        if summary and "計画" not in summary and "結果" not in summary:
-            try:
-                # 年をまたぐ場合の処理（メール受信日を基準に判定）
-                if mail_received_date:
-                    # メール受信月と報告月を比較して年を決定
-                    if mail_received_date.month == 12 and month == 1:
-                        # 12月に受信して1月の日付を指定した場合は翌年
-                        year = base_year + 1
-                    elif mail_received_date.month == 1 and month == 12:
-                        # 1月に受信して12月の日付を指定した場合は前年
-                        year = base_year - 1
-                    else:
-                        year = base_year
-                else:
-                    year = base_year
-                report_date = dt.date(year, month, day)
-                reports.append(("result", summary, report_date))
-            except ValueError:
-                print(f"  警告: 無効な日付 {month}/{day}")
-    
-    # 日付なしのパターン（後方互換性のため）
-    if not reports:
-        # #日報計画（日付なし）
-        for m in re.finditer(r"#日報計画\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)", text):
-            summary = m.group(1).strip()[:50]
-            if summary and not re.match(r"\d{1,2}/\d{1,2}", summary):
-                reports.append(("plan", summary, None))
-        
-        # #日報結果（日付なし）
-        for m in re.finditer(r"#日報結果\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)", text):
-            summary = m.group(1).strip()[:50]
-            if summary and not re.match(r"\d{1,2}/\d{1,2}", summary):
-                reports.append(("result", summary, None))
-        
-        # #日報（日付なし）
-        for m in re.finditer(r"#日報\s+(.+?)(?:\n|$)", text):
-            summary = m.group(1).strip()[:50]
-            if (summary and "計画" not in summary and
-                    "結果" not in summary and
-                    not re.match(r"\d{1,2}/\d{1,2}", summary)):
-                reports.append(("result", summary, None))
-    
-    return reports
-
-
-def find_row_by_date(ws, target_date):
-    """B列から target_date に一致する行番号を返す。見つからなければ None。"""
-    for r in range(1, ws.max_row + 1):
-        v = ws[f"{DATE_COL}{r}"].value
-        if isinstance(v, (dt.date, dt.datetime)):
-            cell_date = v.date() if isinstance(v, dt.datetime) else v
-            if cell_date == target_date:
-                return r
-    return None
-
-
-def write_to_excel(target_date: dt.date, mode: str, summary: str) -> bool:
+    from provenance import ProvenanceIndex
+    from write_plan import PlanEntry
+    from write_spool import lock_timeout
+
+    # result モードは先頭行が計画列の数式コピーで埋まるため 2 行目から開始（place_entry() と同じ）
+    entry = PlanEntry(f"cli:{session.spool.run_id}", mode, summary, target_date, 1 if mode == "result" else 0)
+    session.spool.add([entry])
+    timeout = lock_timeout()
+    print(f"他のプロセスが Excel に書き込み中のため、項目を渡して書き込みを待ちます（最大 {timeout:g}秒）")
+    if not session.acquire(timeout):
+        print("エラー: 書き込みが終わりませんでした。項目はスプールに保存済みで、"
+              "次にいずれかのスクリプトを実行したときに書き込まれます。")
+        return False
+    try:
+        session.follow()
+        if any(e.entry_id == entry.entry_id for e in session.spool.reload().pending()[0]):
+            print("エラー: Excelファイルに書き込めませんでした。項目はスプールに残り、"
+                  "次にいずれかのスクリプトを実行したときに書き込まれます。")
+            return False
+        records = ProvenanceIndex().for_entries([entry.entry_id])
+        if not records:
+            print(f"エラー: {target_date} ({target_date.month}/{target_date.day}) の日付行"
+                  f"または Excelファイル（{excel_path_for(target_date)}）が見つかりません。")
+            return False
+        record = records[-1]
+        if record["append"]:
+            print(f"追記（空き行なし）: {record['cell']} ← {summary}")
+        else:
+            print(f"書き込み: {record['cell']} ← {summary}")
+        return True
+    finally:
+        session.release()
+
+
+# ===== 一括書き込み =====
+def parse_batch(lines) -> tuple[list[dict], list[str]]:
     """
-    Excel の計画列(C) または実績列(F) に summary を書き込む。
-    mode: 'plan' → PLAN_COL, 'result' → RESULT_COL
+    JSONL / TSV の行を項目にする。
+
+    return (項目のリスト, エラーメッセージのリスト)
+    項目は {"line": 行番号, "mode": ..., "date": dt.date, "summary": ...}
+    """
+    entries, errors = [], []
+    for line_no, raw in enumerate(lines, start=1):
+        line = raw.rstrip("\r\n")
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        try:
+            if line.lstrip().startswith("{"):
+                item = json.loads(line)
+                if not isinstance(item, dict):
+                    raise ValueError("JSON はオブジェクトで指定してください")
+                mode, date_text, summary = item.get("mode"), item.get("date") or "", item.get("summary")
+            else:
+                fields = line.split("\t", 2)
+                if len(fields) != 3:
+                    raise ValueError("TSV は「モード<TAB>日付<TAB>要約」の3列で指定してください")
+                mode, date_text, summary = fields
+        except ValueError as e:
+            errors.append(f"{line_no}行目: 形式が正しくありません。{e}")
+            continue
+
+        if mode not in ("plan", "result"):
+            errors.append(f"{line_no}行目: モードは plan または result を指定してください: {mode}")
+            continue
+        try:
+            target_date = parse_date(str(date_text)) if str(date_text).strip() else dt.date.today()
+        except ValueError:
+            errors.append(f"{line_no}行目: 日付の形式が正しくありません（MM/DD または YYYY-MM-DD）: {date_text}")
+            continue
+        summary = str(summary or "").strip()[:50]
+        if not summary:
+            errors.append(f"{line_no}行目: 要約が空です")
+            continue
+        entries.append({"line": line_no, "mode": mode, "date": target_date, "summary": summary})
+    return entries, errors
+
+
+def write_batch(entries: list[dict], pool: WorkbookPool | None = None) -> bool:
     """
-    if not EXCEL_PATH.exists():
-        print(f"エラー: Excelファイルが見つかりません: {EXCEL_PATH}")
+    項目をブックごとにまとめて書き込み、ブックごとに1回保存する。
+
+    各項目に "cell" と "status" を設定する。全件成功なら True。
+    別のプロセスがブックに書き込み中なら、ロックが空くまで待ってから書き込む。
+    """
+    from write_plan import WritePlan
+    from write_spool import WorkbookSession, drain_before, lock_timeout
+
+    if pool is None:
+        pool = WorkbookPool(*load_settings().columns, max_open=1)
+    session = WorkbookSession(pool)
+    if not session.acquire(lock_timeout()):
+        for entry in entries:
+            entry["cell"] = "-"
+            entry["status"] = "他のプロセスの書き込みが終わりませんでした。再実行してください。"
         return False
 
-    keep_vba = EXCEL_PATH.suffix.lower() == ".xlsm"
+    drain = None
     try:
-        wb = load_workbook(EXCEL_PATH, keep_vba=keep_vba, data_only=False)
-    except PermissionError:
-        print("エラー: Excelファイルが開かれています。閉じてから再実行してください。")
-        return False
-    except Exception as e:
-        print(f"エラー: Excelファイルの読み込みに失敗しました。{type(e).__name__}: {e}")
-        return False
+        # スプールに残っている取り込みの項目も一緒に書き込む
+        drain = drain_before(pool)
+        plan = WritePlan()
+        groups: dict[Path, list[dict]] = {}
+        for entry in entries:
+            groups.setdefault(excel_path_for(entry["date"]), []).append(entry)
+
+        for path in sorted(groups):
+            group = groups[path]
+            for entry in group:
+                coord, message = place_entry(pool, entry["date"], entry["mode"], entry["summary"], entry,
+                                             plan, f"cli:{session.spool.run_id}")
+                entry["cell"] = coord or "-"
+                entry["status"] = "OK" if coord else message.removeprefix("エラー: ")
+
+            written = [entry for entry in group if entry["status"] == "OK"]
+            if not written:
+                continue
+            book = pool.open(path)
+            try:
+                pool.save(book)
+            except Exception as e:
+                pool.discard(path)
+                for entry in written:
+                    entry["status"] = save_error(e).removeprefix("エラー: ")
+        record_provenance(plan, session.spool.run_id,
+                          {str(path) for path, group in groups.items()
+                           if any(entry["status"] == "OK" for entry in group)})
+        if drain is not None:
+            # スプールの項目だけを書き込んだブック
+            try:
+                pool.save_all()
+            except Exception as e:
+                print(save_error(e))
+            drain.finish()
+        session.follow(None, drain)
+    finally:
+        session.release(None, drain)
+        pool.close()
+    return all(entry["status"] == "OK" for entry in entries)
+
+
+def print_batch_result(entries: list[dict]) -> None:
+    print("  行  日付        モード  セル   結果")
+    for entry in entries:
+        print(f"{entry['line']:>4}  {entry['date'].isoformat():<10}  {entry['mode']:<6}  "
+              f"{entry['cell']:<5}  {entry['status']}  {entry['summary'] if entry['status'] == 'OK' else ''}".rstrip())
+    failed = sum(entry["status"] != "OK" for entry in entries)
+    print()
+    print(f"処理結果: 成功 {len(entries) - failed}件, 失敗 {failed}件")
+
 
-    # シート選択
-    target_sheet = None
-    for sheet_name in wb.sheetnames:
-        if SHEET_NAME_PATTERN in sheet_name:
-            target_sheet = sheet_name
-            break
-    if target_sheet:
-        ws = wb[target_sheet]
+def run_batch(source: str, profile: bool = False) -> int:
+    if source == "-":
+        lines = sys.stdin.readlines()
     else:
-        ws = wb.active
-        print(f"警告: '{SHEET_NAME_PATTERN}'を含むシートが見つかりません。'{ws.title}'を使用します。")
+        try:
+            lines = Path(source).read_text(encoding="utf-8-sig").splitlines()
+        except OSError as e:
+            print(f"エラー: 入力ファイルを読み込めません: {e}")
+            return 1
 
-    # 日付行を検索
-    date_row = find_row_by_date(ws, target_date)
-    if date_row is None:
-        print(f"エラー: {target_date} ({target_date.month}/{target_date.day}) の日付行が見つかりません。")
-        return False
+    entries, errors = parse_batch(lines)
+    if errors:
+        for error in errors:
+            print(f"エラー: {error}")
+        print(f"\n{len(errors)}件の誤りがあるため、何も書き込まずに終了します。")
+        return 1
+    if not entries:
+        print("書き込む項目がありません。")
+        return 0
 
-    # 入力開始行（日付行の 3 行上）
-    input_start_row = date_row - 3
-    col = PLAN_COL if mode == "plan" else RESULT_COL
+    from run_report import run_with_report
 
-    # result モードは先頭行が計画列の数式コピーで埋まるため 2 行目から開始
-    start_offset = 1 if mode == "result" else 0
+    return run_with_report("daily_report_writer", write_batch_report, entries, profile=profile)
 
-    # 空き行を探して書き込み
-    written = False
-    for offset in range(start_offset, ROWS_PER_DAY):
-        target_row = input_start_row + offset
-        cell = ws[f"{col}{target_row}"]
-        if not cell.value:
-            cell.value = summary
-            print(f"書き込み: {col}{target_row} ← {summary}")
-            written = True
-            break
-
-    if not written:
-        # 空き行がない場合は最終行に追記
-        target_row = input_start_row + ROWS_PER_DAY - 1
-        cell = ws[f"{col}{target_row}"]
-        cell.value = f"{cell.value}\n{summary}" if cell.value else summary
-        print(f"追記（空き行なし）: {col}{target_row} ← {summary}")
-
-    # 保存
-    try:
-        wb.save(EXCEL_PATH)
-        return True
-    except PermissionError:
-        print("エラー: Excelファイルの保存に失敗しました。ファイルを閉じてから再実行してください。")
-        return False
-    except Exception as e:
-        print(f"エラー: Excelファイルの保存に失敗しました。{type(e).__name__}: {e}")
-        return False
+
+def write_batch_report(entries: list[dict], report) -> int:
+    # .env ファイルから環境変数を読み込み（形式の確認が済んでから）
+    pool = WorkbookPool(*load_settings().columns, max_open=1)
+    report.add_pool(pool)
+
+    print(f"一括書き込み: {len(entries)}件 ({len({excel_path_for(e['date']) for e in entries})}冊)")
+    print()
+    with report.stage("write"):
+        ok = write_batch(entries, pool)
+    written = sum(entry["status"] == "OK" for entry in entries)
+    report.counters.update(entries=len(entries), cells_written=written, entries_failed=len(entries) - written)
+    print()
+    print_batch_result(entries)
+    if ok:
+        print("\n日報更新完了")
+        return 0
+    return 1
 
 
 def main():
@@ -322,49 +390,88 @@ def main():
         epilog=(
             "例:\n"
             "  python src/daily_report_writer.py --mode plan --summary \"設計レビューの準備\"\n"
-            "  python src/daily_report_writer.py --mode result --date 2/21 --summary \"テスト完了\""
+            "  python src/daily_report_writer.py --mode result --date 2/21 --summary \"テスト完了\"\n"
+            "  python src/daily_report_writer.py --batch week.tsv"
         ),
     )
     parser.add_argument(
-        "--mode", choices=["plan", "result"], required=True,
+        "--mode", choices=["plan", "result"],
         help="plan=計画列(C), result=実績列(F)"
     )
     parser.add_argument(
-        "--summary", required=True,
+        "--summary",
         help="Excel に書き込む文字列（50文字以内に自動切り詰め）"
     )
     parser.add_argument(
         "--date",
         help="書き込む日付 MM/DD 形式（省略時は今日）"
     )
+    parser.add_argument(
+        "--direct", action="store_true",
+        help="常駐プロセスが起動していても使わずに直接書き込む"
+    )
+    parser.add_argument(
+        "--batch", metavar="FILE",
+        help="JSONL / TSV の FILE（- なら標準入力）から複数の項目をまとめて書き込む"
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="実行レポートと一緒に cProfile と tracemalloc のスナップショットを書き出す"
+    )
     args = parser.parse_args()
 
+    if args.batch:
+        if args.mode or args.summary or args.date:
+            parser.error("--batch と --mode / --summary / --date は同時に指定できません")
+        exit(run_batch(args.batch, profile=args.profile))
+    if not args.mode or args.summary is None:
+        parser.error("--mode と --summary を指定してください（または --batch）")
+
     summary = args.summary.strip()[:50]
 
     # 日付解析
     if args.date:
         try:
-            parts = args.date.split("/")
-            m, d = int(parts[0]), int(parts[1])
-            target_date = dt.date(today.year, m, d)
-        except (ValueError, IndexError):
+            target_date = parse_date(args.date)
+        except ValueError:
             print("エラー: 日付の形式が正しくありません。MM/DD 形式で指定してください。例: 2/21")
             exit(1)
     else:
-        target_date = today
+        target_date = dt.date.today()
 
+    from run_report import run_with_report
+
+    exit(run_with_report("daily_report_writer", run_single, args, target_date, summary,
+                         profile=args.profile))
+
+
+def run_single(args, target_date: dt.date, summary: str, report) -> int:
+    # .env ファイルから環境変数を読み込み（EXCEL_PATH などは表示・書き込みの直前に参照する）
+    settings = load_settings()
     mode_label = "計画 (C列)" if args.mode == "plan" else "実績 (F列)"
     print(f"モード  : {mode_label}")
     print(f"日付    : {target_date}")
     print(f"要約    : {summary}")
-    print(f"Excel   : {EXCEL_PATH}")
+    print(f"Excel   : {excel_path_for(target_date)}")
     print()
 
-    ok = write_to_excel(target_date, args.mode, summary)
+    ok = None
+    if not args.direct:
+        from writer_daemon import request_write
+
+        # 常駐プロセスが書き込んだ場合、読み込み・保存の内訳は記録されない
+        with report.stage("daemon"):
+            ok = request_write(target_date, args.mode, summary)
+    if ok is None:
+        pool = WorkbookPool(*settings.columns, max_open=1)
+        report.add_pool(pool)
+        with report.stage("write"):
+            ok = write_to_excel(target_date, args.mode, summary, pool=pool)
+    report.counters.update(entries=1, cells_written=int(ok))
     if ok:
         print("\n日報更新完了")
-    else:
-        exit(1)
+        return 0
+    return 1
 
 
 if __name__ == "__main__":
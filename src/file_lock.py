@@ -0,0 +1,95 @@
+"""
+プロセス間の排他ロック（ロックファイル）
+
+スラッシュコマンドの daily_report_writer.py・定期実行の取り込み・手動の再取り込みが同じ月のブックを
+同時に読み込み・変更・保存すると、最後に保存したプロセスの内容だけが残り、ほかのプロセスの書き込みが消える。
+FileLock はローカルのロックファイルに OS のファイルロック（Windows は msvcrt.locking、
+それ以外は fcntl.flock）をかけ、ブックのセッション（読み込み → 変更 → 保存）を1プロセスずつにする。
+
+ロックはファイルを閉じれば（プロセスが異常終了しても）OS が解放するため、古いロックファイルが残っても問題ない。
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from pathlib import Path
+
+# ロックを待つときの確認間隔（秒）
+POLL_INTERVAL = 0.05
+
+
+class FileLock:
+    """path のロックファイルによるプロセス間の排他ロック（同じプロセス内での再入は不可）。"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: int | None = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        """
+        ロックを取る。timeout 秒（0 なら1回だけ試す、None なら無期限）待っても取れなければ False。
+        """
+        if self._fd is not None:
+            raise RuntimeError(f"ロックはすでに取得済みです: {self.path}")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if _try_lock(fd):
+                self._fd = fd
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                os.close(fd)
+                return False
+            time.sleep(POLL_INTERVAL)
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            _unlock(fd)
+        finally:
+            os.close(fd)
+
+    def __enter__(self) -> FileLock:
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+if sys.platform == "win32":
+    import msvcrt
+
+    def _try_lock(fd: int) -> bool:
+        # 先頭1バイトをロックする（ファイルが空でもロックできる）
+        os.lseek(fd, 0, os.SEEK_SET)
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock(fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
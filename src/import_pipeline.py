@@ -0,0 +1,239 @@
+"""
+本文取得 → 抽出 → 書き込み計画のパイプライン
+
+旧実装は本文の取得・抽出を1通ずつ順に行い、全メールを読み終えてから
+WritePlan.route() で書き込み先のブック（大きな .xlsm）を読み込んでいたため、
+実行時間は「Outlook からの本文取得 + 抽出 + ブックの読み込み」の合計になっていた。
+
+ここでは4つの段階を上限付きのキューでつなぎ、並行に動かす:
+
+  fetch  本文の取得（呼び出し元のスレッド。Outlook COM のオブジェクトは作成したスレッドでしか使えない）
+  parse  日報の抽出（スレッド。--jobs 2 以上なら extract_all でプロセスプールへ渡す）
+  load   抽出結果から分かった書き込み先のブックの読み込み（スレッド、WorkbookPool.open）
+  write  抽出結果の表示と WritePlan への追加（スレッド、受信の古い順のまま1件ずつ）
+
+COM 呼び出しやファイル読み込み・ZIP 展開の間は GIL が解放されるため、
+実行時間はおおむね最も遅い段階の時間に近づく。run() が戻った時点で
+書き込み先のブックは読み込み済みなので、その後の route() はブックを読み込まずに済む。
+書き込む項目がないブック（needs_workbook が False を返す項目だけのブック）は先読みしない。
+
+各段階の処理時間・入力待ち・出力待ち（キューが満杯で待った時間）と
+キューの最大長を print_stats() で表示する。
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import deque
+
+from report_extractor import extract_all
+from workbook_pool import excel_path_for
+
+# 段階間のキューの上限（メール数）。取得が先行しすぎて本文がメモリにたまらないようにする
+DEFAULT_QUEUE_SIZE = 64
+
+# キューの終端
+_DONE = object()
+
+
+class StageStats:
+    """1段階の計測値。"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.elapsed = 0.0
+        # 入力キューが空で待った時間 / 出力キューが満杯で待った時間
+        self.wait_in = 0.0
+        self.wait_out = 0.0
+        # この段階の出力キューの最大長
+        self.max_depth = 0
+
+    @property
+    def busy(self) -> float:
+        """待ち時間を除いた処理時間。"""
+        return max(0.0, self.elapsed - self.wait_in - self.wait_out)
+
+
+class _Aborted(Exception):
+    """ほかの段階が例外で止まったため、この段階も止める。"""
+
+
+class ImportPipeline:
+    """fetch → parse → load / write の4段階のパイプライン。"""
+
+    def __init__(self, jobs: int = 1, pool=None, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 needs_workbook=None):
+        self.jobs = jobs
+        # None なら load 段階は何もしない（ブックは route() で読み込む）
+        self.pool = pool
+        # needs_workbook(mail, kind, summary, date) が False の項目は書き込まないため先読みの対象にしない
+        # （--reprocess で書き込み済みの項目など。None ならすべての項目が対象）
+        self.needs_workbook = needs_workbook
+        self.queue_size = max(1, queue_size)
+        self.stats = {name: StageStats(name) for name in ("fetch", "parse", "load", "write")}
+        self.elapsed = 0.0
+        # ブックの読み込みで起きた例外（route() で同じブックを開いたときに改めて送出される）
+        self.load_error: BaseException | None = None
+        self._abort = threading.Event()
+        self._errors: list[BaseException] = []
+
+    def run(self, targets, handle) -> None:
+        """
+        targets（MailRecord のリスト）の本文を取得・抽出し、受信の古い順に
+        handle(mail, reports, warnings) を write 段階のスレッドで呼ぶ。
+
+        warnings は抽出時の警告の出力（--jobs 1 ならその場で表示済みで空）。
+        いずれかの段階で例外が起きたら全段階を止め、その例外を送出する。
+        """
+        started = time.perf_counter()
+        bodies = queue.Queue(self.queue_size)
+        results = queue.Queue(self.queue_size)
+        paths = queue.Queue()
+
+        threads = [
+            threading.Thread(target=self._stage, args=("parse", self._parse, bodies, results, paths),
+                             name="pipeline-parse", daemon=True),
+            threading.Thread(target=self._stage, args=("load", self._load, paths),
+                             name="pipeline-load", daemon=True),
+            threading.Thread(target=self._stage, args=("write", self._write, results, handle),
+                             name="pipeline-write", daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        # 本文の取得は呼び出し元のスレッドで行う
+        self._stage("fetch", self._fetch, targets, bodies)
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - started
+
+        if self._errors:
+            raise self._errors[0]
+
+    # ===== 段階 =====
+
+    def _stage(self, name: str, func, *args) -> None:
+        stats = self.stats[name]
+        started = time.perf_counter()
+        try:
+            func(stats, *args)
+        except _Aborted:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._abort.set()
+        finally:
+            stats.elapsed = time.perf_counter() - started
+
+    def _fetch(self, stats: StageStats, targets, bodies: queue.Queue) -> None:
+        try:
+            for mail in targets:
+                self._put(bodies, (mail, mail.body), stats)
+                stats.items += 1
+        finally:
+            self._put_done(bodies)
+
+    def _parse(self, stats: StageStats, bodies: queue.Queue, results: queue.Queue,
+               paths: queue.Queue) -> None:
+        # 抽出中のメール（extract_all は結果を入力と同じ順で返す）
+        mails = deque()
+
+        def items():
+            for mail, body in self._drain(bodies, stats):
+                mails.append(mail)
+                yield body, mail.received_date
+
+        # 読み込みを依頼したブック（プールの上限を超えて先読みすると追い出しが起きるため上限まで）
+        requested = set()
+        limit = self.pool.max_open if self.pool is not None else 0
+        try:
+            for reports, warnings in extract_all(items(), jobs=self.jobs):
+                mail = mails.popleft()
+                for kind, summary, report_date in reports:
+                    target_date = report_date or mail.received_date
+                    if self.needs_workbook is not None and not self.needs_workbook(
+                            mail, kind, summary, target_date):
+                        continue
+                    path = excel_path_for(target_date)
+                    if path not in requested and len(requested) < limit:
+                        requested.add(path)
+                        paths.put(path)
+                self._put(results, (mail, reports, warnings), stats)
+                stats.items += 1
+        finally:
+            paths.put(_DONE)
+            self._put_done(results)
+
+    def _load(self, stats: StageStats, paths: queue.Queue) -> None:
+        for path in self._drain(paths, stats):
+            if self.load_error is not None:
+                continue
+            try:
+                book = self.pool.open(path)
+            except Exception as e:
+                # PermissionError などはここでは握りつぶし、route() で開き直したときに送出させる
+                self.load_error = e
+                continue
+            if book is not None:
+                stats.items += 1
+
+    def _write(self, stats: StageStats, results: queue.Queue, handle) -> None:
+        for mail, reports, warnings in self._drain(results, stats):
+            handle(mail, reports, warnings)
+            stats.items += 1
+
+    # ===== キュー操作 =====
+
+    def _put(self, q: queue.Queue, item, stats: StageStats) -> None:
+        """q に item を入れる（満杯なら待つ。ほかの段階が止まったら _Aborted）。"""
+        waited = time.perf_counter()
+        while True:
+            if self._abort.is_set():
+                raise _Aborted
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.wait_out += time.perf_counter() - waited
+        stats.max_depth = max(stats.max_depth, q.qsize())
+
+    def _put_done(self, q: queue.Queue) -> None:
+        # 後続の段階が止まっていてキューが満杯のままでも待ち続けないようにする
+        while not self._abort.is_set():
+            try:
+                q.put(_DONE, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _drain(self, q: queue.Queue, stats: StageStats):
+        """q の要素を終端まで返す（空なら待つ。ほかの段階が止まったら _Aborted）。"""
+        while True:
+            waited = time.perf_counter()
+            while True:
+                if self._abort.is_set():
+                    raise _Aborted
+                try:
+                    item = q.get(timeout=0.1)
+                    break
+                except queue.Empty:
+                    continue
+            stats.wait_in += time.perf_counter() - waited
+            if item is _DONE:
+                return
+            yield item
+
+    # ===== 表示 =====
+
+    def print_stats(self) -> None:
+        """段階ごとの件数・処理時間・待ち時間・キューの最大長を表示する。"""
+        print("パイプライン:")
+        print("  段階    件数   処理(秒)  入力待ち(秒)  出力待ち(秒)  キュー最大")
+        for stats in self.stats.values():
+            print(f"  {stats.name:<6}{stats.items:>6} {stats.busy:>10.2f} {stats.wait_in:>13.2f} "
+                  f"{stats.wait_out:>13.2f} {stats.max_depth:>11}")
+        total = sum(stats.busy for stats in self.stats.values())
+        print(f"  全体 {self.elapsed:.2f}秒（各段階の処理時間の合計 {total:.2f}秒）")
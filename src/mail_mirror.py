@@ -0,0 +1,273 @@
+"""
+ローカルのメールミラー
+
+取得したメール本文をローカルに圧縮保存し、EntryID と受信日時で引けるようにする。
+一度取り込んだ期間の再取り込み・タグ文法を変えたときの再抽出・デバッグは
+ミラーから読めるため、Outlook を起動する必要も COM 呼び出しもない
+（Outlook 側でアーカイブ・削除済みのメールも扱える）。
+
+  <MAIL_MIRROR_DIR>/
+    index.jsonl              EntryID・受信日時・件名・本文ハッシュ（1行1メール、追記型）
+    objects/ab/cdef....gz    本文（UTF-8 を gzip 圧縮、SHA-256 をファイル名にした内容アドレス）
+
+同じ本文は1つのファイルを共有し、書き込みは一時ファイル経由で置き換えるため
+途中で中断しても壊れたオブジェクトは残らない。
+
+使い方:
+  - 取り込みスクリプトは既定で、本文を取得したメールをミラーへ保存する（MAIL_MIRROR=0 で無効）
+  - --source mirror でミラーからメールを読む
+  - 既存メールをまとめて保存する場合:
+      python src/mail_mirror.py --backfill --since 2025-04-01 --until 2026-03-31
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import datetime as dt
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from mail_source import MailRecord, MailSource, open_mail_source, received_window
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_MIRROR_NAME = "mail_mirror"
+
+# gzip の圧縮レベル（本文は小さく、レベルを上げても圧縮後のサイズはほとんど変わらないため最速の 1）
+COMPRESS_LEVEL = 1
+
+
+def resolve_mirror_dir(value: str | None = None) -> Path:
+    """
+    ミラーの絶対パスを返す。
+
+    value（未指定なら環境変数 MAIL_MIRROR_DIR）が相対パスならリポジトリ直下を基準にする。
+    """
+    value = value or os.getenv("MAIL_MIRROR_DIR", "")
+    path = Path(value) if value else REPO_ROOT / DEFAULT_MIRROR_NAME
+    if not path.is_absolute():
+        path = REPO_ROOT / path
+    return path
+
+
+def mirror_enabled() -> bool:
+    """取り込み時にミラーへ保存するか（環境変数 MAIL_MIRROR、既定は有効）。"""
+    return os.getenv("MAIL_MIRROR", "1").strip().lower() not in ("0", "off", "false", "no")
+
+
+def _parse_received(value: str | None) -> dt.datetime | None:
+    return dt.datetime.fromisoformat(value) if value else None
+
+
+class MailMirror:
+    """本文の圧縮ストアと EntryID / 受信日時のインデックス。"""
+
+    def __init__(self, root: Path | None = None):
+        self.root = root or resolve_mirror_dir()
+        self.index_path = self.root / "index.jsonl"
+        self.objects = self.root / "objects"
+        self.entries: dict[str, dict] = {}
+        self._pending: list[dict] = []
+        # (受信日時, EntryID) 順の一覧（records() の初回呼び出し時に作成）
+        self._by_received: list[tuple[dt.datetime, str]] | None = None
+        self._load()
+
+    def _load(self) -> None:
+        if not self.index_path.exists():
+            return
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("id") and record.get("sha"):
+                    self.entries[record["id"]] = record
+
+    def __contains__(self, entry_id: str) -> bool:
+        return entry_id in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _object_path(self, sha: str) -> Path:
+        return self.objects / sha[:2] / f"{sha[2:]}.gz"
+
+    # ----- 書き込み -----
+    def put(self, entry_id: str, received, subject: str, body: str) -> str:
+        """本文を保存してインデックスに登録し、本文の SHA-256 を返す。"""
+        data = (body or "").encode("utf-8")
+        sha = hashlib.sha256(data).hexdigest()
+        path = self._object_path(sha)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(gzip.compress(data, COMPRESS_LEVEL))
+            os.replace(tmp, path)
+
+        if isinstance(received, dt.datetime):
+            received = received.replace(tzinfo=None).isoformat(timespec="seconds")
+        record = {"id": entry_id, "received": received, "subject": subject,
+                  "sha": sha, "size": len(data)}
+        if self.entries.get(entry_id) != record:
+            self.entries[entry_id] = record
+            self._pending.append(record)
+            self._by_received = None
+        return sha
+
+    def commit(self) -> int:
+        """今回追加したインデックスを追記し、追記件数を返す。"""
+        if not self._pending:
+            return 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self._pending)
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        count = len(self._pending)
+        self._pending = []
+        return count
+
+    # ----- 読み込み -----
+    def body(self, entry_id: str) -> str:
+        sha = self.entries[entry_id]["sha"]
+        return gzip.decompress(self._object_path(sha).read_bytes()).decode("utf-8")
+
+    def records(self, since: dt.date | None = None, until: dt.date | None = None,
+                descending: bool = True):
+        """期間内のメールを受信日時順に MailRecord で返す（本文は参照時に展開）。"""
+        if self._by_received is None:
+            self._by_received = sorted(
+                (_parse_received(r["received"]), entry_id)
+                for entry_id, r in self.entries.items() if r.get("received")
+            )
+        start, end = received_window(since, until)
+        keys = self._by_received
+        lo = bisect.bisect_left(keys, (start, "")) if start else 0
+        hi = bisect.bisect_left(keys, (end, "")) if end else len(keys)
+        selected = keys[lo:hi]
+        if descending:
+            selected = reversed(selected)
+        for received, entry_id in selected:
+            yield MailRecord(entry_id, received, self.entries[entry_id].get("subject") or "(件名なし)",
+                             loader=lambda entry_id=entry_id: self.body(entry_id))
+
+
+class MirrorMailSource(MailSource):
+    """ミラーを読むメールソース（--source mirror / mirror:<ディレクトリ>）。"""
+
+    def __init__(self, root: Path | None = None):
+        self.mirror = MailMirror(root)
+
+    def describe(self) -> dict:
+        if not self.mirror.index_path.exists():
+            raise RuntimeError(f"メールミラーが見つかりません: {self.mirror.root}")
+        return {"store": "(mirror)", "folder_path": str(self.mirror.root),
+                "count": len(self.mirror)}
+
+    def records(self, since: dt.date | None = None, until: dt.date | None = None,
+                descending: bool = True):
+        return self.mirror.records(since, until, descending)
+
+
+class MirroringSource(MailSource):
+    """
+    別のソースを包み、本文をミラー経由で取得するソース。
+
+    ミラーにある本文はミラーから読み（COM 呼び出しなし）、ない本文は元のソースから
+    取得してミラーへ保存する。commit() でインデックスを書き出す。
+    """
+
+    def __init__(self, inner: MailSource, mirror: MailMirror):
+        self.inner = inner
+        self.mirror = mirror
+        self.hits = 0
+        self.stored = 0
+
+    @property
+    def com_calls(self) -> int:
+        return self.inner.com_calls
+
+    @property
+    def prefiltered(self) -> int:
+        return self.inner.prefiltered
+
+    def describe(self) -> dict:
+        return self.inner.describe()
+
+    def records(self, since: dt.date | None = None, until: dt.date | None = None,
+                descending: bool = True):
+        for record in self.inner.records(since, until, descending):
+            if record.entry_id in self.mirror:
+                loader = lambda entry_id=record.entry_id: self._from_mirror(entry_id)
+            else:
+                loader = lambda record=record: self._fetch(record)
+            yield MailRecord(record.entry_id, record.received, record.subject, loader=loader)
+
+    def _from_mirror(self, entry_id: str) -> str:
+        self.hits += 1
+        return self.mirror.body(entry_id)
+
+    def _fetch(self, record: MailRecord) -> str:
+        body = record.body
+        self.mirror.put(record.entry_id, record.received, record.subject, body)
+        self.stored += 1
+        return body
+
+    def commit(self) -> None:
+        self.mirror.commit()
+
+
+def mirrored(source: MailSource) -> MailSource:
+    """MAIL_MIRROR が有効なら source をミラー経由にする（ミラー自体を読む場合はそのまま）。"""
+    if not mirror_enabled() or isinstance(source, MirrorMailSource):
+        return source
+    return MirroringSource(source, MailMirror())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ローカルのメールミラーを管理します")
+    parser.add_argument("--mirror-dir", help="ミラーの場所（省略時は MAIL_MIRROR_DIR または既定の場所）")
+    parser.add_argument("--backfill", action="store_true",
+                        help="メールソースから期間内の全メール本文を取得してミラーへ保存します")
+    parser.add_argument("--source", help="--backfill の取得元（省略時は MAIL_SOURCE、未設定なら outlook）")
+    parser.add_argument("--since", type=dt.date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument("--until", type=dt.date.fromisoformat, help="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    mirror = MailMirror(resolve_mirror_dir(args.mirror_dir))
+
+    if args.backfill:
+        source = open_mail_source(args.source or os.getenv("MAIL_SOURCE", "outlook"),
+                                  os.getenv("OUTLOOK_FOLDER", "Teams日報"),
+                                  os.getenv("MAIL_BODY_FORMAT", "text").strip().lower(),
+                                  os.getenv("OUTLOOK_PREFILTER", "off").strip().lower() or "off")
+        added = 0
+        for record in source.records(args.since, args.until, descending=False):
+            if record.entry_id in mirror:
+                continue
+            mirror.put(record.entry_id, record.received, record.subject, record.body)
+            added += 1
+        mirror.commit()
+        print(f"保存: {added}件 (COM 呼び出し: {source.com_calls}回)")
+        if source.prefiltered:
+            print(f"本文の取得を省略: {source.prefiltered}件（#日報 を含まないメール、OUTLOOK_PREFILTER）")
+
+    stored = sum(p.stat().st_size for p in mirror.objects.rglob("*.gz")) if mirror.objects.exists() else 0
+    raw = sum(r.get("size", 0) for r in mirror.entries.values())
+    print(f"ミラー    : {mirror.root}")
+    print(f"メール件数: {len(mirror)}")
+    print(f"本文サイズ: {raw:,} bytes → 圧縮後 {stored:,} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,612 @@
+"""
+メール取得レイヤー
+
+Teams 日報メールの取得元（メールソース）をまとめる。どのソースも
+records() で MailRecord（EntryID, 受信日時, 件名, 本文）を受信日時順に1件ずつ返す。
+
+  - OutlookMailSource   : Outlook（COM）のフォルダー
+  - EmlDirectorySource  : .eml ファイルを置いたディレクトリ
+  - MboxSource          : mbox ファイル
+  - MaildirSource       : Maildir ディレクトリ
+  - MirrorMailSource    : 取得済みメールのローカルミラー（mail_mirror.py）
+
+body_format="html" を指定すると本文は HTML（Outlook の HTMLBody、ファイル系は text/html のパート）で返す
+（report_extractor.extract_mail が Teams の通知メールをメッセージごとに分けて抽出する）。
+
+ファイル系のソースはヘッダーだけを読んで並べ替え、本文は MailRecord.body の
+参照時にファイルから読むため、大きなアーカイブでもメモリ使用量は本文1通分に収まる。
+win32com は Outlook を使うときだけ読み込むため、このモジュール自体は
+Outlook のない環境（Linux のビルドマシンなど）でも import できる。
+同じく email / mailbox はファイル系のソースを使うときだけ読み込む（起動時間の短縮）。
+
+OutlookMailSource は EntryID / ReceivedTime / Subject を Folder.GetTable
+（使えない場合は Items.SetColumns）でまとめて取得し、本文（Body）は
+MailRecord.body を参照したときに EntryID 指定で1件ずつ取得する。
+処理済み・期間外のメールでは本文の取得（MailItem の生成）が発生しない。
+
+prefilter（環境変数 OUTLOOK_PREFILTER）を指定すると、本文に #日報 を含むメールだけを Outlook 側で絞り込む。
+フォルダーに日報以外の Teams 通知も届く場合、日報でないメールは本文もヘッダーも COM 越しに取得しない。
+
+  - dasl         : 期間で絞り込んだ Table をさらに DASL（本文の LIKE '%#日報%'）で Restrict する
+  - searchfolder : 同じ条件の検索フォルダー（「<フォルダー名> #日報」）を作成して使い回す
+                   （初回は作成だけ行い、その実行は dasl で絞り込む）
+
+絞り込みで除いた件数（本文の取得を省いた件数）は prefiltered に数える。日報の項目がないメールは処理済みIDに
+記録されないため、期間内で除いたメールはすべて、絞り込みがなければ本文を取得していたメールである。
+検索フォルダーへの新着の反映は Outlook の検索に任せるため、反映が遅れたメールは差分取得の重複確認
+（WATERMARK_OVERLAP_HOURS）の範囲で次回以降に取り込まれる。絞り込みに失敗した場合は警告を表示して全件を確認する。
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import os
+from html.parser import HTMLParser
+from pathlib import Path
+
+# Restrict のフィルタに使う日時書式（日本語ロケールの短い日付形式）
+RESTRICT_DATE_FORMAT = "%Y/%m/%d %H:%M"
+
+# 一括取得する列（Table / SetColumns 共通）
+HEADER_COLUMNS = ("EntryID", "ReceivedTime", "Subject")
+
+# Table.GetArray で1回に取得する行数
+TABLE_CHUNK_ROWS = 500
+
+# 本文の形式（text: テキスト / html: HTML）
+BODY_FORMATS = ("text", "html")
+
+# Outlook 側での本文の絞り込み（off: なし / dasl: DASL の Restrict / searchfolder: 検索フォルダー）
+PREFILTER_MODES = ("off", "dasl", "searchfolder")
+
+# DASL のテキスト本文のプロパティ
+DASL_BODY = "urn:schemas:httpmail:textdescription"
+
+OL_FOLDER_INBOX = 6
+OL_USER_ITEMS = 0
+
+
+def _outlook_namespace():
+    import win32com.client
+
+    outlook = win32com.client.Dispatch("Outlook.Application")
+    return outlook.GetNamespace("MAPI")
+
+
+def get_outlook_folder(folder_name: str, namespace=None):
+    """受信トレイ直下の folder_name フォルダーを返す。見つからなければ RuntimeError。"""
+    if namespace is None:
+        namespace = _outlook_namespace()
+    inbox = namespace.GetDefaultFolder(OL_FOLDER_INBOX)
+
+    for f in inbox.Folders:
+        if f.Name == folder_name:
+            return f
+    raise RuntimeError(f"Outlook フォルダーが見つかりません: {folder_name}")
+
+
+def received_window(since: dt.date | None = None, until: dt.date | None = None):
+    """
+    since / until を受信日時の範囲 [start, end) に変換する。
+
+    date で指定した until は当日を含む（翌日 0:00 未満）。
+    datetime で指定した場合はその時刻をそのまま境界にする（差分取得の基準時刻用）。
+    """
+    start = end = None
+    if since:
+        start = since if isinstance(since, dt.datetime) else dt.datetime.combine(since, dt.time())
+    if until:
+        end = (until if isinstance(until, dt.datetime)
+               else dt.datetime.combine(until + dt.timedelta(days=1), dt.time()))
+    return start, end
+
+
+def received_filter(since: dt.date | None = None, until: dt.date | None = None) -> str:
+    """
+    ReceivedTime の期間を Items.Restrict 用の Jet フィルタ文字列にする。
+
+    範囲は received_window() と同じ。どちらも None なら空文字を返す。
+    """
+    start, end = received_window(since, until)
+    clauses = []
+    if start:
+        clauses.append(f"[ReceivedTime] >= '{start.strftime(RESTRICT_DATE_FORMAT)}'")
+    if end:
+        clauses.append(f"[ReceivedTime] < '{end.strftime(RESTRICT_DATE_FORMAT)}'")
+    return " AND ".join(clauses)
+
+
+def received_items(folder, since: dt.date | None = None, until: dt.date | None = None,
+                   descending: bool = True):
+    """
+    folder の Items を受信日時で絞り込み・並べ替えて返す。
+
+    期間の絞り込みは Outlook 側（Items.Restrict）で行うため、期間外のメールは
+    Python 側に1件も渡らない。Restrict に失敗した場合は全件の Items を返すので、
+    呼び出し側でも受信日の範囲チェックは残しておくこと。
+    """
+    items = folder.Items
+    query = received_filter(since, until)
+    if query:
+        try:
+            items = items.Restrict(query)
+        except Exception as e:
+            print(f"警告: Outlook 側の期間フィルタに失敗しました（全件を走査します）: {e}")
+    # Items は並びが不定で取りこぼしが出ることがあるため、Sortして安定化してから走査する
+    try:
+        items.Sort("[ReceivedTime]", descending)
+    except Exception:
+        pass
+    return items
+
+
+def tag_filter() -> str:
+    """本文に #日報 を含むメールの DASL 条件（"@SQL=" は付けない。AdvancedSearch にもそのまま渡す）。"""
+    from report_extractor import TAG
+
+    return f"\"{DASL_BODY}\" LIKE '%{TAG}%'"
+
+
+class MailRecord:
+    """
+    1通のメール（EntryID, 受信日時, 件名, 本文）。
+
+    本文は body を初めて参照したときに loader で取得する。
+    """
+
+    __slots__ = ("entry_id", "received", "subject", "_body", "_loader")
+
+    def __init__(self, entry_id: str, received, subject: str,
+                 body: str | None = None, loader=None):
+        self.entry_id = entry_id
+        self.received = received
+        self.subject = subject
+        self._body = body
+        self._loader = loader
+
+    @property
+    def received_date(self) -> dt.date | None:
+        if isinstance(self.received, dt.datetime):
+            return self.received.date()
+        return None
+
+    @property
+    def received_local(self) -> dt.datetime | None:
+        """
+        タイムゾーン情報を外した受信日時（Outlook の表示と同じローカル時刻）。
+
+        pywin32 の ReceivedTime は tzinfo 付きで返るため、naive な datetime
+        （Restrict の条件や状態ファイルの基準時刻）と比較するときはこちらを使う。
+        """
+        if isinstance(self.received, dt.datetime):
+            return self.received.replace(tzinfo=None)
+        return None
+
+    @property
+    def body(self) -> str:
+        if self._body is None:
+            self._body = (self._loader() if self._loader else "") or ""
+            self._loader = None
+        return self._body
+
+
+class MailSource:
+    """メールソースの共通インターフェース。"""
+
+    # 本文の絞り込み（prefilter）で除いた件数
+    prefiltered = 0
+
+    # Outlook 以外は COM を使わないので常に 0
+    com_calls = 0
+
+    def records(self, since: dt.date | None = None, until: dt.date | None = None,
+                descending: bool = True):
+        """期間内のメールを受信日時順に MailRecord で返す（ジェネレーター）。"""
+        raise NotImplementedError
+
+    def describe(self) -> dict:
+        """診断用に Store 名・フォルダーパス・総件数を返す。"""
+        raise NotImplementedError
+
+    def commit(self) -> None:
+        """取得後の後処理（ミラーへの保存など）。既定では何もしない。"""
+
+
+class OutlookMailSource(MailSource):
+    """
+    Outlook フォルダーからメールを取得するソース。
+
+    com_calls に COM 呼び出し回数（プロパティ参照・メソッド呼び出し）を数える。
+    """
+
+    def __init__(self, folder_name: str, namespace=None, body_format: str = "text", prefilter: str = "off"):
+        self.folder_name = folder_name
+        self.body_format = body_format
+        self.prefilter = prefilter
+        self.com_calls = 0
+        self.prefiltered = 0
+        self._namespace = namespace
+        self._folder = None
+        self._store_id = None
+
+    # ----- COM 呼び出し（回数を数える） -----
+    def _get(self, obj, name: str):
+        self.com_calls += 1
+        return getattr(obj, name)
+
+    def _call(self, obj, name: str, *args):
+        self.com_calls += 1
+        return getattr(obj, name)(*args)
+
+    @property
+    def folder(self):
+        if self._folder is None:
+            if self._namespace is None:
+                self._namespace = _outlook_namespace()
+            self._folder = get_outlook_folder(self.folder_name, self._namespace)
+        return self._folder
+
+    def describe(self) -> dict:
+        folder = self.folder  # フォルダーが見つからなければここで RuntimeError
+        info = {}
+        for key, getter in (
+            ("store", lambda: self._get(self._get(folder, "Store"), "DisplayName")),
+            ("folder_path", lambda: self._get(folder, "FolderPath")),
+            ("count", lambda: self._get(self._get(folder, "Items"), "Count")),
+        ):
+            try:
+                info[key] = getter()
+            except Exception:
+                info[key] = "(unknown)"
+        return info
+
+    def records(self, since: dt.date | None = None, until: dt.date | None = None,
+                descending: bool = True):
+        """
+        ヘッダー（EntryID / ReceivedTime / Subject）は Table でまとめて取得し、
+        本文は MailRecord.body の参照時に取得する。
+        """
+        # Table が使えない環境や、GetArray が途中で失敗した場合は Items.SetColumns で列を絞って走査する
+        # （途中で失敗した場合は、Table で返したメールを除いて続きを返す）
+        seen: set[str] = set()
+        prefiltered = self.prefiltered
+        try:
+            for entry_id, received, subject in self._table_rows(since, until, descending):
+                seen.add(entry_id)
+                yield self._record(entry_id, received, subject)
+            return
+        except Exception as e:
+            if seen:
+                print(f"警告: Table でのメールの列挙が途中で失敗しました（続きは Items で取得します）: {e}")
+        # Items 側でも絞り込むため、Table 側で数えた件数は数え直す
+        self.prefiltered = prefiltered
+        for entry_id, received, subject in self._items_rows(since, until, descending):
+            if entry_id not in seen:
+                yield self._record(entry_id, received, subject)
+
+    def _record(self, entry_id, received, subject) -> MailRecord:
+        return MailRecord(entry_id, received, subject or "(件名なし)",
+                          loader=lambda: self.body(entry_id))
+
+    def _table_rows(self, since, until, descending):
+        table = self._call(self.folder, "GetTable", received_filter(since, until), OL_USER_ITEMS)
+        if self.prefilter != "off":
+            table = self._prefilter_table(table, since, until)
+        columns = self._get(table, "Columns")
+        self._call(columns, "RemoveAll")
+        for name in HEADER_COLUMNS:
+            self._call(columns, "Add", name)
+        self._call(table, "Sort", "[ReceivedTime]", descending)
+        return self._iter_table(table)
+
+    def _iter_table(self, table):
+        while not self._get(table, "EndOfTable"):
+            chunk = self._call(table, "GetArray", TABLE_CHUNK_ROWS)
+            if not chunk:
+                break
+            for row in chunk:
+                yield row[0], row[1], row[2]
+
+    def _prefilter_table(self, table, since, until):
+        """
+        期間で絞り込んだ table を、本文に #日報 を含むメールの Table にして返し、除いた件数を prefiltered に加える。
+
+        絞り込めなければ警告を表示して table をそのまま返す。
+        """
+        try:
+            total = self._call(table, "GetRowCount")
+            tagged = None
+            if self.prefilter == "searchfolder":
+                tagged = self._search_folder_table(since, until)
+            if tagged is None:
+                tagged = self._call(table, "Restrict", "@SQL=" + tag_filter())
+            self.prefiltered += max(0, total - self._call(tagged, "GetRowCount"))
+            return tagged
+        except Exception as e:
+            print(f"警告: Outlook 側の本文の絞り込み（{self.prefilter}）に失敗しました（全件の本文を確認します）: {e}")
+            return table
+
+    def _search_folder_table(self, since, until):
+        """
+        検索フォルダー「<フォルダー名> #日報」の期間内の Table。検索フォルダーがなければ作成して None を返す
+        （Outlook が検索を終えるまで結果がそろわないため、初回は呼び出し側が DASL で絞り込む）。
+        """
+        from report_extractor import TAG
+
+        name = f"{self.folder_name} {TAG}"
+        store = self._get(self.folder, "Store")
+        for folder in self._call(store, "GetSearchFolders"):
+            self.com_calls += 1  # 列挙
+            if self._get(folder, "Name") == name:
+                return self._call(folder, "GetTable", received_filter(since, until), OL_USER_ITEMS)
+        scope = f"'{self._get(self.folder, 'FolderPath')}'"
+        application = self._get(self._namespace, "Application")
+        search = self._call(application, "AdvancedSearch", scope, tag_filter(), False, name)
+        self._call(search, "Save", name)
+        print(f"検索フォルダーを作成しました: {name}（次回の実行から使います）")
+        return None
+
+    def _items_rows(self, since, until, descending):
+        items = received_items(self.folder, since, until, descending)
+        self.com_calls += 3  # Items / Restrict / Sort
+        if self.prefilter != "off":
+            try:
+                total = self._get(items, "Count")
+                tagged = self._call(items, "Restrict", "@SQL=" + tag_filter())
+                self.prefiltered += max(0, total - self._get(tagged, "Count"))
+                items = tagged
+            except Exception as e:
+                print(f"警告: Outlook 側の本文の絞り込みに失敗しました（全件の本文を確認します）: {e}")
+        try:
+            self._call(items, "SetColumns", ",".join(HEADER_COLUMNS))
+        except Exception:
+            pass
+        for mail in items:
+            self.com_calls += 1  # 列挙
+            yield (self._get(mail, "EntryID"), self._get(mail, "ReceivedTime"),
+                   self._get(mail, "Subject"))
+
+    def body(self, entry_id: str) -> str:
+        """EntryID を指定してメール本文を取得する（html なら HTMLBody、空ならテキストの Body）。"""
+        if self._store_id is None:
+            self._store_id = self._get(self.folder, "StoreID")
+        mail = self._call(self._namespace, "GetItemFromID", entry_id, self._store_id)
+        if self.body_format == "html":
+            html = self._get(mail, "HTMLBody")
+            if html:
+                return html
+        return self._get(mail, "Body") or ""
+
+
+# ===== ファイル系ソース =====
+class _TextExtractor(HTMLParser):
+    """HTML 本文からテキストだけを取り出す（Outlook の Body 相当）。"""
+
+    _BLOCK_TAGS = {"br", "p", "div", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._skip += 1
+        elif tag in self._BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self._skip:
+            self._skip -= 1
+        elif tag in self._BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return "".join(parser.parts)
+
+
+def _read_header_bytes(fp) -> bytes:
+    """メッセージ先頭から空行までのヘッダー部分だけを読む。"""
+    lines = []
+    for line in fp:
+        if line in (b"\n", b"\r\n"):
+            break
+        lines.append(line)
+    return b"".join(lines)
+
+
+def _received_datetime(headers) -> dt.datetime | None:
+    """
+    受信日時をローカル時刻（tzinfo なし）で返す。
+
+    最初の Received ヘッダーの日時（受信サーバーの記録）を優先し、なければ Date を使う。
+    """
+    import email.utils
+
+    candidates = []
+    received = headers.get("Received")
+    if received and ";" in received:
+        candidates.append(received.rsplit(";", 1)[1])
+    if headers.get("Date"):
+        candidates.append(headers.get("Date"))
+    for value in candidates:
+        try:
+            parsed = email.utils.parsedate_to_datetime(value.strip())
+        except (TypeError, ValueError):
+            continue
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone().replace(tzinfo=None)
+        return parsed
+    return None
+
+
+def _message_body(fp, html: bool = False) -> str:
+    """
+    メッセージ全体を読み、text/plain（なければ HTML をテキスト化）の本文を返す。
+
+    html なら text/html のパートをそのまま返す（なければ text/plain）。
+    """
+    from email import policy
+    from email.parser import BytesParser
+
+    msg = BytesParser(policy=policy.default).parse(fp)
+    part = msg.get_body(preferencelist=("html", "plain") if html else ("plain", "html"))
+    if part is None:
+        return ""
+    try:
+        content = part.get_content()
+    except (LookupError, UnicodeDecodeError):
+        payload = part.get_payload(decode=True) or b""
+        content = payload.decode("utf-8", errors="replace")
+    if part.get_content_subtype() == "html" and not html:
+        return html_to_text(content)
+    return content
+
+
+class _FileMailSource(MailSource):
+    """
+    ファイル系ソースの共通処理。
+
+    サブクラスは _messages() で (既定ID, バイナリファイルを開く関数) を返す。
+    """
+
+    def __init__(self, path, body_format: str = "text"):
+        self.path = Path(path)
+        self.body_format = body_format
+
+    def _messages(self):
+        raise NotImplementedError
+
+    def describe(self) -> dict:
+        return {
+            "store": f"(offline: {type(self).__name__})",
+            "folder_path": str(self.path),
+            "count": sum(1 for _ in self._messages()),
+        }
+
+    def records(self, since: dt.date | None = None, until: dt.date | None = None,
+                descending: bool = True):
+        """
+        ヘッダーだけを読んで期間で絞り込み、受信日時順に返す。
+
+        受信日時を取得できないメールは期間指定がないときだけ末尾に返す
+        （received_date が None になる）。
+        """
+        import email.header
+        from email import policy
+        from email.parser import BytesHeaderParser
+
+        start, end = received_window(since, until)
+        headers = []
+        undated = []
+        for default_id, opener in self._messages():
+            with opener() as fp:
+                parsed = BytesHeaderParser(policy=policy.compat32).parsebytes(_read_header_bytes(fp))
+            entry_id = (parsed.get("Message-ID") or "").strip() or default_id
+            subject = str(email.header.make_header(email.header.decode_header(parsed.get("Subject") or "")))
+            received = _received_datetime(parsed)
+            if received is None:
+                if not since and not until:
+                    undated.append((entry_id, None, subject, opener))
+                continue
+            if (start and received < start) or (end and received >= end):
+                continue
+            headers.append((entry_id, received, subject, opener))
+
+        headers.sort(key=lambda h: (h[1], h[0]), reverse=descending)
+        for entry_id, received, subject, opener in headers + undated:
+            yield MailRecord(entry_id, received, subject or "(件名なし)",
+                             loader=lambda opener=opener: self._load_body(opener))
+
+    def _load_body(self, opener) -> str:
+        with opener() as fp:
+            return _message_body(fp, html=self.body_format == "html")
+
+
+class EmlDirectorySource(_FileMailSource):
+    """ディレクトリ配下（サブディレクトリを含む）の .eml ファイル。"""
+
+    def _messages(self):
+        for root, _dirs, files in os.walk(self.path):
+            for name in sorted(files):
+                if name.lower().endswith(".eml"):
+                    file_path = Path(root) / name
+                    yield file_path.name, lambda file_path=file_path: open(file_path, "rb")
+
+
+class _MailboxSource(_FileMailSource):
+    """mailbox モジュールで読むソース（mbox / Maildir）の共通処理。"""
+
+    def _open_mailbox(self):
+        raise NotImplementedError
+
+    def _messages(self):
+        box = self._open_mailbox()
+        for key in box.iterkeys():
+            yield str(key), lambda key=key: box.get_file(key)
+
+
+class MboxSource(_MailboxSource):
+    """mbox 形式のファイル。"""
+
+    def _open_mailbox(self):
+        if not self.path.is_file():
+            raise RuntimeError(f"mbox ファイルが見つかりません: {self.path}")
+        import mailbox
+
+        return mailbox.mbox(self.path, factory=None, create=False)
+
+
+class MaildirSource(_MailboxSource):
+    """Maildir 形式のディレクトリ（cur / new）。"""
+
+    def _open_mailbox(self):
+        if not self.path.is_dir():
+            raise RuntimeError(f"Maildir が見つかりません: {self.path}")
+        import mailbox
+
+        return mailbox.Maildir(self.path, factory=None, create=False)
+
+
+MAIL_SOURCE_KINDS = {
+    "eml": EmlDirectorySource,
+    "mbox": MboxSource,
+    "maildir": MaildirSource,
+}
+
+
+def open_mail_source(spec: str, outlook_folder: str, body_format: str = "text",
+                     prefilter: str = "off") -> MailSource:
+    """
+    "outlook" / "mirror[:<ディレクトリ>]" / "eml:<ディレクトリ>" / "mbox:<ファイル>" /
+    "maildir:<ディレクトリ>" 形式の指定からメールソースを作る。
+
+    body_format（text / html）は本文の形式。ミラーは保存済みの本文をそのまま返す。
+    prefilter（off / dasl / searchfolder）は Outlook 側での本文の絞り込み（Outlook 以外では使わない）。
+    """
+    if body_format not in BODY_FORMATS:
+        raise ValueError(f"本文の形式の指定が正しくありません: {body_format} (text / html)")
+    if prefilter not in PREFILTER_MODES:
+        raise ValueError(f"本文の絞り込みの指定が正しくありません: {prefilter} (off / dasl / searchfolder)")
+    kind, _, path = (spec or "outlook").partition(":")
+    kind = kind.strip().lower()
+    if kind == "outlook":
+        return OutlookMailSource(outlook_folder, body_format=body_format, prefilter=prefilter)
+    if kind == "mirror":
+        from mail_mirror import MirrorMailSource, resolve_mirror_dir
+
+        return MirrorMailSource(resolve_mirror_dir(path or None))
+    if kind not in MAIL_SOURCE_KINDS or not path:
+        raise ValueError(
+            f"メールソースの指定が正しくありません: {spec} "
+            "(outlook / mirror / eml:<ディレクトリ> / mbox:<ファイル> / maildir:<ディレクトリ>)"
+        )
+    return MAIL_SOURCE_KINDS[kind](path, body_format)
@@ -0,0 +1,341 @@
+"""
+書き込みの出所（プロビナンス）インデックス
+
+取り込みスクリプトと daily_report_writer.py が Excel に書き込んだ項目ごとに
+
+  - 元メールの EntryID（daily_report_writer.py の書き込みは cli:<実行ID>）・実行ID
+  - 書き込み先のブック・シート・セル・計画/結果・報告日
+  - 書き込んだ文字列とそのハッシュ・空きセルへの書き込みか既存セルへの追記か
+
+を記録する（1行1項目の JSON Lines、追記型。既定はリポジトリ直下の write_provenance.jsonl、
+環境変数 PROVENANCE_FILE で変更可）。取り消した項目は {"retract": 書き込みID} の行を追記して無効にする。
+
+これにより
+
+  - teams_chat_from_outlook_rerun.py --reprocess は、同じメールから同じ内容が書き込み済みの項目を
+    シートを読み直さずにハッシュで見つけて書き込みを省き、今回の抽出結果にない項目（タグを直したメールの古い内容）
+    だけをセルから取り消してから書き込む（重複して追記されない）
+  - python src/provenance.py --undo <実行ID> で、1回の実行の書き込みを各ブック1回の読み込み・保存で取り消せる
+
+取り消しはセルの現在の値から記録した文字列の行だけを除く（空になればセルを空にする）。
+手作業で書き換えられて記録した文字列が見つからないセルは変更しない。
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import hashlib
+import itertools
+import json
+import os
+from collections import Counter
+from pathlib import Path
+
+from state_store import new_run_id
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_PROVENANCE_NAME = "write_provenance.jsonl"
+
+# 書き込みIDの連番（同じ実行IDの ProvenanceIndex が1つのプロセスに複数あっても重複しない）
+_write_seq = itertools.count(1)
+
+
+def resolve_provenance_path(value: str | None = None) -> Path:
+    """
+    プロビナンスファイルの絶対パスを返す。
+
+    value（未指定なら環境変数 PROVENANCE_FILE）が相対パスならリポジトリ直下を基準にする。
+    """
+    value = value or os.getenv("PROVENANCE_FILE", "")
+    path = Path(value) if value else REPO_ROOT / DEFAULT_PROVENANCE_NAME
+    if not path.is_absolute():
+        path = REPO_ROOT / path
+    return path
+
+
+def text_hash(text: str) -> str:
+    """書き込んだ文字列の比較用ハッシュ（前後の空白は無視）。"""
+    return hashlib.sha256(str(text).strip().encode("utf-8")).hexdigest()[:16]
+
+
+def entry_key(entry_id: str, kind: str, date: str, text: str) -> tuple[str, str, str, str]:
+    """同じメールの同じ項目かを判定するキー（date は YYYY-MM-DD）。"""
+    return entry_id, kind, date, text_hash(text)
+
+
+class ProvenanceIndex:
+    """書き込みの出所の追記型インデックス（読み込みは最初に参照したときに1回だけ）。"""
+
+    def __init__(self, path: Path | None = None, run_id: str | None = None):
+        self.path = path or resolve_provenance_path()
+        self.run_id = run_id or new_run_id()
+        self._records: dict[str, dict] | None = None
+        # 有効な記録の entry_key（is_written() で最初に参照したときに作る）
+        self._keys: set[tuple] | None = None
+        self._pending: list[dict] = []
+
+    # ----- 読み込み -----
+    @property
+    def records(self) -> dict[str, dict]:
+        """書き込みID → 有効な（取り消されていない）記録。"""
+        if self._records is None:
+            self._records = {}
+            if self.path.exists():
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            # 書き込み途中で中断された末尾行などは読み飛ばす
+                            continue
+                        self._apply(record)
+        return self._records
+
+    def _apply(self, record: dict) -> None:
+        if "retract" in record:
+            self._records.pop(record["retract"], None)
+        elif record.get("w"):
+            self._records[record["w"]] = record
+
+    # ----- 参照 -----
+    def for_entries(self, entry_ids) -> list[dict]:
+        """entry_ids のメールから書き込んだ有効な記録（書き込み順）。"""
+        entry_ids = set(entry_ids)
+        return [r for r in self.records.values() if r["id"] in entry_ids]
+
+    def for_run(self, run_id: str) -> list[dict]:
+        """run_id の実行で書き込んだ有効な記録（書き込み順）。"""
+        return [r for r in self.records.values() if r["run"] == run_id]
+
+    def runs(self) -> Counter:
+        """実行ID → 有効な記録の件数"""
+        return Counter(r["run"] for r in self.records.values())
+
+    def is_written(self, entry_id: str, kind: str, date: dt.date, text: str) -> bool:
+        """同じメールから同じ項目（計画/結果・報告日・文字列）を書き込んだ有効な記録があるか。"""
+        if self._keys is None:
+            self._keys = {(r["id"], r["kind"], r["date"], r["hash"]) for r in self.records.values()}
+        return entry_key(entry_id, kind, date.isoformat(), text) in self._keys
+
+    # ----- 更新 -----
+    def _append(self, record: dict) -> None:
+        if self._records is not None:
+            self._apply(record)
+        self._keys = None
+        self._pending.append(record)
+
+    def record_plan(self, plan, workbooks=None) -> int:
+        """
+        apply_pool() で書き込んだ WritePlan の編集を項目ごとに記録する（commit() まではファイルに書かない）。
+
+        workbooks を指定すると、そのブック（パスの文字列）への編集だけを記録する（保存できたブックだけなど）。
+        記録した件数を返す。
+        """
+        now = dt.datetime.now().isoformat(timespec="seconds")
+        count = 0
+        for edit in plan.edits:
+            if workbooks is not None and edit.workbook not in workbooks:
+                continue
+            for entry in edit.entries:
+                self._append({
+                    "w": f"{self.run_id}:{next(_write_seq)}",
+                    "run": self.run_id,
+                    "id": entry.entry_id,
+                    "workbook": edit.workbook,
+                    "sheet": edit.sheet,
+                    "cell": edit.coord,
+                    "row": edit.row,
+                    "kind": edit.kind,
+                    "date": entry.date.isoformat(),
+                    "text": entry.summary,
+                    "hash": text_hash(entry.summary),
+                    "append": edit.append,
+                    "at": now,
+                })
+                count += 1
+        return count
+
+    def retract(self, record: dict) -> None:
+        """record を取り消し済みにする（commit() まではファイルに書かない）。"""
+        self._append({"retract": record["w"], "run": self.run_id,
+                      "at": dt.datetime.now().isoformat(timespec="seconds")})
+
+    def commit(self) -> int:
+        """今回追加した行を追記し、件数を返す。"""
+        if not self._pending:
+            return 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self._pending))
+        count = len(self._pending)
+        self._pending = []
+        return count
+
+    # ----- 再処理 -----
+    def reconcile(self, plan, entry_ids, since: str | None = None) -> tuple[list[dict], int]:
+        """
+        再処理する entry_ids のメールについて、書き込み済みの記録と plan の保留中の項目を突き合わせる。
+
+        同じメール・計画/結果・報告日・文字列（ハッシュ）の記録がある項目は plan から除き、
+        今回の抽出結果に対応する項目がない記録は取り消す対象として返す。
+        since（ISO 形式の日時）を指定すると、その時刻以降の記録だけを突き合わせる。
+        return (取り消す記録, 書き込み済みのため除いた項目数)
+        """
+        written: dict[tuple, list[dict]] = {}
+        for record in self.for_entries(entry_ids):
+            if since is not None and record["at"] < since:
+                continue
+            key = (record["id"], record["kind"], record["date"], record["hash"])
+            written.setdefault(key, []).append(record)
+
+        pending, skipped = [], 0
+        for entry in plan.pending:
+            records = written.get(entry_key(entry.entry_id, entry.kind, entry.date.isoformat(), entry.summary))
+            if records:
+                records.pop(0)
+                skipped += 1
+            else:
+                pending.append(entry)
+        plan.pending = pending
+        stale = [record for records in written.values() for record in records]
+        return stale, skipped
+
+
+def retract_cell(index, record: dict) -> bool:
+    """
+    index のシートで record の文字列をセルから取り除く（最後に現れた行を除き、空になればセルを空にする）。
+
+    記録した文字列がセルに見つからなければ（手作業で書き換えられた場合など）何もせず False。
+    """
+    current = index.value(record["kind"], record["row"])
+    if current is None:
+        return False
+    lines = str(current).split("\n")
+    text = record["text"].strip()
+    for i in range(len(lines) - 1, -1, -1):
+        if lines[i].strip() == text:
+            del lines[i]
+            index.set_value(record["kind"], record["row"], "\n".join(lines) or None)
+            return True
+    return False
+
+
+def retract_records(pool, provenance: ProvenanceIndex | None,
+                    records: list[dict]) -> tuple[int, list[dict]]:
+    """
+    records の書き込みを新しい順に取り消す（各ブックはプールで1回だけ開く。保存は呼び出し側）。
+
+    provenance が None なら記録を取り消し済みにしない（保存できてから呼び出し側で行う）。
+    return (取り消した件数, セルに見つからなかった記録)
+    """
+    retracted, missing = 0, []
+    for record in sorted(records, key=lambda r: (r["at"], int(r["w"].rsplit(":", 1)[1])), reverse=True):
+        book = pool.open(Path(record["workbook"]))
+        if book is None or record["sheet"] not in book.wb.sheetnames:
+            missing.append(record)
+            continue
+        if retract_cell(book.sheet_index(record["sheet"]), record):
+            retracted += 1
+            # 保存の直前にブックが外部で変更されていたら、読み込み直したセルから取り消し直す
+            book.on_rebase(lambda b, record=record: retract_cell(b.sheet_index(record["sheet"]), record))
+        else:
+            missing.append(record)
+        # セルに見つからなかった記録も取り消し済みにする（次回以降の再処理で繰り返し対象にしない）
+        if provenance is not None:
+            provenance.retract(record)
+    return retracted, missing
+
+
+def undo(args, report) -> int:
+    """--undo: 1回の実行の書き込みを取り消す。"""
+    from settings import load_settings
+    from workbook_pool import WorkbookPool
+    from write_spool import WorkbookSession, drain_before, lock_timeout
+
+    provenance = ProvenanceIndex(resolve_provenance_path(args.provenance_file), run_id=report.run_id)
+    records = provenance.for_run(args.undo)
+    if not records:
+        print(f"実行ID {args.undo} の書き込み記録がありません（python src/provenance.py --runs で確認）")
+        return 1
+    workbooks = sorted({r["workbook"] for r in records})
+    print(f"取り消し: 実行ID {args.undo} の {len(records)}件 ({len(workbooks)}冊)")
+    for record in records:
+        print(f"  {Path(record['workbook']).name} {record['sheet']}!{record['cell']} "
+              f"{record['date']} {record['kind']}: {record['text']}")
+    print()
+    if args.dry_run:
+        print("--dry-run のため Excel とプロビナンスは更新しません")
+        return 0
+
+    pool = WorkbookPool(*load_settings().columns, max_open=len(workbooks))
+    report.add_pool(pool)
+    # 別のプロセスがブックに書き込み中なら終わるまで待つ（読み込み → 取り消し → 保存をロックの中で行う）
+    session = WorkbookSession(pool, run_id=report.run_id)
+    with report.stage("lock"):
+        if not session.acquire(lock_timeout()):
+            print("エラー: 他のプロセスの書き込みが終わりませんでした。再実行してください")
+            return 1
+    drain = None
+    try:
+        # スプールに残っている取り込みの項目も同じブックの読み込み・保存で書き込む
+        with report.stage("spool"):
+            drain = drain_before(pool, report.run_id)
+        try:
+            with report.stage("retract"):
+                retracted, missing = retract_records(pool, provenance, records)
+            with report.stage("save"):
+                saved = pool.save_all()
+        except PermissionError as e:
+            if drain is not None:
+                drain.finish()
+            pool.close()
+            print(f"エラー: Excelファイルが開かれています。閉じてから再実行してください: {e.filename}")
+            return 1
+        provenance.commit()
+        if drain is not None:
+            drain.finish()
+        session.follow(None, drain)
+    finally:
+        session.release(None, drain)
+    report.counters.update(records=len(records), cells_retracted=retracted, records_missing=len(missing))
+
+    for record in missing:
+        print(f"  ✗ 見つかりません（手作業で変更済み？）: {Path(record['workbook']).name} "
+              f"{record['sheet']}!{record['cell']} {record['text']}")
+    for path in saved:
+        print(f"保存: {path}")
+    print(f"取り消し完了: {retracted}件")
+    print("メールは処理済みのままです。取り込み直す場合は teams_chat_from_outlook_rerun.py --reprocess を使います")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Excel への書き込みの出所（プロビナンス）を管理します")
+    parser.add_argument("--provenance-file", help="プロビナンスファイル（省略時は PROVENANCE_FILE または既定の場所）")
+    parser.add_argument("--runs", action="store_true", help="実行IDごとの有効な書き込み件数を表示します")
+    parser.add_argument("--undo", metavar="RUN_ID", help="この実行IDの書き込みを Excel から取り消します")
+    parser.add_argument("--dry-run", action="store_true", help="--undo で取り消す内容を表示するだけにします")
+    args = parser.parse_args()
+
+    if args.undo:
+        from run_report import run_with_report
+
+        return run_with_report("provenance_undo", undo, args)
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    provenance = ProvenanceIndex(resolve_provenance_path(args.provenance_file))
+    print(f"プロビナンス: {provenance.path} ({len(provenance.records)}件)")
+    if args.runs:
+        for run_id, count in sorted(provenance.runs().items()):
+            print(f"  {run_id}  {count}件")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,237 @@
+"""
+日報タグ抽出エンジン
+
+Teams 共有メール本文から #日報計画 / #日報結果 / #日報 を抽出する。
+teams_chat_from_outlook.py / teams_chat_from_outlook_rerun.py / daily_report_writer.py
+で重複していた extract_daily_reports をここに集約した。
+
+旧実装は本文を正規表現で最大6回走査していたが、ここでは "#日報" の出現位置を
+左から右へ1回だけ走査し、各出現位置でコンパイル済みパターンを match する。
+各パターンごとに「前回マッチの終端」を保持することで re.finditer と同じ
+非重複マッチを再現しているため、抽出結果と並び順は旧実装と完全に一致する。
+
+本文が HTML（MAIL_BODY_FORMAT=html の HTMLBody や .eml の text/html）の場合、extract_mail は
+teams_html.py で通知メールをメッセージごとに分け、メッセージごとに抽出する。日付なしのタグには
+メッセージの投稿日を使う（複数のメッセージをまとめた通知でも最後のメッセージ以外を失わない）。
+
+extract_all は大量のメール（年度分の再取り込みなど）をプロセスプールで並列に抽出し、
+結果を入力と同じ順で返す（Excel の空き行の割り当ては直列実行と同じになる）。
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import re
+
+TAG = "#日報"
+TEAMS_MARKER = "Microsoft Teams"
+SUMMARY_MAX_LEN = 50
+
+# 日付付きパターン
+_DATED_PLAN = re.compile(r"#日報計画\s+(\d{1,2})/(\d{1,2})\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)")
+_DATED_RESULT = re.compile(r"#日報結果\s+(\d{1,2})/(\d{1,2})\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)")
+_DATED_PLAIN = re.compile(r"#日報\s+(\d{1,2})/(\d{1,2})\s+(.+?)(?:\n|$)")
+
+# 日付なしパターン（後方互換性のため）
+_UNDATED_PLAN = re.compile(r"#日報計画\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)")
+_UNDATED_RESULT = re.compile(r"#日報結果\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)")
+_UNDATED_PLAIN = re.compile(r"#日報\s+(.+?)(?:\n|$)")
+
+_DATE_PREFIX = re.compile(r"\d{1,2}/\d{1,2}")
+
+# extract_all で1回にワーカーへ渡すメール数
+EXTRACT_CHUNK_SIZE = 64
+
+# 出力順を旧実装（計画 → 結果 → 単独 #日報）に揃えるためのバケット番号
+_PLAN, _RESULT, _PLAIN = 0, 1, 2
+
+
+def message_part(text: str) -> str:
+    """
+    Teamsメールの実際のメッセージ部分を返す。
+
+    メール本文にはプレビュー部分と実際のメッセージ部分が含まれ、
+    最後の "Microsoft Teams" 以降が実際のチャットメッセージになる。
+    """
+    idx = text.rfind(TEAMS_MARKER)
+    if idx < 0:
+        return text
+    return text[idx + len(TEAMS_MARKER):]
+
+
+def resolve_year(month: int, mail_received_date: dt.date | None) -> int:
+    """
+    MM/DD 形式の月から年を決定する。
+
+    メール受信日がある場合はその年を基準にし、12月受信で1月の日付なら翌年、
+    1月受信で12月の日付なら前年とする。ない場合は今日の年を使用する。
+    """
+    if not mail_received_date:
+        return dt.date.today().year
+    base_year = mail_received_date.year
+    if mail_received_date.month == 12 and month == 1:
+        return base_year + 1
+    if mail_received_date.month == 1 and month == 12:
+        return base_year - 1
+    return base_year
+
+
+def _classify(text: str, pos: int):
+    """"#日報" の出現位置から (バケット, 日付付きパターン, 日付なしパターン) を返す。"""
+    suffix = text[pos + 3:pos + 5]
+    if suffix == "計画":
+        return _PLAN, _DATED_PLAN, _UNDATED_PLAN
+    if suffix == "結果":
+        return _RESULT, _DATED_RESULT, _UNDATED_RESULT
+    return _PLAIN, _DATED_PLAIN, _UNDATED_PLAIN
+
+
+def extract_daily_reports(text: str, mail_received_date: dt.date | None = None):
+    """
+    return list of (kind, summary, date) tuples
+    1つのメッセージから複数の日報（計画・結果）を抽出
+
+    対応パターン:
+    1. #日報計画 MM/DD 要約:xxxxx
+    2. #日報結果 MM/DD 要約:xxxxx
+    3. #日報計画 MM/DD xxxxx
+    4. #日報結果 MM/DD xxxxx
+    5. #日報 MM/DD xxxxx (結果として扱う)
+    6. 日付なしの場合は None を返す（メール受信日を使用）
+
+    日付付きの項目が1件もない場合のみ日付なしの項目を返す。
+    並び順は 計画 → 結果 → #日報 の順（各グループ内は本文の出現順）。
+    """
+    return extract_message(message_part(text), mail_received_date)
+
+
+def extract_message(text: str, mail_received_date: dt.date | None = None):
+    """
+    1つのチャットメッセージの本文から抽出する（extract_daily_reports から "Microsoft Teams" の
+    切り出しを除いたもの）。return list of (kind, summary, date) tuples
+    """
+    dated: tuple[list, list, list] = ([], [], [])
+    # 無効な日付の警告（旧実装と同じく 計画 → 結果 → #日報 の順に表示するため、種類ごとにためておく）
+    invalid: tuple[list, list, list] = ([], [], [])
+    # パターンごとの次回探索開始位置（re.finditer の非重複マッチを再現）
+    next_pos = [0, 0, 0]
+    tags = []
+
+    pos = text.find(TAG)
+    while pos >= 0:
+        bucket, pattern, undated_pattern = _classify(text, pos)
+        tags.append((pos, bucket, undated_pattern))
+
+        if pos >= next_pos[bucket]:
+            m = pattern.match(text, pos)
+            if m:
+                next_pos[bucket] = m.end()
+                month = int(m.group(1))
+                day = int(m.group(2))
+                summary = m.group(3).strip()[:SUMMARY_MAX_LEN]
+                if summary and (bucket != _PLAIN or
+                                ("計画" not in summary and "結果" not in summary)):
+                    try:
+                        year = resolve_year(month, mail_received_date)
+                        kind = "plan" if bucket == _PLAN else "result"
+                        dated[bucket].append((kind, summary, dt.date(year, month, day)))
+                    except ValueError:
+                        invalid[bucket].append(f"  警告: 無効な日付 {month}/{day}")
+
+        pos = text.find(TAG, pos + len(TAG))
+
+    for warning in invalid[_PLAN] + invalid[_RESULT] + invalid[_PLAIN]:
+        print(warning)
+
+    reports = dated[_PLAN] + dated[_RESULT] + dated[_PLAIN]
+    if reports:
+        return reports
+
+    # 日付なしのパターン（後方互換性のため）
+    # 本文は再走査せず、記録済みのタグ位置だけを照合する
+    undated: tuple[list, list, list] = ([], [], [])
+    next_pos = [0, 0, 0]
+    for pos, bucket, pattern in tags:
+        if pos < next_pos[bucket]:
+            continue
+        m = pattern.match(text, pos)
+        if not m:
+            continue
+        next_pos[bucket] = m.end()
+        summary = m.group(1).strip()[:SUMMARY_MAX_LEN]
+        if (summary and not _DATE_PREFIX.match(summary) and
+                (bucket != _PLAIN or ("計画" not in summary and "結果" not in summary))):
+            kind = "plan" if bucket == _PLAN else "result"
+            undated[bucket].append((kind, summary, None))
+
+    return undated[_PLAN] + undated[_RESULT] + undated[_PLAIN]
+
+
+def extract_mail(body: str, mail_received_date: dt.date | None = None):
+    """
+    メール本文から抽出する。return list of (kind, summary, date) tuples
+
+    テキストの本文は extract_daily_reports と同じ。HTML の本文は Teams のメッセージごとに抽出し、
+    日付なしの項目にはメッセージの投稿日を入れる（年の決定にも投稿日を使う）。
+    投稿日時が分からない HTML はテキストにして extract_daily_reports と同じく扱う。
+    """
+    # teams_html は resolve_year を使うため、ここで読み込む（テキストだけの経路では html.parser も読まない）
+    from teams_html import is_html, split_messages
+
+    if not is_html(body):
+        return extract_daily_reports(body, mail_received_date)
+
+    reports = []
+    for message in split_messages(body, mail_received_date):
+        if message.sent is None:
+            reports.extend(extract_daily_reports(message.text, mail_received_date))
+            continue
+        sent_date = message.sent.date()
+        reports.extend((kind, summary, date or sent_date)
+                       for kind, summary, date in extract_message(message.text, sent_date))
+    return reports
+
+
+def _extract_chunk(chunk):
+    """ワーカー側: chunk の各 (本文, 受信日) を抽出し、(結果, 警告の出力) のリストを返す。"""
+    import contextlib
+    import io
+
+    results = []
+    for body, received_date in chunk:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            reports = extract_mail(body, received_date)
+        results.append((reports, output.getvalue()))
+    return results
+
+
+def extract_all(items, jobs: int = 1, chunk_size: int = EXTRACT_CHUNK_SIZE):
+    """
+    (本文, 受信日) の列を extract_mail で抽出し、入力と同じ順で (結果, 警告の出力) を返すジェネレーター。
+
+    jobs <= 1 ならこのプロセスで1件ずつ抽出する（警告はその場で表示し、出力は常に空）。
+    jobs > 1 なら chunk_size 件ずつプロセスプールへ渡し、ワーカーの警告の出力は
+    呼び出し側が結果と一緒に表示する。items は必要な分だけ先読みする（最大 jobs * 2 チャンク）。
+    """
+    if jobs <= 1:
+        for body, received_date in items:
+            yield extract_mail(body, received_date), ""
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import islice
+
+    items = iter(items)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        while True:
+            while len(pending) < jobs * 2:
+                chunk = list(islice(items, chunk_size))
+                if not chunk:
+                    break
+                pending.append(executor.submit(_extract_chunk, chunk))
+            if not pending:
+                return
+            yield from pending.popleft().result()
@@ -0,0 +1,214 @@
+"""
+実行レポート（段階ごとの時間・件数の記録）
+
+各スクリプトは進捗を人向けに表示するだけだったため、夜間バッチ（日報更新.bat）が遅くなったときに
+Outlook の列挙・本文取得・ブックの読み込み・日付行の走査・保存のどこが遅いのか分からなかった。
+
+実行ごとに
+
+  - 段階ごとの経過時間（秒）
+  - COM 呼び出し回数・メールの件数（確認・スキップ・処理）・書き込んだセル数などの件数
+  - ブックの読み込み・走査・保存の合計時間と、ブックごとの読み込み時・保存後のファイルサイズ
+
+を JSON の実行レポートとして RUN_REPORT_DIR（未設定ならリポジトリ直下の run_reports/）の
+<スクリプト名>.json に書き出す（前回分は上書き）。環境変数 METRICS_FILE を設定すると
+同じ内容を1行1実行で追記する（最新 METRICS_MAX_RUNS 件だけ残す）。
+
+--profile を付けた実行では cProfile（<スクリプト名>-<実行ID>.prof、snakeviz などで表示）と
+tracemalloc のスナップショット（<スクリプト名>-<実行ID>.tracemalloc）も同じディレクトリに書き出す
+（cProfile はメインスレッドだけを記録する。パイプラインのほかの段階の時間は実行レポートの pipeline を見る）。
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from state_store import new_run_id
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_REPORT_DIR = "run_reports"
+DEFAULT_METRICS_MAX_RUNS = 1000
+
+
+def resolve_report_dir(value: str | None = None) -> Path:
+    """実行レポートの出力先（相対パスならリポジトリ直下を基準にする）。"""
+    value = value or os.getenv("RUN_REPORT_DIR", "")
+    path = Path(value) if value else REPO_ROOT / DEFAULT_REPORT_DIR
+    if not path.is_absolute():
+        path = REPO_ROOT / path
+    return path
+
+
+class RunReport:
+    """1回の実行の計測値。"""
+
+    def __init__(self, command: str, profile: bool = False):
+        self.command = command
+        self.started = dt.datetime.now()
+        # 処理済みIDの記録（state_store.py）と同じ実行IDを使う
+        self.run_id = new_run_id()
+        self.stages: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        self.sections: dict[str, dict] = {}
+        self._pool = None
+        self._t0 = time.perf_counter()
+        self._profiler = None
+        if profile:
+            import cProfile
+            import tracemalloc
+
+            tracemalloc.start()
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    @contextmanager
+    def stage(self, name: str):
+        """with の中の経過時間を name の段階に加算する。"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_pool(self, pool) -> None:
+        """
+        WorkbookPool の読み込み・走査・保存の時間とブックごとのサイズを記録する。
+
+        値はレポートを書き出す時点のものを使う（途中で終了した場合もそこまでの分が残る）。
+        """
+        self._pool = pool
+
+    def _pool_section(self) -> dict:
+        pool = self._pool
+        return {
+            "loads": pool.loads,
+            "rebases": pool.rebases,
+            "load_seconds": round(pool.load_time, 6),
+            "scan_seconds": round(pool.scan_time, 6),
+            "save_seconds": round(pool.save_time, 6),
+            "files": [{"path": str(path), "size_before": before, "size_after": after}
+                      for path, (before, after) in pool.sizes.items()],
+        }
+
+    def add_pipeline(self, pipeline) -> None:
+        """ImportPipeline の段階ごとの件数・処理時間・待ち時間・キューの最大長を記録する。"""
+        self.add_time("pipeline", pipeline.elapsed)
+        self.sections["pipeline"] = {
+            stats.name: {
+                "items": stats.items,
+                "busy_seconds": round(stats.busy, 6),
+                "wait_in_seconds": round(stats.wait_in, 6),
+                "wait_out_seconds": round(stats.wait_out, 6),
+                "max_queue_depth": stats.max_depth,
+            }
+            for stats in pipeline.stats.values()
+        }
+
+    def to_dict(self, status: str) -> dict:
+        return {
+            "run_id": self.run_id,
+            "command": self.command,
+            "argv": sys.argv[1:],
+            "started": self.started.isoformat(timespec="seconds"),
+            "wall_seconds": round(time.perf_counter() - self._t0, 6),
+            "status": status,
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "counters": self.counters,
+            **self.sections,
+            **({"workbooks": self._pool_section()} if self._pool is not None else {}),
+        }
+
+    def finish(self, exit_code: int | None = None, error: BaseException | None = None) -> Path | None:
+        """
+        レポートを書き出し、そのパスを返す（書き出せなければ警告を表示して None）。
+
+        レポートの書き出しに失敗しても実行結果は変えない。
+        """
+        if error is not None:
+            status = f"error: {type(error).__name__}: {error}"
+        else:
+            status = "ok" if not exit_code else f"exit {exit_code}"
+        directory = resolve_report_dir()
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            if self._profiler is not None:
+                self._write_profile(directory)
+            report = self.to_dict(status)
+            path = directory / f"{self.command}.json"
+            tmp = path.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+            os.replace(tmp, path)
+            append_metrics(report)
+        except OSError as e:
+            print(f"警告: 実行レポートを書き出せません: {e}")
+            return None
+        print(f"実行レポート: {path}")
+        return path
+
+    def _write_profile(self, directory: Path) -> None:
+        import tracemalloc
+
+        self._profiler.disable()
+        prof = directory / f"{self.command}-{self.run_id}.prof"
+        self._profiler.dump_stats(prof)
+        snapshot_path = directory / f"{self.command}-{self.run_id}.tracemalloc"
+        tracemalloc.take_snapshot().dump(str(snapshot_path))
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.sections["profile"] = {
+            "cprofile": str(prof),
+            "tracemalloc": str(snapshot_path),
+            "memory_current_bytes": current,
+            "memory_peak_bytes": peak,
+        }
+        print(f"プロファイル: {prof}")
+        print(f"メモリスナップショット: {snapshot_path} (最大 {peak / 1024 / 1024:.1f} MiB)")
+
+
+def append_metrics(report: dict) -> None:
+    """METRICS_FILE が設定されていれば report を1行追記し、最新 METRICS_MAX_RUNS 件だけ残す。"""
+    value = os.getenv("METRICS_FILE", "")
+    if not value:
+        return
+    path = Path(value)
+    if not path.is_absolute():
+        path = REPO_ROOT / path
+    max_runs = int(os.getenv("METRICS_MAX_RUNS", str(DEFAULT_METRICS_MAX_RUNS)))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    # 上限の2割を超えてから古い行を切り詰める（毎回ファイル全体を書き直さない）
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+    if len(lines) > max_runs * 1.2:
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text("".join(lines[-max_runs:]), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def run_with_report(command: str, func, *args, profile: bool = False) -> int:
+    """func(*args, report) を実行し、終了コードまたは例外とともに実行レポートを書き出す。"""
+    report = RunReport(command, profile=profile)
+    try:
+        code = func(*args, report)
+    except SystemExit as e:
+        report.finish(e.code if isinstance(e.code, int) else 1)
+        raise
+    except BaseException as e:
+        report.finish(error=e)
+        raise
+    report.finish(code)
+    return code
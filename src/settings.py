@@ -0,0 +1,55 @@
+"""
+実行時の設定（.env と環境変数）
+
+以前は各スクリプトが import 時に load_dotenv() を呼び、設定をモジュール変数にしていたため、
+--help や引数の誤りでも .env の読み込みが走り、テストから import することもできなかった。
+
+各スクリプトは main() で引数を確認してから load_settings() を呼ぶ。
+.env は最初の呼び出しで1回だけ読み込む（python-dotenv もそのとき import する）。
+"""
+
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+
+
+class Settings:
+    """
+    .env / 環境変数から読んだ設定。
+
+    dataclasses は import に時間がかかる（inspect を読み込む）ため、通常のクラスにしている。
+    """
+
+    __slots__ = ("outlook_folder", "mail_source", "mail_body_format", "outlook_prefilter",
+                 "watermark_overlap_hours", "date_col", "plan_col", "result_col", "rows_per_day")
+
+    def __init__(self, env=os.environ):
+        self.outlook_folder = env.get("OUTLOOK_FOLDER", "Teams日報")
+        self.mail_source = env.get("MAIL_SOURCE", "outlook")
+        # 本文の形式（text: Body / html: HTMLBody。html なら通知メールをメッセージごとに抽出する）
+        self.mail_body_format = env.get("MAIL_BODY_FORMAT", "text").strip().lower()
+        # Outlook 側で本文に #日報 を含むメールだけに絞り込む（off / dasl / searchfolder）
+        self.outlook_prefilter = env.get("OUTLOOK_PREFILTER", "off").strip().lower() or "off"
+        # 差分取得時に前回の受信日時からさかのぼって再確認する時間（遅延配信・時計ずれ対策）
+        self.watermark_overlap_hours = float(env.get("WATERMARK_OVERLAP_HOURS", "24"))
+        # Excel構造設定
+        # 書き込み先のブック（EXCEL_PATH のテンプレート）とシートは項目の報告日ごとに決める
+        self.date_col = env.get("DATE_COL", "B")
+        self.plan_col = env.get("PLAN_COL", "C")
+        self.result_col = env.get("RESULT_COL", "F")
+        self.rows_per_day = int(env.get("ROWS_PER_DAY", "6"))
+
+    @property
+    def columns(self) -> tuple[str, str, str, int]:
+        """WorkbookPool に渡す (DATE_COL, PLAN_COL, RESULT_COL, ROWS_PER_DAY)"""
+        return self.date_col, self.plan_col, self.result_col, self.rows_per_day
+
+
+@lru_cache(maxsize=None)
+def load_settings() -> Settings:
+    """.env ファイルから環境変数を読み込み、設定を返す。"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return Settings()
@@ -0,0 +1,175 @@
+"""
+月シートの日付行・空き枠インデックス
+
+旧実装では日付グループごとに find_row_by_date が DATE_COL を ws.max_row まで
+読み直し、さらに空き行探索で PLAN_COL / RESULT_COL をセル単位で読み直していた。
+SheetIndex はワークブック読み込み後に1回だけ行を走査し、
+
+  - 日付 → 日付行
+  - 日付ブロックごとの計画列・結果列の使用済み枠（ビットマスク）
+
+を保持する。書き込み時はインデックスを更新するので、1件あたりの書き込みは O(1)。
+
+日付セルは datetime / date に加えて Excel のシリアル値（数値）も受け付ける。
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+
+# 日付行 = 入力開始行 + DATE_OFFSET（入力エリアは日付行の3行上から始まる）
+DATE_OFFSET = 3
+
+# Excel シリアル値の基準日（1900年うるう年バグ込みで 1899-12-30 起点）
+_EXCEL_EPOCH = dt.datetime(1899, 12, 30)
+
+
+def to_date(value) -> dt.date | None:
+    """セル値を日付に変換する。日付として解釈できなければ None。"""
+    if isinstance(value, dt.datetime):
+        return value.date()
+    if isinstance(value, dt.date):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return (_EXCEL_EPOCH + dt.timedelta(days=value)).date()
+        except OverflowError:
+            return None
+    return None
+
+
+class SheetIndex:
+    """1枚の月シートに対する日付行と空き枠のインデックス。"""
+
+    def __init__(self, ws, date_col: str, plan_col: str, result_col: str,
+                 rows_per_day: int):
+        from openpyxl.utils import column_index_from_string
+
+        self.ws = ws
+        self.title = ws.title
+        self.rows_per_day = rows_per_day
+        self.columns = {"plan": plan_col, "result": result_col}
+        self._col_idx = {
+            "plan": column_index_from_string(plan_col),
+            "result": column_index_from_string(result_col),
+        }
+        self._full_mask = (1 << rows_per_day) - 1
+
+        self.date_rows: dict[dt.date, int] = {}
+        # 列ごとの 行番号 → 値（値が入っている行のみ）
+        self._values: dict[str, dict[int, object]] = {"plan": {}, "result": {}}
+        # 日付行 → {kind: 使用済み枠のビットマスク}（初回参照時に作成）
+        self._blocks: dict[int, dict[str, int]] = {}
+        # 前回の保存から値が変わったセルの数（WorkbookPool が保存の要否の判定に使う）
+        self.changed = 0
+
+        self._scan(column_index_from_string(date_col))
+
+    def _scan(self, date_idx: int) -> None:
+        """DATE_COL / PLAN_COL / RESULT_COL を1回の行走査で読み込む。"""
+        plan_idx = self._col_idx["plan"]
+        result_idx = self._col_idx["result"]
+        min_col = min(date_idx, plan_idx, result_idx)
+        max_col = max(date_idx, plan_idx, result_idx)
+
+        rows = self.ws.iter_rows(min_row=1, max_row=self.ws.max_row,
+                                 min_col=min_col, max_col=max_col, values_only=True)
+        for r, values in enumerate(rows, start=1):
+            cell_date = to_date(values[date_idx - min_col])
+            if cell_date is not None:
+                # 同じ日付が複数ある場合は先頭の行を採用（find_row_by_date と同じ）
+                self.date_rows.setdefault(cell_date, r)
+            if values[plan_idx - min_col]:
+                self._values["plan"][r] = values[plan_idx - min_col]
+            if values[result_idx - min_col]:
+                self._values["result"][r] = values[result_idx - min_col]
+
+    def find_row(self, target_date: dt.date) -> int | None:
+        """target_date の日付行を返す。見つからなければ None。"""
+        return self.date_rows.get(target_date)
+
+    def _block(self, date_row: int) -> dict[str, int]:
+        block = self._blocks.get(date_row)
+        if block is None:
+            start = date_row - DATE_OFFSET
+            block = {}
+            for kind, rows in self._values.items():
+                mask = 0
+                for offset in range(self.rows_per_day):
+                    if start + offset in rows:
+                        mask |= 1 << offset
+                block[kind] = mask
+            self._blocks[date_row] = block
+        return block
+
+    def free_rows(self, date_row: int, kind: str, start_offset: int = 0) -> list[int]:
+        """日付ブロック内で kind 列の空き行を start_offset 以降から昇順で返す。"""
+        mask = self._block(date_row)[kind]
+        input_start_row = date_row - DATE_OFFSET
+        return [
+            input_start_row + offset
+            for offset in range(start_offset, self.rows_per_day)
+            if not mask & (1 << offset)
+        ]
+
+    def last_row(self, date_row: int) -> int:
+        """日付ブロックの最終入力行（空き行がないときの追記先）。"""
+        return date_row - DATE_OFFSET + self.rows_per_day - 1
+
+    def next_slot(self, date_row: int, kind: str, start_offset: int = 0) -> tuple[int, bool]:
+        """
+        日付ブロック内で kind 列の次の書き込み先を返す。
+
+        return (行番号, 追記かどうか)
+        start_offset 以降に空き枠がなければブロック最終行への追記になる。
+        """
+        mask = self._block(date_row)[kind]
+        free = ~mask & self._full_mask & ~((1 << start_offset) - 1)
+        if free:
+            offset = (free & -free).bit_length() - 1
+            return date_row - DATE_OFFSET + offset, False
+        return self.last_row(date_row), True
+
+    def value(self, kind: str, row: int):
+        """インデックス上の kind 列・row 行の値（空なら None）。"""
+        return self._values[kind].get(row)
+
+    def set_value(self, kind: str, row: int, value) -> bool:
+        """
+        kind 列・row 行のセルに value を書き込み、インデックスを更新する。
+
+        値が変わらない場合は書き込まずに False を返す。
+        """
+        if (self.value(kind, row) or None) == (value or None):
+            return False
+        self.ws.cell(row=row, column=self._col_idx[kind]).value = value
+        self._mark(kind, row, value)
+        self.changed += 1
+        return True
+
+    def write(self, date_row: int, kind: str, summary: str,
+              start_offset: int = 0) -> tuple[str, bool]:
+        """
+        日付ブロックの kind 列の空き枠に summary を書き込み、インデックスを更新する。
+
+        return (セル番地, 追記かどうか)
+        """
+        row, appended = self.next_slot(date_row, kind, start_offset)
+        current = self.value(kind, row)
+        self.set_value(kind, row, f"{current}\n{summary}" if appended and current else summary)
+        return f"{self.columns[kind]}{row}", appended
+
+    def _mark(self, kind: str, row: int, value) -> None:
+        if value:
+            self._values[kind][row] = value
+        else:
+            # 空にしたセル（書き込みの取り消し）は空き枠に戻す
+            self._values[kind].pop(row, None)
+        # ROWS_PER_DAY がブロック間隔より大きい場合に備え、この行を含む全ブロックを更新
+        for offset in range(self.rows_per_day):
+            block = self._blocks.get(row - offset + DATE_OFFSET)
+            if block is not None:
+                if value:
+                    block[kind] |= 1 << offset
+                else:
+                    block[kind] &= ~(1 << offset)
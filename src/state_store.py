@@ -0,0 +1,285 @@
+"""
+処理済みメールの状態ストア
+
+旧実装は processed_mail_ids.json（EntryID の配列）を毎回すべて読み込み、
+indent=2 で全体を書き直していた。さらにカレントディレクトリ基準の相対パスだったため、
+バッチ・再実行スクリプト・手動実行で別のファイルを見ることがあった。
+
+StateStore は
+
+  - 絶対パス（環境変数 STATE_FILE、未設定ならリポジトリ直下の processed_mail_ids.jsonl）
+  - 1行1レコードの JSON Lines で、実行ごとに新しいレコードだけを追記
+  - 読み込み後は dict による O(1) の処理済み判定
+  - 重複・削除済みの行が増えたら自動でコンパクション（一時ファイル経由で置き換え）
+  - 追記とコンパクションは <状態ファイル>.lock のロック内で行い、コンパクションの前にファイルを読み直す
+    （定期実行と手動の再取り込みが同時に動いても、ほかのプロセスが追記した処理済みIDを消さない）
+  - 受信日が保持期間より古いレコードの削除（prune）
+
+を行う。各レコードには受信日時・抽出件数・書き込み先ブック・実行IDを記録する。
+また、差分取得の基準となる受信日時（watermark）も同じファイルに記録する。
+旧形式の processed_mail_ids.json があれば初回読み込み時に取り込む。
+
+単体でも実行でき、状態ファイルの確認・コンパクション・古いレコードの削除ができる:
+  python src/state_store.py --stats
+  python src/state_store.py --compact
+  python src/state_store.py --prune-days 400
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import os
+from pathlib import Path
+
+from file_lock import FileLock
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_STATE_NAME = "processed_mail_ids.jsonl"
+LEGACY_STATE_NAME = "processed_mail_ids.json"
+
+# 不要になった行（上書き・削除済み）がこの数を超え、かつ有効レコード数以上になったらコンパクション
+COMPACT_MIN_GARBAGE = 1000
+
+
+def resolve_state_path(value: str | None = None) -> Path:
+    """
+    状態ファイルの絶対パスを返す。
+
+    value（未指定なら環境変数 STATE_FILE）が相対パスならリポジトリ直下を基準にする。
+    """
+    value = value or os.getenv("STATE_FILE", "")
+    path = Path(value) if value else REPO_ROOT / DEFAULT_STATE_NAME
+    if not path.is_absolute():
+        path = REPO_ROOT / path
+    return path
+
+
+def new_run_id() -> str:
+    """実行ID（実行開始時刻 + プロセスID）。"""
+    return f"{dt.datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+
+
+def _iso(value) -> str | None:
+    if isinstance(value, dt.datetime):
+        return value.replace(tzinfo=None).isoformat(timespec="seconds")
+    if isinstance(value, dt.date):
+        return value.isoformat()
+    return None
+
+
+def _workbook(value):
+    """書き込み先ブック（1冊なら文字列、複数ならパスの一覧）。"""
+    if not value:
+        return None
+    if isinstance(value, (str, os.PathLike)):
+        return str(value)
+    paths = sorted(str(v) for v in value)
+    return paths[0] if len(paths) == 1 else paths
+
+
+class StateStore:
+    """処理済みメールの追記型ストア。"""
+
+    def __init__(self, path: Path | None = None, run_id: str | None = None):
+        self.path = path or resolve_state_path()
+        self.run_id = run_id or new_run_id()
+        self.records: dict[str, dict] = {}
+        # 前回までに走査した最新の受信日時（ローカル時刻、naive）
+        self.watermark: dt.datetime | None = None
+        self._pending: list[dict] = []
+        self._lines = 0
+        # prune() で削除した EntryID（コンパクション前の読み直しで復活させない）
+        self._dropped: set[str] = set()
+        self._lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+        self._load()
+
+    # ----- 読み込み -----
+    def _load(self) -> None:
+        if not self.path.exists():
+            self._import_legacy()
+            return
+        self._lines = self._read()
+
+    def _read(self) -> int:
+        """状態ファイルの全行を records に反映し、行数を返す。"""
+        lines = 0
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                lines += 1
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で中断された末尾行などは読み飛ばす
+                    continue
+                if record.get("id") in self._dropped:
+                    continue
+                self._apply(record)
+        return lines
+
+    def _apply(self, record: dict) -> None:
+        if "watermark" in record:
+            value = dt.datetime.fromisoformat(record["watermark"])
+            if self.watermark is None or value > self.watermark:
+                self.watermark = value
+            return
+        entry_id = record.get("id")
+        if not entry_id:
+            return
+        if record.get("deleted"):
+            self.records.pop(entry_id, None)
+        else:
+            self.records[entry_id] = record
+
+    def _import_legacy(self) -> None:
+        """旧形式 processed_mail_ids.json（状態ファイルと同じ場所、またはカレント）を取り込む。"""
+        for legacy in (self.path.with_name(LEGACY_STATE_NAME), Path.cwd() / LEGACY_STATE_NAME):
+            if legacy.exists():
+                ids = json.loads(legacy.read_text(encoding="utf-8"))
+                for entry_id in ids:
+                    self.records[entry_id] = {"id": entry_id, "run": "legacy"}
+                print(f"旧形式の処理済みIDを取り込みました: {legacy} ({len(ids)}件)")
+                self.compact()
+                return
+
+    # ----- 参照 -----
+    def __contains__(self, entry_id: str) -> bool:
+        return entry_id in self.records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def ids(self) -> set[str]:
+        return set(self.records)
+
+    # ----- 更新 -----
+    def add(self, entry_id: str, received=None, entries: int = 0,
+            workbook=None, **extra) -> None:
+        """処理済みとして記録する（commit() まではファイルに書かない）。"""
+        record = {
+            "id": entry_id,
+            "received": _iso(received),
+            "entries": entries,
+            "workbook": _workbook(workbook),
+            "run": self.run_id,
+            "at": _iso(dt.datetime.now()),
+        }
+        record.update(extra)
+        self._apply(record)
+        self._pending.append(record)
+
+    def advance_watermark(self, received) -> None:
+        """
+        走査済みの最新受信日時を記録する（commit() まではファイルに書かない）。
+
+        現在の watermark より新しい場合だけ更新する。
+        """
+        if not isinstance(received, dt.datetime):
+            return
+        received = received.replace(tzinfo=None, microsecond=0)
+        if self.watermark is not None and received <= self.watermark:
+            return
+        record = {"watermark": received.isoformat(), "run": self.run_id,
+                  "at": _iso(dt.datetime.now())}
+        self._apply(record)
+        self._pending.append(record)
+
+    def _live_lines(self) -> int:
+        return len(self.records) + (1 if self.watermark else 0)
+
+    def commit(self) -> int:
+        """今回追加したレコードだけを追記し、必要ならコンパクションする。追記件数を返す。"""
+        if not self._pending:
+            return 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self._pending)
+        # コンパクションで置き換えられる前のファイルに追記しないよう、ロック内で追記する
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+            count = len(self._pending)
+            self._lines += count
+            self._pending = []
+
+            garbage = self._lines - self._live_lines()
+            if garbage > COMPACT_MIN_GARBAGE and garbage >= self._live_lines():
+                self._compact()
+        return count
+
+    def compact(self) -> None:
+        """有効なレコードだけを一時ファイルに書き出し、状態ファイルを置き換える。"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        # 読み込み後にほかのプロセスが追記した行を取り込んでから書き出す（ロック内で呼ぶ）。
+        # ファイルには自分の追記済みレコードも含まれるため、未追記のレコードだけを後から反映し直す
+        if self.path.exists():
+            self._read()
+            for record in self._pending:
+                self._apply(record)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            if self.watermark:
+                f.write(json.dumps({"watermark": self.watermark.isoformat(), "run": self.run_id},
+                                   ensure_ascii=False) + "\n")
+            for record in self.records.values():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        self._lines = self._live_lines()
+        self._pending = []
+
+    def prune(self, retention_days: int, today: dt.date | None = None) -> int:
+        """
+        受信日が retention_days 日より前のレコードを削除してコンパクションする。
+
+        受信日が記録されていないレコード（旧形式からの取り込み分）は残す。
+        削除件数を返す。
+        """
+        cutoff = (today or dt.date.today()) - dt.timedelta(days=retention_days)
+        old = [
+            entry_id for entry_id, record in self.records.items()
+            if record.get("received") and dt.date.fromisoformat(record["received"][:10]) < cutoff
+        ]
+        for entry_id in old:
+            del self.records[entry_id]
+        self._dropped.update(old)
+        if old:
+            self.compact()
+        return len(old)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="処理済みメールの状態ファイルを管理します")
+    parser.add_argument("--state-file", help="状態ファイル（省略時は STATE_FILE または既定の場所）")
+    parser.add_argument("--stats", action="store_true", help="件数と場所を表示します")
+    parser.add_argument("--compact", action="store_true", help="状態ファイルをコンパクションします")
+    parser.add_argument("--prune-days", type=int,
+                        help="受信日がこの日数より前のレコードを削除します")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    store = StateStore(resolve_state_path(args.state_file))
+
+    if args.prune_days is not None:
+        print(f"削除: {store.prune(args.prune_days)}件")
+    if args.compact:
+        store.compact()
+        print("コンパクション完了")
+
+    print(f"状態ファイル: {store.path}")
+    print(f"処理済み件数: {len(store)}")
+    print(f"差分取得の基準: {store.watermark or '(未設定)'}")
+    print(f"ファイル行数: {store._lines}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
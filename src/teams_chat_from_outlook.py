@@ -2,450 +2,353 @@
 計画
 1) Outlook ローカルから Teams共有メールを取得
 2) #日報計画 / #日報結果 + 要約: を抽出
-3) 未処理メールのみ処理（EntryID で重複防止）
-4) Excel 日報に追記
+3) 未処理メールのみ処理（前回の受信日時以降だけを取得し、EntryID で重複防止）
+4) 抽出結果をスプール（write_spool.py）に保存し、メールをスプール済みにする
+5) Excel 日報に追記（報告日の月のブック・シートへ振り分け。スプールに残っていた項目も一緒に書き込む）
+   ブックのロックを別のプロセスが持っていれば、項目はそのプロセスに任せて終了する（グループコミット）
 """
 
-import json
-import os
-import re
+import argparse
 import datetime as dt
-from pathlib import Path
+import os
 
-from dotenv import load_dotenv
-import win32com.client
-from openpyxl import load_workbook
 
-# .env ファイルから環境変数を読み込み
-load_dotenv()
+def parse_yyyy_mm_dd(s: str) -> dt.date:
+    try:
+        return dt.date.fromisoformat(s)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(
+            "日付は YYYY-MM-DD 形式で指定してください (例: 2026-02-01)"
+        ) from e
 
-# ===== 設定 =====
-OUTLOOK_FOLDER = os.getenv("OUTLOOK_FOLDER", "Teams日報")
-STATE_FILE = Path("processed_mail_ids.json")
 
-# 現在の月に基づいてファイルパスを動的に生成
-today = dt.date.today()
-year = today.year
-month = today.month
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="OutlookのTeams日報フォルダーから未処理メールを取り込んでExcelへ書き込みます"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Excelを読み取り専用で開き、書き込み計画(JSON)を表示するだけで保存しません",
+    )
+    parser.add_argument(
+        "--since", type=parse_yyyy_mm_dd,
+        help="この日以降に受信したメールだけを対象にします（YYYY-MM-DD、Outlook 側で絞り込み）",
+    )
+    parser.add_argument(
+        "--until", type=parse_yyyy_mm_dd,
+        help="この日までに受信したメールだけを対象にします（YYYY-MM-DD、Outlook 側で絞り込み）",
+    )
+    parser.add_argument(
+        "--full-scan",
+        action="store_true",
+        help="前回の受信日時（差分取得の基準）を使わず、フォルダー内の全メールを確認します",
+    )
+    parser.add_argument(
+        "--source",
+        help="メールの取得元: outlook / mirror / eml:<ディレクトリ> / mbox:<ファイル> / maildir:<ディレクトリ>"
+             "（省略時は環境変数 MAIL_SOURCE、未設定なら outlook）",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1,
+        help="本文からの日報抽出を N プロセスで並列に行います（0 で CPU 数、既定 1）。"
+             "年度分の再取り込みなど大量のメール向け",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="実行レポートと一緒に cProfile と tracemalloc のスナップショットを書き出します",
+    )
+    return parser
 
-# 年度計算（4月始まり）
-fiscal_year = year if month >= 4 else year - 1
 
-# 年度内の月番号（4月=01, 5月=02, ..., 12月=09, 1月=10, 2月=11, 3月=12）
-if month >= 4:
-    fiscal_month_num = month - 3  # 4月=1, 5月=2, ..., 12月=9
-else:
-    fiscal_month_num = month + 9  # 1月=10, 2月=11, 3月=12
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
 
-# 月フォルダ名（09_12月 形式）
-month_folder = f"{fiscal_month_num:02d}_{month}月"
+    from run_report import run_with_report
 
-# ファイル名の月部分
-month_name = f"{month}月"
+    return run_with_report("teams_chat_from_outlook", run, args, profile=args.profile)
 
-# ===== Excelファイルパス設定 =====
-# 環境変数 EXCEL_PATH が設定されていればそれを使用
-excel_path_template = os.getenv("EXCEL_PATH", "")
 
-if excel_path_template:
-    # テンプレート文字列の置換
-    excel_path_str = excel_path_template.format(
-        fiscal_year=fiscal_year,
-        month_folder=month_folder,
-        month_name=month_name
-    )
-    EXCEL_PATH = Path(excel_path_str)
-else:
-    # 環境変数からテンプレート要素を取得してパスを生成
-    username = os.getenv("EXCEL_USERNAME") or os.getenv("USERNAME", "username")
-    company = os.getenv("EXCEL_COMPANY", "株式会社サンプル")
-    department = os.getenv("EXCEL_DEPARTMENT", "部署名-01.庶務事項")
-    category = os.getenv("EXCEL_CATEGORY", "業務管理")
-    base_folder = os.getenv("EXCEL_BASE_FOLDER", "業務内容報告書")
-    team = os.getenv("EXCEL_TEAM", "チームA")
-    user_name = os.getenv("EXCEL_USER_NAME", "山田太郎")
-    
-    # OneDriveベースパス
-    onedrive_base = f"C:\\Users\\{username}\\OneDrive - {company}"
-    
-    EXCEL_PATH = Path(
-        f"{onedrive_base}\\{department}\\{category}\\"
-        f"{base_folder}\\{fiscal_year}年度\\{month_folder}\\{team}\\"
-        f"（{month_name}_{user_name}）業務内容報告書.xlsm"
+def run(args, report) -> int:
+    # 引数の確認が済んでから読み込む（--help や引数の誤りはすぐ返す）
+    from import_pipeline import ImportPipeline
+    from mail_mirror import mirrored
+    from mail_source import open_mail_source
+    from settings import load_settings
+    from state_store import StateStore
+    from workbook_pool import WorkbookPool, excel_path_for
+    from write_plan import WritePlan
+    from write_spool import SpoolDrain, WorkbookSession, WriteSpool, mail_record, print_pending
+
+    # .env ファイルから環境変数を読み込み
+    settings = load_settings()
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    # ===== Outlook 取得 =====
+    # EntryID / ReceivedTime / Subject は一括取得し、本文は未処理メールだけ取得する
+    # --source でエクスポート済みのメール（.eml / mbox / Maildir）やローカルミラーからも取り込める
+    # 取得した本文はローカルミラーに保存し、次回以降はミラーから読む（MAIL_MIRROR=0 で無効）
+    # OUTLOOK_PREFILTER=dasl / searchfolder なら #日報 を含まないメールは Outlook 側で除外する
+    source = mirrored(open_mail_source(args.source or settings.mail_source, settings.outlook_folder,
+                                       settings.mail_body_format, settings.outlook_prefilter))
+    with report.stage("connect"):
+        source_info = source.describe()  # Outlook フォルダーが見つからなければここで RuntimeError
+
+    # 処理済みID（STATE_FILE、未設定ならリポジトリ直下の processed_mail_ids.jsonl）
+    state = StateStore(run_id=report.run_id)
+
+    # ===== Excel 準備 =====
+    # 報告日の月ごとのブックを必要になった時点で1回だけ開き、LRU で保持する
+    pool = WorkbookPool(*settings.columns, read_only=args.dry_run)
+    report.add_pool(pool)
+
+    # ===== メール処理 =====
+    print(f"メール処理開始 (フォルダ: {source_info['folder_path']})")
+    print()
+
+    processed_count = 0
+    new_count = 0
+    enumerated_count = 0
+    plan = WritePlan()
+    # 処理したメール（処理済みIDへの記録は書き込み先が決まってから行う）
+    new_mails = []
+
+    # 期間指定がなければ、前回走査した最新の受信日時から重複確認分さかのぼった時刻以降だけを取得する
+    incremental_since = None
+    if args.since is None and args.until is None and not args.full_scan and state.watermark:
+        incremental_since = state.watermark - dt.timedelta(hours=settings.watermark_overlap_hours)
+        print(f"差分取得: {incremental_since:%Y-%m-%d %H:%M} 以降に受信したメール "
+              f"(前回 {state.watermark:%Y-%m-%d %H:%M}, 重複確認 {settings.watermark_overlap_hours:g} 時間)")
+        print()
+
+    # 新しい順に列挙し、基準時刻より古いメールに達したら打ち切る
+    # （Restrict が効いていれば打ち切りは起きないが、全件走査になった場合の保険）
+    mails = []
+    with report.stage("enumerate"):
+        for mail in source.records(incremental_since or args.since, args.until, descending=True):
+            received = mail.received_local
+            if incremental_since and received is not None and received < incremental_since:
+                break
+            mails.append(mail)
+    # 書き込みは従来どおり受信の古い順に行う
+    mails.reverse()
+
+    latest_received = None
+    # 未処理で期間内のメール（本文の取得・抽出の対象）
+    targets = []
+    for mail in mails:
+        enumerated_count += 1
+        entry_id = mail.entry_id
+        received = mail.received_local
+        if received and (latest_received is None or received > latest_received):
+            latest_received = received
+
+        if entry_id in state:
+            processed_count += 1
+            continue
+
+        # メールの受信日時を取得（デフォルト日付として使用）
+        default_date = mail.received_date
+        if default_date is None:
+            print("✗ スキップ: 受信日時を取得できません")
+            continue
+
+        # Restrict 失敗時の全件走査に備えて期間を再確認する
+        if ((args.since and default_date < args.since) or
+                (args.until and default_date > args.until)):
+            continue
+        targets.append(mail)
+
+    # 本文はここで初めて EntryID 指定で取得する（取得はこのスレッドで順に行い、
+    # --jobs 2 以上なら抽出だけをプロセスプールで並列に行う。結果は受信の古い順のまま）
+    # 抽出と並行して、抽出結果から分かった書き込み先のブックを別スレッドで読み込んでおく
+    def handle(mail, reports, warnings):
+        nonlocal new_count
+        entry_id = mail.entry_id
+        default_date = mail.received_date
+        subject = mail.subject
+        print(warnings, end="")
+
+        if reports:
+            print(f"✓ 処理: {subject[:50]}")
+            print(f"  抽出された項目: {len(reports)}件")
+
+            # 書き込み先の決定は全メールを読み終えてから WritePlan でまとめて行う
+            for kind, summary, report_date in reports:
+                # 日付が指定されていない場合はメール受信日を使用
+                target_date = report_date if report_date else default_date
+                print(f"    - {target_date} {kind}: {summary}")
+                plan.add(entry_id, kind, summary, target_date)
+
+            workbooks = {excel_path_for(report_date or default_date) for _, _, report_date in reports}
+            new_mails.append((mail, len(reports), workbooks))
+            new_count += 1
+        else:
+            print(f"✗ スキップ: {subject[:50]}")
+            print("  理由: 日報タグまたは要約が見つかりません")
+
+    pipeline = ImportPipeline(jobs=jobs, pool=pool)
+    try:
+        pipeline.run(targets, handle)
+    finally:
+        report.add_pipeline(pipeline)
+    # 本文の取得と抽出が終わるまでの時間（ブックの読み込みは並行して行うため含まない）
+    extract_time = pipeline.stats["parse"].elapsed
+
+    # 取得した本文をミラーのインデックスに書き出す（--dry-run でも保存する）
+    source.commit()
+    report.counters.update(
+        com_calls=source.com_calls, mails_seen=enumerated_count, mails_skipped=processed_count,
+        bodies_avoided=source.prefiltered,
+        mails_fetched=len(targets), mails_processed=new_count,
+        entries=sum(entries for _, entries, _ in new_mails),
     )
 
-# Excel構造設定
-SHEET_NAME_PATTERN = f"{month}月"
-DATE_COL = os.getenv("DATE_COL", "B")
-PLAN_COL = os.getenv("PLAN_COL", "C")
-RESULT_COL = os.getenv("RESULT_COL", "F")
-ROWS_PER_DAY = int(os.getenv("ROWS_PER_DAY", "6"))
-
-
-# ===== ユーティリティ =====
-def load_state():
-    if STATE_FILE.exists():
-        return set(json.loads(STATE_FILE.read_text(encoding="utf-8")))
-    return set()
-
-def save_state(ids):
-    STATE_FILE.write_text(json.dumps(list(ids), ensure_ascii=False, indent=2), encoding="utf-8")
-
-def extract_daily_reports(text: str, mail_received_date=None):
-    """
-    return list of (kind, summary, date) tuples
-    1つのメッセージから複数の日報（計画・結果）を抽出
-    
-    対応パターン:
-    1. #日報計画 MM/DD 要約:xxxxx
-    2. #日報結果 MM/DD 要約:xxxxx
-    3. #日報計画 MM/DD xxxxx
-    4. #日報結果 MM/DD xxxxx
-    5. #日報 MM/DD xxxxx (結果として扱う)
-    6. 日付なしの場合は None を返す（メール受信日を使用）
-    
-    Note: Teamsのメール本文にはプレビュー部分と実際のメッセージ部分が含まれる。
-          実際のメッセージ部分のみを抽出するため、"Microsoft Teams" 以降を使用。
-    """
-    # Teamsメールの実際のメッセージ部分を抽出
-    # "Microsoft Teams" というテキストの後が実際のメッセージ
-    if "Microsoft Teams" in text:
-        # "Microsoft Teams" の後、発信者名の後から実際のメッセージが始まる
-        parts = text.split("Microsoft Teams")
-        if len(parts) > 1:
-            # 後半部分のみを使用（実際のチャットメッセージ）
-            text = parts[-1]
-    
-    reports = []
-    # メール受信日がある場合はその年を基準に、ない場合は今日の年を使用
-    if mail_received_date:
-        base_year = mail_received_date.year
-    else:
-        base_year = dt.date.today().year
-    
-    # #日報計画を全て抽出（日付付き）
-    for m in re.finditer(r"#日報計画\s+(\d{1,2})/(\d{1,2})\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)", text):
-        month = int(m.group(1))
-        day = int(m.group(2))
-        summary = m.group(3).strip()[:50]
-        if summary:
-            try:
-                # 年をまたぐ場合の処理（メール受信日を基準に判定）
-                if mail_received_date:
-                    # メール受信月と報告月を比較して年を決定
-                    if mail_received_date.month == 12 and month == 1:
-                        # 12月に受信して1月の日付を指定した場合は翌年
-                        year = base_year + 1
-                    elif mail_received_date.month == 1 and month == 12:
-                        # 1月に受信して12月の日付を指定した場合は前年
-                        year = base_year - 1
-                    else:
-                        year = base_year
-                else:
-                    year = base_year
-                report_date = dt.date(year, month, day)
-                reports.append(("plan", summary, report_date))
-            except ValueError:
-                print(f"  警告: 無効な日付 {month}/{day}")
-    
-    # #日報結果を全て抽出（日付付き）
-    for m in re.finditer(r"#日報結果\s+(\d{1,2})/(\d{1,2})\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)", text):
-        month = int(m.group(1))
-        day = int(m.group(2))
-        summary = m.group(3).strip()[:50]
-        if summary:
-            try:
-                # 年をまたぐ場合の処理（メール受信日を基準に判定）
-                if mail_received_date:
-                    # メール受信月と報告月を比較して年を決定
-                    if mail_received_date.month == 12 and month == 1:
-                        # 12月に受信して1月の日付を指定した場合は翌年
-                        year = base_year + 1
-                    elif mail_received_date.month == 1 and month == 12:
-                        # 1月に受信して12月の日付を指定した場合は前年
-                        year = base_year - 1
-                    else:
-                        year = base_year
+    # ===== スプール =====
+    # Excel に触れる前に抽出結果をスプールへ保存し、メールをスプール済みとして処理済みIDに記録する
+    # （ブックが開かれていて書き込めなくても、次回はメールの取得・抽出をやり直さない）
+    spool = WriteSpool(run_id=report.run_id)
+    carried = spool.entry_count()
+    if not args.dry_run:
+        with report.stage("spool"):
+            spool.add(plan.pending, [mail_record(mail.entry_id, mail.received, entries, workbooks)
+                                     for mail, entries, workbooks in new_mails])
+            for mail, entries, workbooks in new_mails:
+                state.add(mail.entry_id, received=mail.received, entries=entries, workbook=workbooks,
+                          spooled=True)
+            # --since で途中から取り込んだ場合は、それより前のメールが未確認なので基準を進めない
+            if args.since is None:
+                state.advance_watermark(latest_received)
+            state.commit()
+    report.counters["entries_carried"] = carried
+
+    # ===== ブックのロック =====
+    # 別のプロセスがブックに書き込み中なら、スプールした項目はそのプロセスがまとめて書き込む
+    session = None
+    if not args.dry_run:
+        session = WorkbookSession(pool, spool)
+        if not session.acquire():
+            pool.close()
+            print()
+            print(f"他のプロセスが Excel に書き込み中です（{session.lock.path}）")
+            print(f"  スプールした項目（{spool.entry_count()}件）はそのプロセスがまとめて書き込みます")
+            return 0
+
+    # ===== 書き込み計画 =====
+    # 報告日ごとのブック・シートに振り分け、日付ブロック・列ごとに空き行と追記をまとめて決定する
+    # （前回までにスプールに残った項目も一緒に書き込む）
+    drain = SpoolDrain(pool, spool)
+    try:
+        try:
+            with report.stage("route"):
+                if args.dry_run:
+                    plan.route(pool)
                 else:
-                    year = base_year
-                report_date = dt.date(year, month, day)
-                reports.append(("result", summary, report_date))
-            except ValueError:
-                print(f"  警告: 無効な日付 {month}/{day}")
-    
-    # #日報（単独）を全て抽出（日付付き、結果として扱う）
-    for m in re.finditer(r"#日報\s+(\d{1,2})/(\d{1,2})\s+(.+?)(?:\n|$)", text):
-        month = int(m.group(1))
-        day = int(m.group(2))
-        summary = m.group(3).strip()[:50]
-        if summary and "計画" not in summary and "結果" not in summary:
-            try:
-                # 年をまたぐ場合の処理（メール受信日を基準に判定）
-                if mail_received_date:
-                    # メール受信月と報告月を比較して年を決定
-                    if mail_received_date.month == 12 and month == 1:
-                        # 12月に受信して1月の日付を指定した場合は翌年
-                        year = base_year + 1
-                    elif mail_received_date.month == 1 and month == 12:
-                        # 1月に受信して12月の日付を指定した場合は前年
-                        year = base_year - 1
-                    else:
-                        year = base_year
-                else:
-                    year = base_year
-                report_date = dt.date(year, month, day)
-                reports.append(("result", summary, report_date))
-            except ValueError:
-                print(f"  警告: 無効な日付 {month}/{day}")
-    
-    # 日付なしのパターン（後方互換性のため）
-    if not reports:
-        # #日報計画（日付なし）
-        for m in re.finditer(r"#日報計画\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)", text):
-            summary = m.group(1).strip()[:50]
-            if summary and not re.match(r"\d{1,2}/\d{1,2}", summary):
-                reports.append(("plan", summary, None))
-        
-        # #日報結果（日付なし）
-        for m in re.finditer(r"#日報結果\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)", text):
-            summary = m.group(1).strip()[:50]
-            if summary and not re.match(r"\d{1,2}/\d{1,2}", summary):
-                reports.append(("result", summary, None))
-        
-        # #日報（日付なし）
-        for m in re.finditer(r"#日報\s+(.+?)(?:\n|$)", text):
-            summary = m.group(1).strip()[:50]
-            if (summary and "計画" not in summary and
-                    "結果" not in summary and
-                    not re.match(r"\d{1,2}/\d{1,2}", summary)):
-                reports.append(("result", summary, None))
-    
-    return reports
-
-
-# ===== Outlook 取得 =====
-outlook = win32com.client.Dispatch("Outlook.Application")
-namespace = outlook.GetNamespace("MAPI")
-
-inbox = namespace.GetDefaultFolder(6)  # 6 = Inbox
-target_folder = None
-for f in inbox.Folders:
-    if f.Name == OUTLOOK_FOLDER:
-        target_folder = f
-        break
-
-if not target_folder:
-    raise RuntimeError(f"Outlook フォルダが見つかりません: {OUTLOOK_FOLDER}")
-
-processed = load_state()
-new_processed = set(processed)
-
-# ===== Excel 準備 =====
-print(f"Excelファイル: {EXCEL_PATH}")
-print(f"ファイル存在確認: {EXCEL_PATH.exists()}")
-print()
-
-if not EXCEL_PATH.exists():
-    raise RuntimeError(f"Excelファイルが見つかりません: {EXCEL_PATH}")
-
-try:
-    wb = load_workbook(EXCEL_PATH, keep_vba=True, data_only=False)
-except PermissionError:
-    print("=" * 80)
-    print("エラー: Excelファイルが開かれています")
-    print("=" * 80)
-    print()
-    print("解決方法:")
-    print("  1. Excelファイルを閉じてください")
-    print("  2. もう一度このスクリプトを実行してください")
-    print()
-    print(f"ファイルパス: {EXCEL_PATH}")
-    print("=" * 80)
-    exit(1)
-except Exception as e:
-    print("=" * 80)
-    print("エラー: Excelファイルの読み込みに失敗しました")
-    print("=" * 80)
-    print()
-    print(f"詳細: {type(e).__name__}: {e}")
-    print()
-    print(f"ファイルパス: {EXCEL_PATH}")
-    print("=" * 80)
-    exit(1)
-
-# 正しいシートを選択
-target_sheet = None
-for sheet_name in wb.sheetnames:
-    if SHEET_NAME_PATTERN in sheet_name:
-        target_sheet = sheet_name
-        break
-
-if target_sheet:
-    ws = wb[target_sheet]
-else:
-    ws = wb.active
-    print(f"警告: '{SHEET_NAME_PATTERN}'を含むシートが見つかりません。"
-          f"'{ws.title}'を使用します。")
-
-
-def find_row_by_date(ws, target_date):
-    for r in range(1, ws.max_row + 1):
-        v = ws[f"{DATE_COL}{r}"].value
-        if isinstance(v, (dt.date, dt.datetime)):
-            cell_date = v.date() if isinstance(v, dt.datetime) else v
-            if cell_date == target_date:
-                return r
-    return None
-
-
-# ===== メール処理 =====
-print(f"メール処理開始 (フォルダ: {OUTLOOK_FOLDER})")
-print(f"メール件数: {target_folder.Items.Count}")
-print()
-
-processed_count = 0
-new_count = 0
-
-for mail in target_folder.Items:
-    entry_id = mail.EntryID
-    
-    if entry_id in processed:
-        processed_count += 1
-        continue
-
-    # メールの受信日時を取得（デフォルト日付として使用）
-    default_date = mail.ReceivedTime
-    if isinstance(default_date, dt.datetime):
-        default_date = default_date.date()
-    else:
-        print("✗ スキップ: 受信日時を取得できません")
-        continue
-
-    body = mail.Body or ""
-    subject = mail.Subject or "(件名なし)"
-    reports = extract_daily_reports(body, default_date)
-
-    if reports:
-        print(f"✓ 処理: {subject[:50]}")
-        print(f"  抽出された項目: {len(reports)}件")
-        
-        # 日付ごとにグループ化して処理
-        date_groups = {}
-        for kind, summary, report_date in reports:
-            # 日付が指定されていない場合はメール受信日を使用
-            target_date = report_date if report_date else default_date
-            
-            if target_date not in date_groups:
-                date_groups[target_date] = []
-            date_groups[target_date].append((kind, summary))
-        
-        # 日付ごとにExcelに書き込み
-        for target_date, day_items in date_groups.items():
-            # メールの日付に対応する行を検索（日付表示行）
-            date_row = find_row_by_date(ws, target_date)
-            if date_row is None:
-                print(f"  ✗ スキップ: {target_date} の日付行が見つかりません")
-                continue
-            
-            # 実際の入力エリアは日付行の3行上から始まる
-            input_start_row = date_row - 3
-            
-            print(f"  日付: {target_date} (日付行: {date_row}, "
-                  f"入力開始行: {input_start_row})")
-            
-            # この日付ブロックの各列の次の空き行を追跡
-            plan_row_offset = 0  # 計画列は0行目から
-            result_row_offset = 0  # 結果列も0行目から
-            
-            for kind, summary in day_items:
-                print(f"    - {kind}: {summary}")
-                
-                if kind == "plan":
-                    # 計画列（C列）の空き行を探して書き込み
-                    written = False
-                    for offset in range(plan_row_offset, ROWS_PER_DAY):
-                        target_row = input_start_row + offset
-                        cell = ws[f"{PLAN_COL}{target_row}"]
-                        if not cell.value:
-                            cell.value = summary
-                            print(f"      → セル {PLAN_COL}{target_row} に書き込み")
-                            written = True
-                            plan_row_offset = offset + 1  # 次は次の行から
-                            break
-                    
-                    if not written:
-                        # 空き行がない場合は最後の行に追記
-                        target_row = input_start_row + ROWS_PER_DAY - 1
-                        cell = ws[f"{PLAN_COL}{target_row}"]
-                        if cell.value:
-                            cell.value = f"{cell.value}\n{summary}"
-                        else:
-                            cell.value = summary
-                        print(f"      → セル {PLAN_COL}{target_row} に追記"
-                              f"（空き行なし）")
-                        
-                elif kind == "result":
-                    # 結果列（F列）の空き行を探して書き込み
-                    written = False
-                    for offset in range(result_row_offset, ROWS_PER_DAY):
-                        target_row = input_start_row + offset
-                        cell = ws[f"{RESULT_COL}{target_row}"]
-                        if not cell.value:
-                            cell.value = summary
-                            print(f"      → セル {RESULT_COL}{target_row} に書き込み")
-                            written = True
-                            result_row_offset = offset + 1  # 次は次の行から
-                            break
-                    
-                    if not written:
-                        # 空き行がない場合は最後の行に追記
-                        target_row = input_start_row + ROWS_PER_DAY - 1
-                        cell = ws[f"{RESULT_COL}{target_row}"]
-                        if cell.value:
-                            cell.value = f"{cell.value}\n{summary}"
-                        else:
-                            cell.value = summary
-                        print(f"      → セル {RESULT_COL}{target_row} に追記"
-                              f"（空き行なし）")
-
-        new_processed.add(entry_id)
-        new_count += 1
-    else:
-        print(f"✗ スキップ: {subject[:50]}")
-        print("  理由: 日報タグまたは要約が見つかりません")
-
-print()
-print(f"処理結果: 新規 {new_count}件, スキップ済み {processed_count}件")
-print()
-
-# ===== 保存 =====
-try:
-    wb.save(EXCEL_PATH)
-    save_state(new_processed)
-    print("日報更新完了")
-except PermissionError:
-    print("=" * 80)
-    print("エラー: Excelファイルの保存に失敗しました")
-    print("=" * 80)
-    print()
-    print("原因: ファイルが他のプログラムで開かれています")
-    print()
-    print("解決方法:")
-    print("  1. Excelファイルを閉じてください")
-    print("  2. もう一度このスクリプトを実行してください")
-    print()
-    print(f"ファイルパス: {EXCEL_PATH}")
-    print("=" * 80)
-    print()
-    print("注意: メールは処理されましたが、Excelへの書き込みは完了していません")
-    exit(1)
-except Exception as e:
-    print("=" * 80)
-    print("エラー: Excelファイルの保存に失敗しました")
-    print("=" * 80)
-    print()
-    print(f"詳細: {type(e).__name__}: {e}")
-    print()
-    print(f"ファイルパス: {EXCEL_PATH}")
-    print("=" * 80)
-    exit(1)
+                    plan = drain.route()
+        except PermissionError as e:
+            print("=" * 80)
+            print("エラー: Excelファイルが開かれています")
+            print("=" * 80)
+            print()
+            print("解決方法:")
+            print("  1. Excelファイルを閉じてください")
+            print("  2. もう一度このスクリプトを実行してください")
+            print()
+            print(f"ファイルパス: {e.filename}")
+            print("=" * 80)
+            print_pending(spool, args.dry_run)
+            return 1
+        except Exception as e:
+            print("=" * 80)
+            print("エラー: Excelファイルの読み込みに失敗しました")
+            print("=" * 80)
+            print()
+            print(f"詳細: {type(e).__name__}: {e}")
+            print("=" * 80)
+            print_pending(spool, args.dry_run)
+            return 1
+
+        report.counters["entries_skipped"] = len(plan.skipped)
+
+        print()
+        print("書き込み計画:")
+        if carried:
+            print(f"  （前回までにスプールに残った {carried}件を含む）")
+        plan.print_summary()
+
+        print()
+        print(f"処理結果: 新規 {new_count}件, スキップ済み {processed_count}件 "
+              f"(メール件数: {enumerated_count}件)")
+        print(f"Outlook COM 呼び出し: {source.com_calls}回")
+        if source.prefiltered:
+            print(f"本文の取得を省略: {source.prefiltered}通（Outlook 側の絞り込みで #日報 を含まないメール）")
+        if targets:
+            print(f"本文取得・抽出: {len(targets)}通 / {extract_time:.2f}秒 "
+                  f"({len(targets) / max(extract_time, 1e-9):,.0f} 通/秒, jobs={jobs})")
+        print(f"Excel 読み込み: {pool.loads}冊")
+        if targets:
+            pipeline.print_stats()
+        print()
+
+        if args.dry_run:
+            print(plan.to_json())
+            pool.close()
+            print()
+            print("--dry-run のため Excel と処理済みIDは更新しません")
+            return 0
+
+        # ===== 保存 =====
+        # ブックごとにまとめて書き込み、変更したブックを1回ずつ保存する
+        try:
+            with report.stage("apply"):
+                report.counters["cells_written"] = drain.apply()
+            with report.stage("save"):
+                saved = pool.save_all()
+            for path in saved:
+                print(f"保存: {path}")
+            if not saved:
+                print("保存: なし（値が変わったセルはありません）")
+            with report.stage("state"):
+                # 書き込みの出所（再処理の重複防止と --undo に使う）と処理済みIDを記録し、スプールを完了にする
+                report.counters["entries_kept"] = drain.finish(state)
+            with report.stage("follow"):
+                session.follow(state, drain)
+            print_pending(spool.reload(), args.dry_run)
+            print(f"日報更新完了（実行ID: {report.run_id}）")
+            return 0
+        except PermissionError as e:
+            # 保存できたブックの項目だけ完了にし、残りはスプールに残す
+            drain.finish(state)
+            print("=" * 80)
+            print("エラー: Excelファイルの保存に失敗しました")
+            print("=" * 80)
+            print()
+            print("原因: ファイルが他のプログラムで開かれています")
+            print()
+            print("解決方法:")
+            print("  1. Excelファイルを閉じてください")
+            print("  2. もう一度このスクリプトを実行してください")
+            print()
+            print(f"ファイルパス: {e.filename}")
+            print("=" * 80)
+            print_pending(spool, args.dry_run)
+            return 1
+        except Exception as e:
+            print("=" * 80)
+            print("エラー: Excelファイルの保存に失敗しました")
+            print("=" * 80)
+            print()
+            print(f"詳細: {type(e).__name__}: {e}")
+            print("=" * 80)
+            print_pending(spool, args.dry_run)
+            return 1
+    finally:
+        if session is not None:
+            # ロックを持っている間にスプールへ追記された項目も書き込んでから離す
+            session.release(state, drain)
+            report.counters["entries_followed"] = session.followed
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
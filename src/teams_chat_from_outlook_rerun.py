@@ -3,30 +3,33 @@
 2月分など「特定期間だけ」Outlookの Teams日報フォルダーから再取り込みするための再実行用スクリプト。
 
 - 元の `src/teams_chat_from_outlook.py` は変更しません
-- 受信日(ReceivedTime)で期間フィルタします
-- `--reprocess` を指定すると、processed_mail_ids.json に載っているメールでも再処理します
+- 受信日(ReceivedTime)で期間フィルタします（Outlook 側の Items.Restrict で絞り込むため、
+  期間外のメールは取得しません）
+- `--reprocess` を指定すると、処理済みID（state_store.py）に載っているメールでも再処理します。
+  書き込みの出所（provenance.py）に同じメールから同じ内容を書き込んだ記録がある項目は書き込まず、
+  今回の抽出結果にない古い項目はセルから取り消してから書き込みます（重複して追記されません）
+- 抽出結果は Excel に書き込む前にスプール（write_spool.py）に保存します。Excel でブックが開かれていて
+  書き込めなかった項目は、次にいずれかのスクリプトを実行したときに書き込まれます。
+  別のプロセスがブックに書き込み中（ロック中）なら、項目はそのプロセスがまとめて書き込みます
+- `--source mirror` を指定すると、ローカルミラー（mail_mirror.py）から読むため Outlook は不要です
+- 書き込み先は実行日ではなく項目の報告日の月のブック・シートです（3月に2月分を再取り込みできます）
 
 使い方:
   python src\\teams_chat_from_outlook_rerun.py --since 2026-02-01 --until 2026-02-28 --reprocess
 
 注意:
-- 既にExcelに書き込まれている内容がある場合、重複して追記される可能性があります。
-  必要に応じて実行前にExcel(2月シート)の該当セルを確認してください。
+- 書き込みの出所の記録（write_provenance.jsonl）がない時期に書き込んだ内容は判別できないため、
+  重複して追記される可能性があります。必要に応じて実行前にExcel(2月シート)の該当セルを確認してください。
 """
 
 from __future__ import annotations
 
 import argparse
 import datetime as dt
-import json
 import os
-import re
+import time
 from pathlib import Path
 
-from dotenv import load_dotenv
-from openpyxl import load_workbook
-import win32com.client
-
 
 def parse_yyyy_mm_dd(s: str) -> dt.date:
     try:
@@ -37,159 +40,6 @@ def parse_yyyy_mm_dd(s: str) -> dt.date:
         ) from e
 
 
-def load_state(state_file: Path) -> set[str]:
-    if state_file.exists():
-        return set(json.loads(state_file.read_text(encoding="utf-8")))
-    return set()
-
-
-def save_state(state_file: Path, ids: set[str]) -> None:
-    state_file.write_text(
-        json.dumps(list(ids), ensure_ascii=False, indent=2), encoding="utf-8"
-    )
-
-
-def extract_daily_reports(text: str, mail_received_date: dt.date | None = None):
-    """return list of (kind, summary, date) tuples."""
-    if "Microsoft Teams" in text:
-        parts = text.split("Microsoft Teams")
-        if len(parts) > 1:
-            text = parts[-1]
-
-    reports: list[tuple[str, str, dt.date | None]] = []
-
-    base_year = mail_received_date.year if mail_received_date else dt.date.today().year
-
-    for m in re.finditer(
-        r"#日報計画\s+(\d{1,2})/(\d{1,2})\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)",
-        text,
-    ):
-        month = int(m.group(1))
-        day = int(m.group(2))
-        summary = m.group(3).strip()[:50]
-        if not summary:
-            continue
-        try:
-            year = base_year
-            if mail_received_date:
-                if mail_received_date.month == 12 and month == 1:
-                    year = base_year + 1
-                elif mail_received_date.month == 1 and month == 12:
-                    year = base_year - 1
-            report_date = dt.date(year, month, day)
-            reports.append(("plan", summary, report_date))
-        except ValueError:
-            print(f"  警告: 無効な日付 {month}/{day}")
-
-    for m in re.finditer(
-        r"#日報結果\s+(\d{1,2})/(\d{1,2})\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)",
-        text,
-    ):
-        month = int(m.group(1))
-        day = int(m.group(2))
-        summary = m.group(3).strip()[:50]
-        if not summary:
-            continue
-        try:
-            year = base_year
-            if mail_received_date:
-                if mail_received_date.month == 12 and month == 1:
-                    year = base_year + 1
-                elif mail_received_date.month == 1 and month == 12:
-                    year = base_year - 1
-            report_date = dt.date(year, month, day)
-            reports.append(("result", summary, report_date))
-        except ValueError:
-            print(f"  警告: 無効な日付 {month}/{day}")
-
-    for m in re.finditer(r"#日報\s+(\d{1,2})/(\d{1,2})\s+(.+?)(?:\n|$)", text):
-        month = int(m.group(1))
-        day = int(m.group(2))
-        summary = m.group(3).strip()[:50]
-        if summary and "計画" not in summary and "結果" not in summary:
-            try:
-                year = base_year
-                if mail_received_date:
-                    if mail_received_date.month == 12 and month == 1:
-                        year = base_year + 1
-                    elif mail_received_date.month == 1 and month == 12:
-                        year = base_year - 1
-                report_date = dt.date(year, month, day)
-                reports.append(("result", summary, report_date))
-            except ValueError:
-                print(f"  警告: 無効な日付 {month}/{day}")
-
-    if not reports:
-        for m in re.finditer(r"#日報計画\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)", text):
-            summary = m.group(1).strip()[:50]
-            if summary and not re.match(r"\d{1,2}/\d{1,2}", summary):
-                reports.append(("plan", summary, None))
-
-        for m in re.finditer(r"#日報結果\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)", text):
-            summary = m.group(1).strip()[:50]
-            if summary and not re.match(r"\d{1,2}/\d{1,2}", summary):
-                reports.append(("result", summary, None))
-
-        for m in re.finditer(r"#日報\s+(.+?)(?:\n|$)", text):
-            summary = m.group(1).strip()[:50]
-            if (
-                summary
-                and "計画" not in summary
-                and "結果" not in summary
-                and not re.match(r"\d{1,2}/\d{1,2}", summary)
-            ):
-                reports.append(("result", summary, None))
-
-    return reports
-
-
-def find_row_by_date(ws, date_col: str, target_date: dt.date):
-    for r in range(1, ws.max_row + 1):
-        v = ws[f"{date_col}{r}"].value
-        if isinstance(v, (dt.date, dt.datetime)):
-            cell_date = v.date() if isinstance(v, dt.datetime) else v
-            if cell_date == target_date:
-                return r
-    return None
-
-
-def resolve_excel_path(today: dt.date) -> Path:
-    year = today.year
-    month = today.month
-    fiscal_year = year if month >= 4 else year - 1
-
-    if month >= 4:
-        fiscal_month_num = month - 3
-    else:
-        fiscal_month_num = month + 9
-
-    month_folder = f"{fiscal_month_num:02d}_{month}月"
-    month_name = f"{month}月"
-
-    excel_path_template = os.getenv("EXCEL_PATH", "")
-    if excel_path_template:
-        excel_path_str = excel_path_template.format(
-            fiscal_year=fiscal_year, month_folder=month_folder, month_name=month_name
-        )
-        return Path(excel_path_str)
-
-    username = os.getenv("EXCEL_USERNAME") or os.getenv("USERNAME", "username")
-    company = os.getenv("EXCEL_COMPANY", "株式会社サンプル")
-    department = os.getenv("EXCEL_DEPARTMENT", "部署名-01.庶務事項")
-    category = os.getenv("EXCEL_CATEGORY", "業務管理")
-    base_folder = os.getenv("EXCEL_BASE_FOLDER", "業務内容報告書")
-    team = os.getenv("EXCEL_TEAM", "チームA")
-    user_name = os.getenv("EXCEL_USER_NAME", "山田太郎")
-
-    onedrive_base = f"C:\\Users\\{username}\\OneDrive - {company}"
-
-    return Path(
-        f"{onedrive_base}\\{department}\\{category}\\"
-        f"{base_folder}\\{fiscal_year}年度\\{month_folder}\\{team}\\"
-        f"（{month_name}_{user_name}）業務内容報告書.xlsm"
-    )
-
-
 def main() -> int:
     parser = argparse.ArgumentParser(
         description="OutlookのTeams日報フォルダーから特定期間だけ再取り込みしてExcelへ書き込みます"
@@ -203,80 +53,81 @@ def main() -> int:
         default=20,
         help="件数差異の切り分け用に、先頭N件の受信日/件名を表示します(0で無効)",
     )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Excelを読み取り専用で開き、書き込み計画(JSON)を表示するだけで保存しません",
+    )
+    parser.add_argument(
+        "--source",
+        help="メールの取得元: outlook / mirror / eml:<ディレクトリ> / mbox:<ファイル> / maildir:<ディレクトリ>"
+             "（省略時は環境変数 MAIL_SOURCE、未設定なら outlook）",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1,
+        help="本文からの日報抽出を N プロセスで並列に行います（0 で CPU 数、既定 1）",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="実行レポートと一緒に cProfile と tracemalloc のスナップショットを書き出します",
+    )
     args = parser.parse_args()
 
-    load_dotenv()
+    from run_report import run_with_report
 
-    outlook_folder = os.getenv("OUTLOOK_FOLDER", "Teams日報")
-    state_file = Path("processed_mail_ids.json")
+    return run_with_report("teams_chat_from_outlook_rerun", run, args, profile=args.profile)
 
-    date_col = os.getenv("DATE_COL", "B")
-    plan_col = os.getenv("PLAN_COL", "C")
-    result_col = os.getenv("RESULT_COL", "F")
-    rows_per_day = int(os.getenv("ROWS_PER_DAY", "6"))
 
-    today = dt.date.today()
-    excel_path = resolve_excel_path(today)
+def run(args, report) -> int:
+    # 引数の確認が済んでから読み込む（--help や引数の誤りはすぐ返す）
+    from import_pipeline import ImportPipeline
+    from mail_mirror import mirrored
+    from mail_source import open_mail_source, received_filter
+    from provenance import ProvenanceIndex
+    from settings import load_settings
+    from state_store import StateStore
+    from workbook_pool import WorkbookPool, excel_path_for
+    from write_plan import WritePlan
+    from write_spool import SpoolDrain, WorkbookSession, WriteSpool, mail_record, print_pending
 
+    settings = load_settings()
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    outlook_folder = settings.outlook_folder
+    mail_source = args.source or settings.mail_source
+
+    print(f"メールソース: {mail_source}")
     print(f"対象フォルダー: {outlook_folder}")
     print(f"対象期間    : {args.since} 〜 {args.until} (受信日 기준)")
     print(f"再処理      : {args.reprocess}")
-    print(f"Excel       : {excel_path}")
+    print(f"Excel       : {excel_path_for(args.since)} 〜 {excel_path_for(args.until)}")
     print()
 
-    if not excel_path.exists():
-        raise RuntimeError(f"Excelファイルが見つかりません: {excel_path}")
-
-    processed = load_state(state_file)
-    new_processed = set(processed)
+    state = StateStore(run_id=report.run_id)
+    print(f"処理済みID   : {state.path} ({len(state)}件)")
 
-    outlook = win32com.client.Dispatch("Outlook.Application")
-    namespace = outlook.GetNamespace("MAPI")
-    inbox = namespace.GetDefaultFolder(6)
-
-    target_folder = None
-    for f in inbox.Folders:
-        if f.Name == outlook_folder:
-            target_folder = f
-            break
-    if not target_folder:
-        raise RuntimeError(f"Outlook フォルダーが見つかりません: {outlook_folder}")
+    # EntryID / ReceivedTime / Subject は一括取得し、本文は未処理メールだけ取得する
+    # ミラーにある本文はミラーから読み、ない本文は取得してミラーへ保存する
+    # OUTLOOK_PREFILTER=dasl / searchfolder なら #日報 を含まないメールは Outlook 側で除外する
+    source = mirrored(open_mail_source(mail_source, outlook_folder, settings.mail_body_format,
+                                       settings.outlook_prefilter))
 
     # Outlook 側の診断情報（Store/フォルダパスが想定通りか確認する）
-    try:
-        store_name = target_folder.Store.DisplayName
-    except Exception:
-        store_name = "(unknown)"
-    try:
-        folder_path = target_folder.FolderPath
-    except Exception:
-        folder_path = "(unknown)"
-
-    print(f"Outlook Store : {store_name}")
-    print(f"FolderPath   : {folder_path}")
-
-    mail_items = target_folder.Items
-    # Items は並びが不定で取りこぼしが出ることがあるため、Sortして安定化してから走査する
-    try:
-        mail_items.Sort("[ReceivedTime]", True)  # True=降順
-    except Exception:
-        pass
-
-    print(f"Items.Count  : {mail_items.Count}")
+    with report.stage("connect"):
+        info = source.describe()
+    folder_count = info["count"]
+
+    print(f"Outlook Store : {info['store']}")
+    print(f"FolderPath   : {info['folder_path']}")
+    print(f"Items.Count  : {folder_count}")
+    if mail_source == "outlook":
+        print(f"Restrict     : {received_filter(args.since, args.until)}")
     print()
 
-    try:
-        wb = load_workbook(excel_path, keep_vba=True, data_only=False)
-    except PermissionError:
-        raise RuntimeError("Excelファイルが開かれています。閉じてから再実行してください。")
-
-    # 当月シート選択（元スクリプトと同じ「◯月」を含むシート優先）
-    sheet_name_pattern = f"{today.month}月"
-    ws = wb.active
-    for sheet_name in wb.sheetnames:
-        if sheet_name_pattern in sheet_name:
-            ws = wb[sheet_name]
-            break
+    # 報告日の月ごとのブックを必要になった時点で1回だけ開く
+    pool = WorkbookPool(*settings.columns, read_only=args.dry_run)
+    report.add_pool(pool)
 
     processed_count = 0
     new_count = 0
@@ -284,117 +135,200 @@ def main() -> int:
     enumerated_count = 0
 
     debug_rows: list[tuple[dt.date | None, str]] = []
-
-    for mail in mail_items:
+    plan = WritePlan()
+    new_mails = []
+    # 期間内・未処理のメール（本文の取得・抽出の対象）
+    targets = []
+
+    # 期間外のメールは Outlook 側で除外し、受信日時の降順で走査する
+    enumerate_started = time.perf_counter()
+    for mail in source.records(args.since, args.until):
         enumerated_count += 1
-        entry_id = mail.EntryID
-
-        received = mail.ReceivedTime
-        received_date: dt.date | None
-        if isinstance(received, dt.datetime):
-            received_date = received.date()
-        else:
-            received_date = None
+        entry_id = mail.entry_id
+        received_date = mail.received_date
+        subject = mail.subject
 
         if args.debug_list and len(debug_rows) < args.debug_list:
-            subject = (mail.Subject or "(件名なし)")
             debug_rows.append((received_date, subject))
 
         if received_date is None:
             continue
 
+        # Restrict 済みだが、フィルタ失敗時の全件走査に備えて範囲を再確認する
         if received_date < args.since or received_date > args.until:
             continue
         in_range_count += 1
 
-        if entry_id in processed and not args.reprocess:
+        if entry_id in state and not args.reprocess:
             processed_count += 1
             continue
-
-        body = mail.Body or ""
-        subject = mail.Subject or "(件名なし)"
-
-        reports = extract_daily_reports(body, received_date)
+        targets.append(mail)
+    report.add_time("enumerate", time.perf_counter() - enumerate_started)
+
+    # 本文はここで初めて EntryID 指定で取得する（--jobs 2 以上なら抽出だけを並列に行う）
+    # 抽出と並行して、書き込み先のブックを別スレッドで読み込んでおく
+    def handle(mail, reports, warnings):
+        nonlocal new_count
+        entry_id = mail.entry_id
+        received_date = mail.received_date
+        subject = mail.subject
+        print(warnings, end="")
         if not reports:
-            continue
+            return
 
         print(f"✓ 処理: {subject[:50]} ({received_date})")
 
-        # 日付ごとにグルーピング
-        date_groups: dict[dt.date, list[tuple[str, str]]] = {}
         for kind, summary, report_date in reports:
             target_date = report_date if report_date else received_date
-            date_groups.setdefault(target_date, []).append((kind, summary))
-
-        for target_date, day_items in date_groups.items():
-            date_row = find_row_by_date(ws, date_col, target_date)
-            if date_row is None:
-                print(f"  ✗ スキップ: {target_date} の日付行が見つかりません")
-                continue
-
-            input_start_row = date_row - 3
-
-            # その日付ブロック内で次の空き行を追跡
-            plan_row_offset = 0
-            result_row_offset = 0
-
-            for kind, summary in day_items:
-                if kind == "plan":
-                    written = False
-                    for offset in range(plan_row_offset, rows_per_day):
-                        r = input_start_row + offset
-                        cell = ws[f"{plan_col}{r}"]
-                        if not cell.value:
-                            cell.value = summary
-                            written = True
-                            plan_row_offset = offset + 1
-                            print(f"  → {target_date} plan: {plan_col}{r}")
-                            break
-                    if not written:
-                        r = input_start_row + rows_per_day - 1
-                        cell = ws[f"{plan_col}{r}"]
-                        cell.value = f"{cell.value}\n{summary}" if cell.value else summary
-                        print(f"  → {target_date} plan(追記): {plan_col}{r}")
+            plan.add(entry_id, kind, summary, target_date)
 
-                else:
-                    written = False
-                    for offset in range(result_row_offset, rows_per_day):
-                        r = input_start_row + offset
-                        cell = ws[f"{result_col}{r}"]
-                        if not cell.value:
-                            cell.value = summary
-                            written = True
-                            result_row_offset = offset + 1
-                            print(f"  → {target_date} result: {result_col}{r}")
-                            break
-                    if not written:
-                        r = input_start_row + rows_per_day - 1
-                        cell = ws[f"{result_col}{r}"]
-                        cell.value = f"{cell.value}\n{summary}" if cell.value else summary
-                        print(f"  → {target_date} result(追記): {result_col}{r}")
-
-    new_processed.add(entry_id)
-    new_count += 1
+        workbooks = {excel_path_for(report_date or received_date) for _, _, report_date in reports}
+        new_mails.append((mail, len(reports), workbooks))
+        new_count += 1
 
-    print()
-    print("--- Debug (先頭N件) ---")
-    if args.debug_list:
-        for d, subject in debug_rows:
-            ds = d.isoformat() if d else "(no date)"
-            print(f"{ds} | {subject[:80]}")
+    # 再処理では、書き込み済みの項目だけのブックは先読みしない（取り消しが必要なら route の前に開く）
+    provenance = ProvenanceIndex(run_id=report.run_id)
+    needs_workbook = None
+    if args.reprocess:
+        def needs_workbook(mail, kind, summary, target_date):
+            return not provenance.is_written(mail.entry_id, kind, target_date, summary)
+
+    pipeline = ImportPipeline(jobs=jobs, pool=pool, needs_workbook=needs_workbook)
+    try:
+        pipeline.run(targets, handle)
+    finally:
+        report.add_pipeline(pipeline)
+    # 本文の取得と抽出が終わるまでの時間（ブックの読み込みは並行して行うため含まない）
+    extract_time = pipeline.stats["parse"].elapsed
+
+    source.commit()
+    report.counters.update(
+        com_calls=source.com_calls, mails_seen=enumerated_count, mails_in_range=in_range_count,
+        mails_skipped=processed_count, mails_fetched=len(targets), mails_processed=new_count,
+        bodies_avoided=source.prefiltered, entries=sum(entries for _, entries, _ in new_mails),
+    )
+
+    # 再処理: 書き込み済みの項目は書き込まず、今回の抽出結果にない古い項目をセルから取り消す
+    # （出所の記録をハッシュで引くため、シートを読み直して重複を探す必要はない）
+    stale = []
+    if args.reprocess and targets:
+        with report.stage("reconcile"):
+            stale, duplicates = provenance.reconcile(plan, {mail.entry_id for mail in targets})
+        report.counters.update(entries_already_written=duplicates, entries_stale=len(stale))
+        print(f"書き込み済み       : {duplicates}件（書き込みません）")
+        print(f"取り消し対象       : {len(stale)}件")
+        for record in stale:
+            print(f"  - {Path(record['workbook']).name} {record['sheet']}!{record['cell']} "
+                  f"{record['date']} {record['kind']}: {record['text']}")
         print()
 
-    print("--- 集計 ---")
-    print(f"Items.Count        : {mail_items.Count}")
-    print(f"列挙できた件数     : {enumerated_count}")
-    print(f"期間内メール数     : {in_range_count}")
-    print(f"処理済みスキップ   : {processed_count}")
-    print(f"今回処理           : {new_count}")
-
-    wb.save(excel_path)
-    save_state(state_file, new_processed)
-    print("\n日報更新完了")
-    return 0
+    # Excel に触れる前に抽出結果（と取り消す記録）をスプールへ保存し、メールをスプール済みにする
+    # （ブックが開かれていて書き込めなくても、次回はメールの取得・抽出をやり直さない）
+    spool = WriteSpool(run_id=report.run_id)
+    carried = spool.entry_count()
+    if not args.dry_run:
+        with report.stage("spool"):
+            spool.add(plan.pending, [mail_record(mail.entry_id, mail.received, entries, workbooks)
+                                     for mail, entries, workbooks in new_mails],
+                      [record["w"] for record in stale])
+            for mail, entries, workbooks in new_mails:
+                state.add(mail.entry_id, received=mail.received, entries=entries, workbook=workbooks,
+                          spooled=True)
+            state.commit()
+    report.counters["entries_carried"] = carried
+
+    # 別のプロセスがブックに書き込み中なら、スプールした項目はそのプロセスがまとめて書き込む
+    session = None
+    if not args.dry_run:
+        session = WorkbookSession(pool, spool)
+        if not session.acquire():
+            pool.close()
+            print(f"\n他のプロセスが Excel に書き込み中です（{session.lock.path}）")
+            print(f"  スプールした項目（{spool.entry_count()}件）はそのプロセスがまとめて書き込みます")
+            return 0
+
+    # 取り消して空いたセルにも割り当てられるよう、振り分けより先に取り消す（SpoolDrain.route）
+    # 全メール分の項目を報告日のブック・シートに振り分け、空き行・追記に割り当てる
+    drain = SpoolDrain(pool, spool, provenance)
+    try:
+        try:
+            with report.stage("route"):
+                if args.dry_run:
+                    plan.route(pool)
+                else:
+                    plan = drain.route()
+        except PermissionError as e:
+            print_pending(spool, args.dry_run)
+            raise RuntimeError(f"Excelファイルが開かれています。閉じてから再実行してください: {e.filename}")
+        report.counters["cells_retracted"] = len(drain.retracted)
+        for record in drain.missing:
+            print(f"  ✗ 取り消せません（手作業で変更済み？）: {record['sheet']}!{record['cell']} {record['text']}")
+        if carried:
+            print(f"前回までにスプールに残った項目: {carried}件（一緒に書き込みます）")
+        report.counters["entries_skipped"] = len(plan.skipped)
+        print()
+        plan.print_summary()
+
+        print()
+        print("--- Debug (先頭N件) ---")
+        if args.debug_list:
+            for d, subject in debug_rows:
+                ds = d.isoformat() if d else "(no date)"
+                print(f"{ds} | {subject[:80]}")
+            print()
+
+        print("--- 集計 ---")
+        print(f"Items.Count        : {folder_count}")
+        print(f"列挙できた件数     : {enumerated_count}")
+        print(f"期間内メール数     : {in_range_count}")
+        print(f"処理済みスキップ   : {processed_count}")
+        print(f"今回処理           : {new_count}")
+        print(f"COM 呼び出し       : {source.com_calls}")
+        if source.prefiltered:
+            print(f"本文の取得を省略   : {source.prefiltered}通（#日報 を含まないメール）")
+        print(f"Excel 読み込み     : {pool.loads}冊")
+        if targets:
+            print(f"本文取得・抽出     : {len(targets)}通 / {extract_time:.2f}秒 "
+                  f"({len(targets) / max(extract_time, 1e-9):,.0f} 通/秒, jobs={jobs})")
+            print()
+            pipeline.print_stats()
+
+        if args.dry_run:
+            print()
+            print(plan.to_json())
+            pool.close()
+            if stale:
+                print("\n（取り消し対象のセルは --dry-run では取り消さないため、上の計画には反映されていません）")
+            print("\n--dry-run のため Excel と処理済みIDは更新しません")
+            return 0
+
+        with report.stage("apply"):
+            report.counters["cells_written"] = drain.apply()
+        try:
+            with report.stage("save"):
+                saved = pool.save_all()
+        except PermissionError as e:
+            # 保存できたブックの項目だけ完了にし、残りはスプールに残す
+            drain.finish(state)
+            print_pending(spool)
+            raise RuntimeError(f"Excelファイルが開かれています。閉じてから再実行してください: {e.filename}")
+        for path in saved:
+            print(f"保存: {path}")
+        if not saved:
+            print("保存: なし（値が変わったセルはありません）")
+        with report.stage("state"):
+            # 書き込みの出所と処理済みIDを記録し、スプールを完了にする
+            report.counters["entries_kept"] = drain.finish(state)
+        with report.stage("follow"):
+            session.follow(state, drain)
+        print_pending(spool.reload())
+        print(f"\n日報更新完了（実行ID: {report.run_id}、取り消しは python src/provenance.py --undo {report.run_id}）")
+        return 0
+    finally:
+        if session is not None:
+            # ロックを持っている間にスプールへ追記された項目も書き込んでから離す
+            session.release(state, drain)
+            report.counters["entries_followed"] = session.followed
 
 
 if __name__ == "__main__":
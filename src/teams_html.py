@@ -0,0 +1,265 @@
+"""
+Teams 通知メールの HTML 本文（HTMLBody）をメッセージごとに分ける
+
+テキストの本文（Body）では、複数のチャットメッセージをまとめた通知（ダイジェスト）でも
+最後の "Microsoft Teams" 以降しか見ないため、最後のメッセージ以外が失われ、
+日付なしのタグはメッセージの投稿日時ではなくメールの受信日時で書き込まれていた。
+
+HTML 本文は
+
+  - プレビュー（非表示のプリヘッダー）
+  - 見出し（"Microsoft Teams" など）
+  - メッセージごとの「投稿者 + 投稿日時」の行と本文
+  - フッター（"Teams で返信" などのリンク・通知設定・配信の説明）
+
+の順に並ぶ。split_messages() は HTML を FEED_CHUNK 文字ずつ HTMLParser に渡しながら
+ブロック要素ごとの行にし、投稿日時の行（datetime / data-time 属性を持つ要素、または
+「投稿者 2026/02/24 9:15」のような行）でメッセージを区切る。メッセージの後のフッターに
+達したら残りの HTML（配信の説明・スタイルなど）は解析しない。
+
+投稿日時の行が1つもない HTML（1通だけの共有メールなど）は、非表示のプリヘッダーを除いた
+全体を1つのメッセージ（投稿者・投稿日時なし）として返す。
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+
+from report_extractor import TEAMS_MARKER, resolve_year
+
+# HTMLParser に1回に渡す文字数（フッターに達したらそれ以降は渡さない）
+FEED_CHUNK = 8192
+
+# 投稿者として扱う行の最大文字数（本文の行を投稿者と誤認しないため）
+AUTHOR_MAX_LEN = 64
+
+# メッセージ部分の終わりを示すフッターの行（行頭で判定）
+FOOTER_MARKERS = (
+    "Teams で返信", "Teamsで返信", "Reply in Teams",
+    "Teams で会話に移動", "Teamsで会話に移動", "Go to conversation",
+    "Microsoft Teams を開く", "Microsoft Teamsを開く", "Open Microsoft Teams",
+    "通知の設定", "Notification settings", "このメールは", "This email was sent",
+)
+
+# 投稿日時を持つ属性（<time datetime="..."> など）
+TIMESTAMP_ATTRS = ("datetime", "data-time", "data-timestamp")
+
+_BLOCK_TAGS = {"br", "p", "div", "tr", "li", "table", "h1", "h2", "h3", "h4", "h5", "h6"}
+_CELL_TAGS = {"td", "th"}
+_VOID_TAGS = {"br", "img", "meta", "hr", "input", "link", "col", "area", "base", "wbr"}
+_HIDDEN_STYLE = re.compile(r"display\s*:\s*none|mso-hide\s*:\s*all", re.IGNORECASE)
+
+_BODY_START = re.compile(r"<body\b", re.IGNORECASE)
+_HTML_START = re.compile(r"\s*<(?:!doctype|html|head|body|meta|div|table|p)\b", re.IGNORECASE)
+
+# 「投稿者 日時」の行。日時は行末にある
+_WEEKDAY = r"(?:\s*[(（][^)）]{1,3}[)）])?"
+_HEADER_PATTERNS = (
+    re.compile(r"^(?P<author>.*?)\s*(?P<y>\d{4})[/-](?P<m>\d{1,2})[/-](?P<d>\d{1,2})"
+               + _WEEKDAY + r"\s+(?P<H>\d{1,2}):(?P<M>\d{2})\s*$"),
+    re.compile(r"^(?P<author>.*?)\s*(?P<y>\d{4})年(?P<m>\d{1,2})月(?P<d>\d{1,2})日"
+               + _WEEKDAY + r"\s*(?P<H>\d{1,2}):(?P<M>\d{2})\s*$"),
+    re.compile(r"^(?P<author>.*?)\s*(?<![\d/])(?P<m>\d{1,2})/(?P<d>\d{1,2})"
+               + _WEEKDAY + r"\s+(?P<H>\d{1,2}):(?P<M>\d{2})\s*$"),
+)
+# datetime 属性の要素に時刻だけが表示されている行（「山田 太郎 9:15」）の時刻部分
+_TRAILING_TIME = re.compile(r"\s*(?:午前|午後)?\s*\d{1,2}:\d{2}(?:\s*[AaPp][Mm])?\s*$")
+
+
+@dataclass
+class TeamsMessage:
+    """通知メールの中の1メッセージ。"""
+
+    author: str
+    sent: dt.datetime | None
+    text: str
+
+
+def is_html(body: str) -> bool:
+    """本文が HTML（HTMLBody・.eml の text/html）かどうか。"""
+    return bool(_HTML_START.match(body[:512]))
+
+
+def parse_timestamp(value: str) -> dt.datetime | None:
+    """datetime 属性などの ISO 8601 形式の日時をローカル時刻（tzinfo なし）にする。"""
+    value = value.strip()
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    try:
+        parsed = dt.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def parse_header(line: str, received_date: dt.date | None = None) -> tuple[str, dt.datetime] | None:
+    """
+    「投稿者 日時」の行なら (投稿者, 投稿日時) を返す（投稿者は空のこともある）。
+
+    年のない日時（2/24 9:15）の年は resolve_year() と同じく受信日から決める。
+    """
+    if "#" in line or len(line) > AUTHOR_MAX_LEN + 24:
+        return None
+    for pattern in _HEADER_PATTERNS:
+        m = pattern.match(line)
+        if not m:
+            continue
+        month, day = int(m.group("m")), int(m.group("d"))
+        year = int(m.group("y")) if "y" in pattern.groupindex else resolve_year(month, received_date)
+        try:
+            sent = dt.datetime(year, month, day, int(m.group("H")), int(m.group("M")))
+        except ValueError:
+            return None
+        return m.group("author").strip(), sent
+    return None
+
+
+class _RegionEnd(Exception):
+    """メッセージ部分の終わり（フッター）に達した。"""
+
+
+class _DigestParser(HTMLParser):
+    """HTML をブロック要素ごとの行にし、投稿日時の行でメッセージに分ける。"""
+
+    def __init__(self, received_date: dt.date | None):
+        super().__init__(convert_charrefs=True)
+        self.received_date = received_date
+        self.messages: list[TeamsMessage] = []
+        # 最初の投稿日時の行より前の行（投稿日時の行がなければ全体を1メッセージにする）
+        self.preamble: list[str] = []
+        self._lines: list[str] | None = None
+        self._parts: list[str] = []
+        self._line_time: dt.datetime | None = None
+        self._skip = 0
+        self._hidden: tuple[str, int] | None = None
+
+    # ----- 要素 -----
+    def handle_starttag(self, tag, attrs):
+        if self._hidden is not None:
+            if tag == self._hidden[0]:
+                self._hidden = (tag, self._hidden[1] + 1)
+            return
+        if tag in ("script", "style"):
+            self._skip += 1
+            return
+        attrs = dict(attrs)
+        if tag not in _VOID_TAGS and _HIDDEN_STYLE.search(attrs.get("style") or ""):
+            # プレビュー用の非表示のプリヘッダーなど
+            self._hidden = (tag, 1)
+            return
+        if tag in _BLOCK_TAGS:
+            self._end_line()
+        elif tag in _CELL_TAGS:
+            self._parts.append(" ")
+        for name in TIMESTAMP_ATTRS:
+            if attrs.get(name):
+                sent = parse_timestamp(attrs[name])
+                if sent is not None:
+                    self._line_time = sent
+                    break
+
+    def handle_endtag(self, tag):
+        if self._hidden is not None:
+            if tag == self._hidden[0]:
+                depth = self._hidden[1] - 1
+                self._hidden = (tag, depth) if depth else None
+            return
+        if tag in ("script", "style"):
+            if self._skip:
+                self._skip -= 1
+        elif tag in _BLOCK_TAGS:
+            self._end_line()
+        elif tag in _CELL_TAGS:
+            self._parts.append(" ")
+        elif tag == "body":
+            self._end_line()
+            raise _RegionEnd
+
+    def handle_data(self, data):
+        if not self._skip and self._hidden is None:
+            self._parts.append(data)
+
+    # ----- 行 -----
+    def _end_line(self) -> None:
+        line = " ".join("".join(self._parts).split())
+        sent, self._line_time = self._line_time, None
+        self._parts = []
+        if not line and sent is None:
+            return
+
+        header = None
+        if sent is not None:
+            # datetime 属性を持つ要素の行: 属性の日時を使い、行の文字列から日時らしい部分を除いて投稿者にする
+            parsed = parse_header(line, self.received_date)
+            header = (parsed[0] if parsed else _TRAILING_TIME.sub("", line), sent)
+        elif line:
+            header = parse_header(line, self.received_date)
+
+        if header is not None:
+            author, sent = header
+            current = self._lines if self._lines is not None else self.preamble
+            if not author and current:
+                # 投稿者と日時が別の行の場合は直前の行を投稿者にする
+                author = current.pop()
+            self._finish_message()
+            self._lines = []
+            self.messages.append(TeamsMessage(author, sent, ""))
+            return
+
+        if self._lines is None:
+            self.preamble.append(line)
+            return
+        if line == TEAMS_MARKER:
+            # メッセージごとのカードの見出し（テキストの本文で最後のメッセージ以外が失われていた原因）
+            return
+        if line.startswith(FOOTER_MARKERS):
+            raise _RegionEnd
+        self._lines.append(line)
+
+    def _finish_message(self) -> None:
+        """直前のメッセージの本文を確定する。"""
+        if self.messages:
+            self.messages[-1].text = "\n".join(self._lines or [])
+
+    def close(self):
+        super().close()
+        self._end_line()
+
+
+def parse_digest(html: str, received_date: dt.date | None = None) -> tuple[list[TeamsMessage], int]:
+    """
+    split_messages() の本体。メッセージと、解析した HTML の文字数を返す
+    （フッターに達した場合は len(html) より小さい）。
+    """
+    parser = _DigestParser(received_date)
+    # <head>（スタイル・メタ情報）は解析しない
+    body = _BODY_START.search(html)
+    offset = body.start() if body else 0
+    consumed = 0
+    try:
+        for start in range(offset, len(html), FEED_CHUNK):
+            chunk = html[start:start + FEED_CHUNK]
+            consumed += len(chunk)
+            parser.feed(chunk)
+        parser.close()
+    except _RegionEnd:
+        pass
+    parser._finish_message()
+    if parser.messages:
+        return parser.messages, consumed
+    return [TeamsMessage("", None, "\n".join(parser.preamble))], consumed
+
+
+def split_messages(html: str, received_date: dt.date | None = None) -> list[TeamsMessage]:
+    """
+    Teams 通知メールの HTML 本文をメッセージ（投稿者・投稿日時・本文）に分ける。
+
+    投稿日時の行がなければ、非表示の要素を除いた全体を1つのメッセージ（sent=None）で返す。
+    received_date は年のない投稿日時の年を決めるのに使う。
+    """
+    return parse_digest(html, received_date)[0]
@@ -0,0 +1,405 @@
+"""
+報告日ごとのワークブック振り分けとワークブックプール
+
+旧実装は EXCEL_PATH と SHEET_NAME_PATTERN を実行日（dt.date.today()）から1回だけ
+決めていたため、4/1 に投稿された「#日報結果 3/31」や、3月に実行した
+「--since 2026-02-01」の再取り込みは別の月のブックを探して
+「日付行が見つかりません」でスキップされていた。
+
+ここでは項目ごとに報告日から
+
+  - 年度フォルダー・月フォルダー・ファイル名（excel_path_for）
+  - シート（「◯月」を含むシート）
+
+を決める。WorkbookPool は実行中に必要になったブックだけを1回ずつ開き、
+シートごとの SheetIndex と一緒に LRU で保持する（上限 WORKBOOK_POOL_SIZE）。
+変更したブックは最後に save_all() で1回だけ保存する（上限を超えて追い出す場合はその時点で保存）。
+ブックは項目の書き込み先として必要になるまで開かず、値が変わったセルがないブックは保存しない
+（新規 0件の定期実行では読み込みも保存も OneDrive への再アップロードも起きない）。
+保存はローカルの一時ファイルに書いてから対象のファイルを置き換える（save_atomic）。
+
+ブックは OneDrive の同期フォルダーにあり、読み込みから保存までの間に同期クライアントや同僚が
+ファイルを書き換えることがある（そのまま保存すると相手の変更が消える）。読み込み時にファイルの
+mtime・サイズ・内容のハッシュを記録し、保存の直前に変わっていれば（内容が同じで mtime だけが
+変わった場合を除く）、ファイルを読み込み直してこの実行の書き込みだけを再適用してから保存する
+（楽観的排他制御。書き込みは PooledBook.on_rebase() で登録した再適用の処理を順に呼び直す）。
+MAX_REBASE 回続けて変わっていれば WorkbookConflictError（PermissionError）で保存を諦める。
+
+EXCEL_ENGINE=patch のときは openpyxl の代わりに xlsx_patch.XlsxPatchWorkbook で開き、
+対象シートのセルと共有文字列だけを書き換えて保存する（VBA などほかのパーツはバイト単位でそのまま）。
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from sheet_index import SheetIndex
+
+DEFAULT_POOL_SIZE = 4
+# openpyxl: 全体を読み込んで保存 / patch: 対象シートだけ書き換え（xlsx_patch.py）
+DEFAULT_ENGINE = "openpyxl"
+# 保存の直前にファイルが外部で変更されていた場合に、読み込み直して再適用する回数の上限
+MAX_REBASE = 3
+
+
+def fiscal_parts(day: dt.date) -> dict:
+    """day の年度・月フォルダー名・ファイル名の月部分（EXCEL_PATH のテンプレート変数）。"""
+    month = day.month
+    # 年度計算（4月始まり）
+    fiscal_year = day.year if month >= 4 else day.year - 1
+    # 年度内の月番号（4月=01, 5月=02, ..., 12月=09, 1月=10, 2月=11, 3月=12）
+    fiscal_month_num = month - 3 if month >= 4 else month + 9
+    return {
+        "fiscal_year": fiscal_year,
+        "month_folder": f"{fiscal_month_num:02d}_{month}月",
+        "month_name": f"{month}月",
+    }
+
+
+def excel_path_for(day: dt.date) -> Path:
+    """day の日報を書き込むブックのパス（EXCEL_PATH またはテンプレート要素から生成）。"""
+    parts = fiscal_parts(day)
+
+    # 環境変数 EXCEL_PATH が設定されていればそれを使用
+    excel_path_template = os.getenv("EXCEL_PATH", "")
+    if excel_path_template:
+        return Path(excel_path_template.format(**parts))
+
+    username = os.getenv("EXCEL_USERNAME") or os.getenv("USERNAME", "username")
+    company = os.getenv("EXCEL_COMPANY", "株式会社サンプル")
+    department = os.getenv("EXCEL_DEPARTMENT", "部署名-01.庶務事項")
+    category = os.getenv("EXCEL_CATEGORY", "業務管理")
+    base_folder = os.getenv("EXCEL_BASE_FOLDER", "業務内容報告書")
+    team = os.getenv("EXCEL_TEAM", "チームA")
+    user_name = os.getenv("EXCEL_USER_NAME", "山田太郎")
+
+    # OneDriveベースパス
+    onedrive_base = f"C:\\Users\\{username}\\OneDrive - {company}"
+
+    return Path(
+        f"{onedrive_base}\\{department}\\{category}\\"
+        f"{base_folder}\\{parts['fiscal_year']}年度\\{parts['month_folder']}\\{team}\\"
+        f"（{parts['month_name']}_{user_name}）業務内容報告書.xlsm"
+    )
+
+
+def select_sheet(wb, month: int):
+    """
+    month のシートを返す。
+
+    シート名が「◯月」と一致するシート、なければ「◯月」を含む最初のシート
+    （「1月」で「11月」を拾わないよう一致を優先）、どちらもなければアクティブシート。
+    """
+    pattern = f"{month}月"
+    if pattern in wb.sheetnames:
+        return wb[pattern]
+    for sheet_name in wb.sheetnames:
+        if pattern in sheet_name:
+            return wb[sheet_name]
+    ws = wb.active
+    print(f"警告: '{pattern}'を含むシートが見つかりません。'{ws.title}'を使用します。")
+    return ws
+
+
+def file_signature(path: Path) -> tuple[int, int] | None:
+    """外部での変更検知用の (mtime_ns, size)。ファイルがなければ None。"""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def file_digest(path: Path) -> str | None:
+    """ファイルの内容の SHA-256（16進）。ファイルがなければ None。"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+class WorkbookConflictError(PermissionError):
+    """
+    保存の直前にブックが外部で変更されていて、読み込み直して再適用しても MAX_REBASE 回続けて変わっていた。
+
+    ブックが開かれていて保存できない場合と同じく、呼び出し側は保存できたブックの分だけ完了にし、
+    残りはスプールに残す（PermissionError として扱う）。
+    """
+
+
+def save_atomic(wb, path: Path) -> None:
+    """
+    wb をローカルの一時ディレクトリに保存してから path を置き換える。
+
+    同期フォルダー（OneDrive）に書きかけのファイルが現れず、保存の途中で失敗しても元のブックは壊れない。
+    一時ディレクトリが別のドライブで置き換えられない場合は、path と同じフォルダーの一時ファイルを経由する。
+    path が Excel で開かれている場合は PermissionError をそのまま送出する。
+    """
+    fd, name = tempfile.mkstemp(prefix=f"~{path.stem}.", suffix=path.suffix)
+    os.close(fd)
+    tmp = Path(name)
+    try:
+        wb.save(tmp)
+        if path.exists():
+            shutil.copymode(path, tmp)
+        try:
+            os.replace(tmp, path)
+        except PermissionError:
+            raise
+        except OSError as e:
+            # ERROR_NOT_SAME_DEVICE (Windows) / EXDEV
+            if e.errno != errno.EXDEV and getattr(e, "winerror", None) != 17:
+                raise
+            local = path.with_name(f"~{path.name}.{os.getpid()}.tmp")
+            try:
+                shutil.copyfile(tmp, local)
+                os.replace(local, path)
+            finally:
+                local.unlink(missing_ok=True)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+class PooledBook:
+    """プール内の1冊（ワークブックとシートごとの SheetIndex）。"""
+
+    def __init__(self, path: Path, wb, pool: WorkbookPool, signature=None, digest: str | None = None):
+        self.path = path
+        self.wb = wb
+        self._dirty = False
+        # 読み込み時（保存後は保存時）のファイルの状態 (mtime_ns, サイズ) と内容のハッシュ
+        self.signature = signature
+        self.digest = digest
+        self._pool = pool
+        self._indexes: dict[str, SheetIndex] = {}
+        self._titles: dict[int, str] = {}
+        # 保存前にファイルが外部で変更されていた場合に、読み込み直したブックへ書き込みを再適用する処理
+        self._rebase_ops: list = []
+
+    def on_rebase(self, op) -> None:
+        """
+        op(book) を登録する。保存の直前にファイルが外部で変更されていたら、読み込み直した後に
+        登録順に呼び直す（保存できたら登録を消す）。op は書き込み先を読み込み直した内容から決め直すこと。
+        """
+        self._rebase_ops.append(op)
+
+    def changed_on_disk(self) -> bool:
+        """読み込んだ後（保存後は保存した後）にファイルの内容が外部で変更されたか。"""
+        signature = file_signature(self.path)
+        if signature == self.signature:
+            return False
+        if signature is not None and self.digest is not None and file_digest(self.path) == self.digest:
+            # 同期クライアントが mtime だけを更新した場合など、内容は同じ
+            self.signature = signature
+            return False
+        return True
+
+    def _reset(self, wb, signature, digest) -> None:
+        """読み込み直したワークブックに差し替える（シートの走査と未保存の変更は捨てる）。"""
+        self.wb.close()
+        self.wb = wb
+        self.signature, self.digest = signature, digest
+        self._dirty = False
+        self._indexes.clear()
+        self._titles.clear()
+
+    @property
+    def dirty(self) -> bool:
+        """未保存の変更があるか（SheetIndex で値が変わったセルがあるか、明示的に設定されたか）。"""
+        return self._dirty or any(index.changed for index in self._indexes.values())
+
+    @dirty.setter
+    def dirty(self, value: bool) -> None:
+        self._dirty = value
+        if not value:
+            for index in self._indexes.values():
+                index.changed = 0
+
+    def index_for(self, day: dt.date) -> SheetIndex:
+        """day の月のシートの SheetIndex（初回だけシートを走査する）。"""
+        title = self._titles.get(day.month)
+        if title is None:
+            title = self._titles[day.month] = select_sheet(self.wb, day.month).title
+        return self.sheet_index(title)
+
+    def sheet_index(self, title: str) -> SheetIndex:
+        index = self._indexes.get(title)
+        if index is None:
+            started = time.perf_counter()
+            index = self._indexes[title] = SheetIndex(self.wb[title], *self._pool.columns,
+                                                      self._pool.rows_per_day)
+            self._pool.scan_time += time.perf_counter() - started
+        return index
+
+
+class WorkbookPool:
+    """実行中に開いたワークブックの LRU プール。"""
+
+    def __init__(self, date_col: str, plan_col: str, result_col: str, rows_per_day: int,
+                 read_only: bool = False, max_open: int | None = None, watch: bool = False):
+        self.columns = (date_col, plan_col, result_col)
+        self.rows_per_day = rows_per_day
+        self.read_only = read_only
+        # True: open() のたびにファイルの mtime / サイズを確認し、外部で変更されていれば読み込み直す
+        # （常駐プロセスでブックを開いたままにする場合）
+        self.watch = watch
+        if max_open is None:
+            max_open = int(os.getenv("WORKBOOK_POOL_SIZE", str(DEFAULT_POOL_SIZE)))
+        self.max_open = max(1, max_open)
+        self.engine = os.getenv("EXCEL_ENGINE", DEFAULT_ENGINE).strip().lower()
+        if self.engine not in ("openpyxl", "patch"):
+            raise ValueError(f"EXCEL_ENGINE が不正です: {self.engine}（openpyxl / patch）")
+        self._books: OrderedDict[Path, PooledBook] = OrderedDict()
+        self.loads = 0
+        # 保存の直前の外部での変更に対して読み込み直して再適用した回数
+        self.rebases = 0
+        # 保存したブック（上限を超えて追い出したときの保存も含む）
+        self.saved: list[Path] = []
+        # 実行レポート用: 読み込み・シート走査・保存の合計時間（秒）と、ブックごとの (読み込み時, 保存後) のサイズ
+        self.load_time = 0.0
+        self.scan_time = 0.0
+        self.save_time = 0.0
+        self.sizes: dict[Path, list[int | None]] = {}
+
+    def get(self, day: dt.date) -> PooledBook | None:
+        """day の日報を書き込むブック。ファイルがなければ None。"""
+        return self.open(excel_path_for(day))
+
+    def open(self, path: Path) -> PooledBook | None:
+        """
+        path のブックをプールから返す（なければ読み込む）。ファイルがなければ None。
+
+        読み込みの PermissionError などはそのまま呼び出し側へ送出する。
+        """
+        book = self._books.get(path)
+        if book is not None and self.watch and book.signature != file_signature(path):
+            print(f"外部で変更されたため再読み込みします: {path}")
+            self.discard(path)
+            book = None
+        if book is not None:
+            self._books.move_to_end(path)
+            return book
+        if not path.exists():
+            return None
+
+        while len(self._books) >= self.max_open:
+            self._evict()
+
+        print(f"Excelファイル: {path}")
+        wb, signature, digest = self._read(path)
+        book = self._books[path] = PooledBook(path, wb, self, signature, digest)
+        self.sizes.setdefault(path, [book.signature and book.signature[1], None])
+        return book
+
+    def _read(self, path: Path):
+        """path を読み込み、(ワークブック, 読み込み前のファイルの状態, 内容のハッシュ) を返す。"""
+        started = time.perf_counter()
+        # 読み込みの途中で変更された場合に保存前に気付けるよう、状態は読み込む前に記録する
+        signature = file_signature(path)
+        # 読み取り専用のプールは保存しないのでハッシュは不要
+        digest = None if self.read_only else file_digest(path)
+        wb = self._load(path)
+        self.load_time += time.perf_counter() - started
+        self.loads += 1
+        return wb, signature, digest
+
+    def _load(self, path: Path):
+        if self.engine == "patch":
+            from xlsx_patch import XlsxPatchWorkbook
+
+            try:
+                return XlsxPatchWorkbook(path)
+            except (RuntimeError, KeyError, ValueError) as e:
+                # ZIP64 など patch エンジンで扱えないブックは openpyxl で開き直す
+                print(f"警告: patch エンジンで開けないため openpyxl を使用します: {e}")
+        from openpyxl import load_workbook
+
+        if self.read_only:
+            # 書き込み計画の表示だけなので読み取り専用で開く（保存もしない）
+            return load_workbook(path, read_only=True, data_only=False)
+        return load_workbook(path, keep_vba=path.suffix.lower() == ".xlsm", data_only=False)
+
+    def _evict(self) -> None:
+        _, book = self._books.popitem(last=False)
+        self.save(book)
+        book.wb.close()
+
+    def save(self, book: PooledBook) -> None:
+        """book に変更があれば保存する（読み取り専用のプールでは何もしない）。"""
+        if book.dirty and not self.read_only:
+            for attempt in range(MAX_REBASE + 1):
+                if not book.changed_on_disk():
+                    break
+                if attempt == MAX_REBASE:
+                    raise WorkbookConflictError(
+                        errno.EBUSY, "保存の直前に外部で変更され続けたため保存できません", str(book.path))
+                self._rebase(book)
+            if not book.dirty:
+                # 再適用した書き込みがすべて外部の変更に含まれていた
+                return
+            started = time.perf_counter()
+            save_atomic(book.wb, book.path)
+            self.save_time += time.perf_counter() - started
+            book.dirty = False
+            book.signature = file_signature(book.path)
+            book.digest = file_digest(book.path)
+            book._rebase_ops.clear()
+            self.saved.append(book.path)
+            self.sizes.setdefault(book.path, [None, None])[1] = book.signature and book.signature[1]
+
+    def _rebase(self, book: PooledBook) -> None:
+        """外部で変更された book のファイルを読み込み直し、この実行の書き込みを再適用する。"""
+        print(f"保存の直前に外部で変更されていたため、読み込み直して書き込みを再適用します: {book.path}")
+        book._reset(*self._read(book.path))
+        for op in book._rebase_ops:
+            op(book)
+        self.rebases += 1
+
+    def save_all(self) -> list[Path]:
+        """変更したブックを1回ずつ保存し、この実行で保存した全パスを返す。"""
+        for book in self._books.values():
+            self.save(book)
+        return list(self.saved)
+
+    def paths(self) -> list[Path]:
+        """開いているブックのパス（古い順）。"""
+        return list(self._books)
+
+    def unsaved(self) -> list[Path]:
+        """開いているブックのうち、保存していない変更があるもののパス。"""
+        return [path for path, book in self._books.items() if book.dirty]
+
+    def refresh(self) -> list[Path]:
+        """
+        開いているブックのうち、読み込んだ後にファイルが外部で変更されたものを閉じ（次の open() で読み込み直す）、
+        閉じたパスを返す。ブックのロックを取る前に読み込んだ内容で上書きしないため（write_spool.WorkbookSession）。
+        """
+        changed = [path for path, book in self._books.items() if book.changed_on_disk()]
+        for path in changed:
+            print(f"外部で変更されたため再読み込みします: {path}")
+            self.discard(path)
+        return changed
+
+    def discard(self, path: Path) -> None:
+        """path のブックを保存せずに閉じる（未保存の変更は捨てる）。"""
+        book = self._books.pop(path, None)
+        if book is not None:
+            book.wb.close()
+
+    def close(self) -> None:
+        """保存せずに全ブックを閉じる。"""
+        for book in self._books.values():
+            book.wb.close()
+        self._books.clear()
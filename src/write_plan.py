@@ -0,0 +1,242 @@
+"""
+Excel 書き込み計画（WritePlan）
+
+旧実装はメールごとに ws[f"{col}{row}"] で直接セルへ書き込み、空き行がなければ
+最終行へ "\n" 付きで何度も追記していた。WritePlan では
+
+  1. 実行中に抽出した全項目を add() で集める
+  2. resolve() で シート → 日付ブロック → 列 ごとにまとめ、空き枠と追記を一括で決める
+  3. apply() で確定したセル編集を行・列順に1回で書き込む
+
+の3段階に分ける。resolve() は SheetIndex を読むだけなので、読み取り専用で
+開いたワークブックでも計画を作成でき、to_dict() / to_json() で --dry-run 表示できる。
+
+route() / apply_pool() は WorkbookPool を使い、項目ごとに報告日の月のブック・シートへ
+振り分けて resolve() / apply() する（ブックごとに1回読み込み、1回保存）。
+保存の直前にブックが外部で変更されていれば、プールが読み込み直したブックに rebase() で割り当て直す。
+
+割り当て結果は旧実装（1件ずつ先頭の空き行へ書き込み、なければ最終行へ追記）と同じ。
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sheet_index import DATE_OFFSET, SheetIndex
+from workbook_pool import WorkbookPool, excel_path_for
+
+# route() で書き込み先のブックが存在しなかった項目の skipped 理由
+MISSING_WORKBOOK = "Excelファイルが見つかりません"
+
+
+@dataclass
+class PlanEntry:
+    """抽出された1項目（どのメールの、どの日付の、計画/結果か）。"""
+
+    entry_id: str
+    kind: str
+    summary: str
+    date: dt.date
+    # 日付ブロック内で書き込みを始める行（daily_report_writer.py の結果は2行目から）
+    start_offset: int = 0
+
+    def to_dict(self) -> dict:
+        data = {
+            "entry_id": self.entry_id,
+            "kind": self.kind,
+            "summary": self.summary,
+            "date": self.date.isoformat(),
+        }
+        if self.start_offset:
+            data["start_offset"] = self.start_offset
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> PlanEntry:
+        return cls(data["entry_id"], data["kind"], data["summary"],
+                   dt.date.fromisoformat(data["date"]), data.get("start_offset", 0))
+
+
+@dataclass
+class CellEdit:
+    """1セルに対する確定済みの編集。"""
+
+    sheet: str
+    row: int
+    column: str
+    kind: str
+    date: dt.date
+    value: str
+    append: bool
+    entries: list[PlanEntry] = field(default_factory=list)
+    workbook: str = ""
+
+    @property
+    def coord(self) -> str:
+        return f"{self.column}{self.row}"
+
+    def to_dict(self) -> dict:
+        return {
+            "workbook": self.workbook,
+            "sheet": self.sheet,
+            "cell": self.coord,
+            "kind": self.kind,
+            "date": self.date.isoformat(),
+            "value": self.value,
+            "append": self.append,
+            "entries": [e.to_dict() for e in self.entries],
+        }
+
+
+class WritePlan:
+    """実行全体の書き込み計画。"""
+
+    def __init__(self):
+        self.pending: list[PlanEntry] = []
+        self.edits: list[CellEdit] = []
+        self.skipped: list[tuple[PlanEntry, str]] = []
+        # route() で指定した開始位置（rebase() で割り当て直すときに使う）
+        self.start_offset = 0
+
+    def add(self, entry_id: str, kind: str, summary: str, target_date: dt.date) -> None:
+        self.pending.append(PlanEntry(entry_id, kind, summary, target_date))
+
+    def resolve(self, index: SheetIndex, start_offset: int = 0, workbook: str = "") -> None:
+        """
+        保留中の項目を index のシートに割り当てる（workbook は編集に記録するブックのパス）。
+
+        日付ブロック・列ごとに空き行へ先着順で割り当て、溢れた分は
+        ブロック最終行にまとめて追記する。日付行がない項目は skipped に入れる。
+        項目の start_offset が start_offset より大きければ、その項目はその行以降に割り当てる。
+        """
+        # (日付行, kind) → 項目（追加順を保持）
+        groups: dict[tuple[int, str], list[PlanEntry]] = {}
+        for entry in self.pending:
+            date_row = index.find_row(entry.date)
+            if date_row is None:
+                self.skipped.append((entry, "日付行が見つかりません"))
+                continue
+            groups.setdefault((date_row, entry.kind), []).append(entry)
+        self.pending = []
+
+        for (date_row, kind), entries in groups.items():
+            column = index.columns[kind]
+            free = index.free_rows(date_row, kind, start_offset)
+            input_start_row = date_row - DATE_OFFSET
+            placed = {}
+            overflow = []
+            for entry in entries:
+                row = next((r for r in free if r - input_start_row >= entry.start_offset), None)
+                if row is None:
+                    overflow.append(entry)
+                    continue
+                free.remove(row)
+                placed[row] = CellEdit(index.title, row, column, kind, entry.date,
+                                       entry.summary, False, [entry], workbook)
+
+            if overflow:
+                last = index.last_row(date_row)
+                edit = placed.get(last)
+                if edit is None:
+                    current = index.value(kind, last)
+                    edit = CellEdit(index.title, last, column, kind, overflow[0].date,
+                                    str(current) if current else "", True, workbook=workbook)
+                    placed[last] = edit
+                texts = [edit.value] if edit.value else []
+                texts.extend(e.summary for e in overflow)
+                edit.value = "\n".join(texts)
+                edit.entries.extend(overflow)
+                edit.append = True
+
+            self.edits.extend(placed.values())
+
+    def route(self, pool: WorkbookPool, start_offset: int = 0) -> None:
+        """
+        保留中の項目を報告日ごとのブック・シートに振り分けて割り当てる。
+
+        ブックが存在しない項目は skipped に入れる。
+        """
+        self.start_offset = start_offset
+        # ブックごとにまとめてから開くので、各ブックの読み込みは1回で済む
+        by_path: dict[Path, list[PlanEntry]] = {}
+        for entry in self.pending:
+            by_path.setdefault(excel_path_for(entry.date), []).append(entry)
+        self.pending = []
+
+        for path, entries in by_path.items():
+            book = pool.open(path)
+            if book is None:
+                self.skipped.extend((entry, MISSING_WORKBOOK) for entry in entries)
+                continue
+            # シート → 項目（追加順を保持）
+            by_sheet: dict[str, list[PlanEntry]] = {}
+            for entry in entries:
+                by_sheet.setdefault(book.index_for(entry.date).title, []).append(entry)
+            for title, sheet_entries in by_sheet.items():
+                self.pending = sheet_entries
+                self.resolve(book.sheet_index(title), start_offset, str(path))
+        self.pending = []
+
+    def apply(self, index: SheetIndex, workbook: str | None = None) -> int:
+        """確定済みの編集を行・列順に書き込み、書き込んだセル数を返す。"""
+        edits = sorted(
+            (e for e in self.edits
+             if e.sheet == index.title and (workbook is None or e.workbook == workbook)),
+            key=lambda e: (e.row, e.column),
+        )
+        for edit in edits:
+            index.set_value(edit.kind, edit.row, edit.value)
+        return len(edits)
+
+    def apply_pool(self, pool: WorkbookPool) -> int:
+        """route() で確定した編集をブックごとにまとめて書き込み、書き込んだセル数を返す。"""
+        targets = sorted({(e.workbook, e.sheet) for e in self.edits})
+        count = 0
+        for workbook, sheet in targets:
+            book = pool.open(Path(workbook))
+            count += self.apply(book.sheet_index(sheet), workbook)
+        for workbook in sorted({workbook for workbook, _ in targets}):
+            # 保存の直前にブックが外部で変更されていたら、読み込み直した内容に割り当て直す
+            pool.open(Path(workbook)).on_rebase(self.rebase)
+        return count
+
+    def rebase(self, book) -> int:
+        """
+        book に割り当てた項目を、読み込み直した book に割り当て直して書き込む（WorkbookPool の再適用）。
+
+        edits の該当ブックの編集は置き換わる（出所の記録は割り当て直した後のセルになる）。書き込んだセル数を返す。
+        """
+        workbook = str(book.path)
+        mine = sorted((e for e in self.edits if e.workbook == workbook), key=lambda e: (e.sheet, e.row, e.column))
+        self.edits = [e for e in self.edits if e.workbook != workbook]
+        by_sheet: dict[str, list[PlanEntry]] = {}
+        for entry in (entry for edit in mine for entry in edit.entries):
+            by_sheet.setdefault(book.index_for(entry.date).title, []).append(entry)
+        count = 0
+        for title, sheet_entries in by_sheet.items():
+            self.pending = sheet_entries
+            self.resolve(book.sheet_index(title), self.start_offset, workbook)
+            count += self.apply(book.sheet_index(title), workbook)
+        self.pending = []
+        return count
+
+    def print_summary(self) -> None:
+        for edit in sorted(self.edits, key=lambda e: (e.workbook, e.sheet, e.row, e.column)):
+            label = "追記" if edit.append else "書き込み"
+            for entry in edit.entries:
+                print(f"  → {entry.date} {entry.kind}: セル {edit.coord} に{label} ({entry.summary})")
+        for entry, reason in self.skipped:
+            print(f"  ✗ スキップ: {entry.date} {entry.kind}: {reason} ({entry.summary})")
+
+    def to_dict(self) -> dict:
+        return {
+            "edits": [e.to_dict() for e in sorted(self.edits,
+                                                  key=lambda e: (e.workbook, e.sheet, e.row, e.column))],
+            "skipped": [dict(e.to_dict(), reason=reason) for e, reason in self.skipped],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
@@ -0,0 +1,545 @@
+"""
+Excel へ書き込む前のスプール（write-ahead spool）
+
+Excel でブックを開いていると、ブックの読み込み・保存が PermissionError になる。
+以前の取り込みスクリプトはメールの取得・抽出が済んでいても何も記録せずに終了していたため、
+Excel を閉じて再実行するたびに同じメールの本文の取得と抽出をやり直していた。
+
+取り込みスクリプトは抽出した項目を Excel に触れる前にこのスプールへ追記し（fsync まで行う）、
+メールを処理済みIDに「スプール済み」として記録する。そのうえでスプールの保留中の項目を
+SpoolDrain でまとめてブックに書き込み、保存できたブックの項目を完了にしてメールを処理済みにする。
+ブックが開かれていて保存できなかった項目はスプールに残り、次にいずれかのスクリプト
+（teams_chat_from_outlook.py / teams_chat_from_outlook_rerun.py / daily_report_writer.py /
+writer_daemon.py / provenance.py --undo / write_spool.py --drain）を実行したときに、
+そのスクリプトのブックの読み込み・保存と一緒に書き込まれる（メールの取得・抽出はやり直さない）。
+
+スプールは1行1バッチの JSON Lines（既定はリポジトリ直下の write_spool.jsonl、環境変数 WRITE_SPOOL で変更可）:
+
+  {"batch": バッチID, "run": 実行ID, "at": ..., "entries": [...], "mails": [...], "retract": [...]}
+
+entries は項目（EntryID・計画/結果・要約・報告日）、mails は項目の書き込みが済んだら処理済みIDに
+記録するメール、retract は項目より先に取り消す書き込みID（--reprocess で古くなった項目、provenance.py）。
+同じメールの項目が複数のバッチにある場合は新しいバッチの項目だけを書き込む（再処理で抽出し直した場合）。
+バッチは追記し、書き込みが済んだら残す項目だけのファイルに置き換える（残す項目がなければ削除する）。
+
+書き込み先のブックがない項目もスプールに残す（ブックを用意すれば、メールを取得し直さずに書き込まれる）。
+スプールの追記と置き換えはスプールのロックファイル（write_spool.jsonl.lock）の中で行い、
+置き換えるときはファイルを読み直して書き込んだバッチだけを除く（その間に別のプロセスが追記したバッチは残る）。
+
+ブックの読み込み → 変更 → 保存は WorkbookSession でプロセス間のロック（既定はリポジトリ直下の .workbook.lock、
+環境変数 WORKBOOK_LOCK で変更可）の中で行う。ロックを持っているプロセスがあれば、後から来たプロセスは
+項目をスプールに追記するだけで終わり（daily_report_writer.py はロックが空くまで待つ）、ロックを持っている
+プロセスが保存の後にスプールを読み直し、追記された項目をまとめて書き込んで1回で保存する（グループコミット）。
+スラッシュコマンドが続けて実行されても、ブックの読み込み・保存は項目ごとではなくまとめて行われる。
+
+単体でも実行できる:
+  python src/write_spool.py            # 保留中の項目を表示
+  python src/write_spool.py --drain    # 保留中の項目を書き込む
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import itertools
+import json
+import os
+from pathlib import Path
+
+from file_lock import FileLock
+from state_store import new_run_id
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_SPOOL_NAME = "write_spool.jsonl"
+DEFAULT_LOCK_NAME = ".workbook.lock"
+# daily_report_writer.py などがブックのロックを待つ上限（秒）
+DEFAULT_LOCK_TIMEOUT = 60
+
+# バッチIDの連番（同じ実行IDの WriteSpool が1つのプロセスに複数あっても重複しない）
+_batch_seq = itertools.count(1)
+
+
+def resolve_spool_path(value: str | None = None) -> Path:
+    """
+    スプールファイルの絶対パスを返す。
+
+    value（未指定なら環境変数 WRITE_SPOOL）が相対パスならリポジトリ直下を基準にする。
+    """
+    value = value or os.getenv("WRITE_SPOOL", "")
+    path = Path(value) if value else REPO_ROOT / DEFAULT_SPOOL_NAME
+    if not path.is_absolute():
+        path = REPO_ROOT / path
+    return path
+
+
+def resolve_lock_path(value: str | None = None) -> Path:
+    """ブックのロックファイルの絶対パス（value 未指定なら環境変数 WORKBOOK_LOCK、相対パスはリポジトリ直下が基準）。"""
+    value = value or os.getenv("WORKBOOK_LOCK", "")
+    path = Path(value) if value else REPO_ROOT / DEFAULT_LOCK_NAME
+    if not path.is_absolute():
+        path = REPO_ROOT / path
+    return path
+
+
+def lock_timeout() -> float:
+    """ブックのロックを待つ上限（秒、環境変数 WORKBOOK_LOCK_TIMEOUT）。"""
+    return float(os.getenv("WORKBOOK_LOCK_TIMEOUT") or DEFAULT_LOCK_TIMEOUT)
+
+
+def _now() -> str:
+    return dt.datetime.now().isoformat(timespec="seconds")
+
+
+class WriteSpool:
+    """書き込み前の項目の追記型スプール（読み込みは最初に参照したときに1回だけ）。"""
+
+    def __init__(self, path: Path | None = None, run_id: str | None = None):
+        self.path = path or resolve_spool_path()
+        self.run_id = run_id or new_run_id()
+        self._batches: dict[str, dict] | None = None
+        # 追記・置き換えの間だけ持つスプールのロック
+        self._lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+
+    # ----- 読み込み -----
+    @property
+    def batches(self) -> dict[str, dict]:
+        """バッチID → 保留中のバッチ（追加順）。"""
+        if self._batches is None:
+            self._batches = {}
+            if self.path.exists():
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            # 書き込み途中で中断された末尾行などは読み飛ばす
+                            continue
+                        if record.get("batch"):
+                            self._batches[record["batch"]] = record
+        return self._batches
+
+    def reload(self) -> WriteSpool:
+        """次に参照したときにファイルを読み直す（別のプロセスが追記したバッチを読むため）。"""
+        self._batches = None
+        return self
+
+    def __len__(self) -> int:
+        return len(self.batches)
+
+    def entry_count(self) -> int:
+        """保留中の項目数（古くなった項目も含む）。"""
+        return sum(len(batch["entries"]) for batch in self.batches.values())
+
+    def pending(self):
+        """
+        保留中の (項目, EntryID → メール, 取り消す書き込みID) を返す。
+
+        同じメールの項目が複数のバッチにある場合は、最後のバッチの項目だけを返す。
+        """
+        from write_plan import PlanEntry
+
+        latest: dict[str, str] = {}
+        for batch_id, batch in self.batches.items():
+            for entry in batch["entries"]:
+                latest[entry["entry_id"]] = batch_id
+        entries, mails, retract = [], {}, []
+        for batch_id, batch in self.batches.items():
+            entries.extend(
+                PlanEntry.from_dict(e) for e in batch["entries"] if latest[e["entry_id"]] == batch_id
+            )
+            mails.update((mail["id"], mail) for mail in batch.get("mails", []))
+            retract.extend(w for w in batch.get("retract", []) if w not in retract)
+        return entries, mails, retract
+
+    # ----- 更新 -----
+    def _write(self, records: list[dict], path: Path | None = None, mode: str = "a") -> None:
+        """records を書き込み、ディスクへの書き込みを待つ（停電・強制終了でも失わないため）。"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path or self.path, mode, encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add(self, entries, mails=(), retract=()) -> str | None:
+        """
+        entries（PlanEntry）・mails（state_store の add() と同じ項目の dict）・retract（書き込みID）を
+        1バッチとしてすぐに追記する。すべて空なら何もせず None、追記したらバッチIDを返す。
+        """
+        entries, mails, retract = list(entries), list(mails), list(retract)
+        if not (entries or mails or retract):
+            return None
+        batch = self._batch(entries, mails, retract)
+        with self._lock:
+            self._write([batch])
+        self.batches[batch["batch"]] = batch
+        return batch["batch"]
+
+    def _batch(self, entries, mails, retract) -> dict:
+        return {
+            "batch": f"{self.run_id}:{next(_batch_seq)}",
+            "run": self.run_id,
+            "at": _now(),
+            "entries": [entry.to_dict() for entry in entries],
+            "mails": mails,
+            "retract": retract,
+        }
+
+    def complete(self, batch_ids, keep_entries=(), keep_retract=()) -> str | None:
+        """
+        batch_ids のバッチを完了にし、keep_entries・keep_retract（と、その項目のメール）を1バッチとして残す。
+
+        ファイルを読み直してから一時ファイル経由で置き換えるので、書き込みの間に別のプロセスが追記した
+        バッチはそのまま残る。残すものがなければファイルを削除する。残したバッチのIDを返す。
+        """
+        done = set(batch_ids)
+        keep_entries, keep_retract = list(keep_entries), list(keep_retract)
+        with self._lock:
+            _, mails, _ = self.pending()
+            self.reload()
+            batches = {batch_id: batch for batch_id, batch in self.batches.items() if batch_id not in done}
+            kept = None
+            if keep_entries or keep_retract:
+                keep_ids = dict.fromkeys(entry.entry_id for entry in keep_entries)
+                batch = self._batch(keep_entries, [mails[i] for i in keep_ids if i in mails], keep_retract)
+                kept = batch["batch"]
+                # 残す項目は、後から追記されたバッチ（同じメールの再処理など）より前に置く
+                batches = {kept: batch, **batches}
+            self._batches = batches
+            if not batches:
+                self.path.unlink(missing_ok=True)
+                return None
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            self._write(list(batches.values()), tmp, "w")
+            os.replace(tmp, self.path)
+        return kept
+
+
+def mail_record(entry_id: str, received=None, entries: int = 0, workbook=None) -> dict:
+    """スプールのバッチに入れるメール（書き込みが済んだら StateStore.add() に渡す）。"""
+    from state_store import _iso, _workbook
+
+    return {"id": entry_id, "received": _iso(received), "entries": entries, "workbook": _workbook(workbook)}
+
+
+class SpoolDrain:
+    """
+    スプールの保留中の項目を1回のブックのセッションで書き込む。
+
+    route() で書き込み先を決め、apply() でブックへ書き込み（保存は呼び出し側の WorkbookPool.save_all()）、
+    保存の後に finish() で保存できたブックの項目を完了にする。保存の途中で失敗した場合も finish() を呼べば、
+    保存できたブックの分だけ完了にし、残りはスプールに残す。
+    """
+
+    def __init__(self, pool, spool: WriteSpool | None = None, provenance=None, run_id: str | None = None):
+        self.pool = pool
+        self.spool = spool if spool is not None else WriteSpool(run_id=run_id)
+        # 書き込みの出所（未指定なら route() で開く）
+        self.provenance = provenance
+        self.plan = None
+        # 取り消した記録 / セルに見つからなかった記録
+        self.retracted: list[dict] = []
+        self.missing: list[dict] = []
+        # 書き込み済み（出所の記録がある）のため書き込まなかった項目数
+        self.duplicates = 0
+        # route() で読んだバッチのID / finish() で書き込みを完了にした項目数 / スプールに残したバッチのID
+        self.batch_ids: list[str] = []
+        self.written = 0
+        self.kept_batch: str | None = None
+        self._mails: dict[str, dict] = {}
+        self._applied = False
+        self._saved_mark = 0
+
+    def route(self):
+        """
+        取り消す書き込みをセルから除き、保留中の項目をブックに割り当てた WritePlan を返す
+        （保留中の項目がなければ空の計画）。
+
+        ブックの読み込みの PermissionError はそのまま送出する（スプールは変更しない）。
+        """
+        from provenance import ProvenanceIndex, retract_records
+        from workbook_pool import excel_path_for
+        from write_plan import WritePlan
+
+        self.plan = WritePlan()
+        self.batch_ids = []
+        if not self.spool:
+            return self.plan
+        if self.provenance is None:
+            self.provenance = ProvenanceIndex(run_id=self.spool.run_id)
+        self.batch_ids = list(self.spool.batches)
+        entries, self._mails, retract = self.spool.pending()
+        records = self.provenance.records
+        stale = [records[w] for w in retract if w in records]
+
+        # 途中で追い出し（保存）が起きると保存できたブックを判別できないため、書き込み先をすべて開いておける上限にする
+        paths = {excel_path_for(entry.date) for entry in entries} | {Path(r["workbook"]) for r in stale}
+        self.pool.max_open = max(self.pool.max_open, len(paths) + 1)
+        self._saved_mark = len(self.pool.saved)
+
+        if stale:
+            # 出所の取り消しの記録は保存できたブックの分だけ finish() で行う
+            _, missing = retract_records(self.pool, None, stale)
+            self.missing = missing
+            self.retracted = [r for r in stale if r not in missing]
+        self.plan.pending = entries
+        # 保存は済んだが完了を記録する前に中断した項目は、スプールに追加した後の出所の記録があるので書き込まない
+        since = min(batch["at"] for batch in self.spool.batches.values())
+        _, self.duplicates = self.provenance.reconcile(self.plan, {entry.entry_id for entry in entries}, since)
+        self.plan.route(self.pool)
+        return self.plan
+
+    def apply(self) -> int:
+        """route() で決めた編集をブックに書き込み、書き込んだセル数を返す。"""
+        # スプールが空なら route() は空の計画を返すだけなので、finish() でも何も記録しない
+        if self.plan is None or not self.batch_ids:
+            return 0
+        count = self.plan.apply_pool(self.pool)
+        self._applied = True
+        return count
+
+    def finish(self, state=None) -> int:
+        """
+        保存の後に呼ぶ。保存できた（または変更がなかった）ブックの項目を完了にして出所を記録し、
+        項目がすべて書き込まれたメールを処理済みにする。スプールに残した項目数を返す。
+        """
+        from state_store import StateStore
+        from write_plan import MISSING_WORKBOOK
+
+        if not self._applied:
+            return self.spool.entry_count()
+        unsaved = {str(path) for path in self.pool.unsaved()}
+        done = ({str(path) for path in self.pool.saved[self._saved_mark:]}
+                | {str(path) for path in self.pool.paths()}) - unsaved
+
+        self.provenance.record_plan(self.plan, workbooks=done)
+        self.written = sum(len(edit.entries) for edit in self.plan.edits if edit.workbook in done)
+        for record in self.retracted + self.missing:
+            if record["workbook"] in done or record in self.missing:
+                self.provenance.retract(record)
+        keep_entries = [entry for edit in self.plan.edits if edit.workbook not in done
+                        for entry in edit.entries]
+        # ブックがないメールの項目は残す（daily_report_writer.py から渡された項目は渡したプロセスがエラーを表示する）
+        keep_entries += [entry for entry, reason in self.plan.skipped
+                         if reason == MISSING_WORKBOOK and entry.entry_id in self._mails]
+        keep_retract = [r["w"] for r in self.retracted if r["workbook"] not in done]
+
+        state = state or StateStore(run_id=self.spool.run_id)
+        pending_ids = {entry.entry_id for entry in keep_entries}
+        for entry_id, mail in self._mails.items():
+            if entry_id not in pending_ids:
+                received = dt.datetime.fromisoformat(mail["received"]) if mail.get("received") else None
+                state.add(entry_id, received=received, entries=mail.get("entries", 0),
+                          workbook=mail.get("workbook"))
+        # 出所 → 処理済みID → スプールの順に記録する（途中で中断しても、再度の書き込みは出所の記録で省ける）
+        self.provenance.commit()
+        state.commit()
+        self.kept_batch = self.spool.complete(self.batch_ids, keep_entries, keep_retract)
+        self._applied = False
+        return len(keep_entries)
+
+
+def print_pending(spool: WriteSpool, dry_run: bool = False) -> None:
+    """スプールに残っている項目の件数と、次回の実行で書き込まれることを表示する。"""
+    count = spool.entry_count()
+    if count and not dry_run:
+        print()
+        print(f"スプールに残っている項目: {count}件（{spool.path}）")
+        print("  次にいずれかのスクリプトを実行したときに書き込まれます（メールの取得・抽出はやり直しません）")
+
+
+def drain_before(pool, run_id: str | None = None) -> SpoolDrain | None:
+    """
+    スクリプト自身の書き込みの前に、保留中の項目を pool のブックへ書き込む（保存は呼び出し側）。
+
+    保留中の項目がなければ None。ブックが開かれているなどで書き込めなければ警告を表示して
+    pool のブックを閉じ（スプールは変更しない）、None を返す。
+    """
+    spool = WriteSpool(run_id=run_id)
+    if not spool:
+        return None
+    print(f"スプールの保留中の項目: {spool.entry_count()}件（一緒に書き込みます）")
+    drain = SpoolDrain(pool, spool)
+    try:
+        drain.route()
+        drain.apply()
+    except Exception as e:
+        print(f"警告: スプールの項目を書き込めません（次回に持ち越します）: {type(e).__name__}: {e}")
+        pool.close()
+        return None
+    drain.plan.print_summary()
+    return drain
+
+
+class WorkbookSession:
+    """
+    ブックの読み込み → 変更 → 保存をプロセス間のロックの中で行い、ロックを持っている間に
+    別のプロセスがスプールへ追記した項目を引き受けてまとめて書き込む（グループコミット）。
+
+      session = WorkbookSession(pool, spool)
+      if not session.acquire():   # 別のプロセスが書き込み中 → 項目はそのプロセスが書き込む
+          ...
+      try:
+          ...                     # 自身の書き込み（SpoolDrain など）と保存
+          session.follow(state, drain)
+      finally:
+          session.release(state)
+    """
+
+    def __init__(self, pool, spool: WriteSpool | None = None, lock: FileLock | None = None,
+                 run_id: str | None = None):
+        self.pool = pool
+        self.spool = spool if spool is not None else WriteSpool(run_id=run_id)
+        self.lock = lock or FileLock(resolve_lock_path())
+        # 引き受けて書き込んだ項目数 / 引き受けた分の保存回数
+        self.followed = 0
+        self.saves = 0
+        # 書き込みを試みたうえでスプールに残したバッチ（引き受ける対象にしない）
+        self._kept: set[str] = set()
+
+    def acquire(self, timeout: float = 0) -> bool:
+        """
+        ロックを取る（timeout 秒まで待つ）。取れたらスプールを読み直し、ロックを取る前に読み込んだブックのうち
+        別のプロセスが保存したものを読み込み直す。
+        """
+        if not self.lock.acquire(timeout):
+            return False
+        self.spool.reload()
+        self.pool.refresh()
+        return True
+
+    def _handled(self, drains) -> None:
+        """呼び出し側の SpoolDrain が読んだバッチと残したバッチを、引き受ける対象から除く（失敗した書き込みを繰り返さない）。"""
+        for drain in drains:
+            if drain is not None:
+                self._kept.update(drain.batch_ids)
+                if drain.kept_batch:
+                    self._kept.add(drain.kept_batch)
+
+    def _arrived(self) -> bool:
+        """まだ書き込みを試みていないバッチがスプールにあるか。"""
+        return any(batch_id not in self._kept for batch_id in self.spool.reload().batches)
+
+    def follow(self, state=None, *drains) -> int:
+        """
+        ロックを持ったまま、スプールに追記された項目を書き込んで保存する（追記がなくなるまで繰り返す）。
+
+        drains は呼び出し側が finish() まで済ませた SpoolDrain（残したバッチを引き受ける対象から除く）。
+        書き込んだ項目数を返す。ブックが開かれているなどで書き込めない項目はスプールに残る。
+        """
+        self._handled(drains)
+        count = 0
+        while self._arrived():
+            print(f"他のプロセスから渡された項目: {self.spool.entry_count()}件（まとめて書き込みます）")
+            drain = SpoolDrain(self.pool, self.spool)
+            try:
+                drain.route()
+                drain.apply()
+            except Exception as e:
+                print(f"警告: スプールの項目を書き込めません（次回に持ち越します）: {type(e).__name__}: {e}")
+                self.pool.close()
+                self._handled([drain])
+                break
+            drain.plan.print_summary()
+            saved_mark = len(self.pool.saved)
+            try:
+                self.pool.save_all()
+            except PermissionError as e:
+                print(f"エラー: Excelファイルが開かれています。閉じてから再実行してください: {e.filename}")
+            for path in self.pool.saved[saved_mark:]:
+                print(f"保存: {path}")
+            self.saves += len(self.pool.saved) - saved_mark
+            drain.finish(state)
+            count += drain.written
+            if drain.kept_batch:
+                self._kept.add(drain.kept_batch)
+        self.followed += count
+        return count
+
+    def release(self, state=None, *drains) -> None:
+        """
+        ロックを離す。離した直後に追記された項目があれば（追記したプロセスはロックが取れずに終わっている）、
+        ロックを取り直して書き込む。drains は follow() と同じ。
+        """
+        self._handled(drains)
+        while self.lock.held:
+            self.lock.release()
+            if not self._arrived() or not self.acquire():
+                return
+            self.follow(state)
+
+
+# ===== CLI =====
+def drain_report(args, report) -> int:
+    """--drain: 保留中の項目を書き込んで保存する。"""
+    from settings import load_settings
+    from workbook_pool import WorkbookPool
+
+    spool = WriteSpool(resolve_spool_path(args.spool_file), run_id=report.run_id)
+    if not spool:
+        print("保留中の項目はありません")
+        return 0
+    pool = WorkbookPool(*load_settings().columns)
+    report.add_pool(pool)
+    session = WorkbookSession(pool, spool)
+    if not session.acquire():
+        print(f"他のプロセスが Excel に書き込み中です。保留中の項目（{spool.entry_count()}件）はそのプロセスがまとめて書き込みます")
+        return 0
+    drain = SpoolDrain(pool, spool)
+    try:
+        try:
+            with report.stage("route"):
+                plan = drain.route()
+        except PermissionError as e:
+            pool.close()
+            print(f"エラー: Excelファイルが開かれています。閉じてから再実行してください: {e.filename}")
+            return 1
+        plan.print_summary()
+        with report.stage("apply"):
+            report.counters["cells_written"] = drain.apply()
+        error = None
+        try:
+            with report.stage("save"):
+                saved = pool.save_all()
+        except PermissionError as e:
+            saved, error = list(pool.saved), e
+        with report.stage("state"):
+            kept = drain.finish()
+    finally:
+        session.release(None, drain)
+    report.counters["entries_kept"] = kept
+    for path in saved:
+        print(f"保存: {path}")
+    if error is not None:
+        print(f"エラー: Excelファイルが開かれています。閉じてから再実行してください: {error.filename}")
+    print(f"スプールに残した項目: {kept}件")
+    return 1 if error is not None else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Excel へ書き込む前のスプールを管理します")
+    parser.add_argument("--spool-file", help="スプールファイル（省略時は WRITE_SPOOL または既定の場所）")
+    parser.add_argument("--drain", action="store_true", help="保留中の項目を Excel に書き込みます")
+    args = parser.parse_args()
+
+    if args.drain:
+        from run_report import run_with_report
+
+        return run_with_report("write_spool", drain_report, args)
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    spool = WriteSpool(resolve_spool_path(args.spool_file))
+    entries, mails, retract = spool.pending()
+    print(f"スプール: {spool.path}")
+    print(f"保留中: {len(spool)}バッチ / {len(entries)}項目 / メール {len(mails)}通 / 取り消し {len(retract)}件")
+    for entry in entries:
+        print(f"  {entry.date} {entry.kind}: {entry.summary}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
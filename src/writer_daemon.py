@@ -0,0 +1,189 @@
+"""
+常駐書き込みプロセス（スラッシュコマンドの高速化）
+
+/daily-plan・/daily-result は1回ごとに python src/daily_report_writer.py を起動し、
+インタープリターの起動・openpyxl の import・ブックの読み込み・日付行の走査を毎回やり直している。
+
+このプロセスを起動しておくと、ブックと SheetIndex を開いたまま保持し、
+daily_report_writer.py からの書き込み依頼をローカルの接続
+（Windows は名前付きパイプ、それ以外は Unix ソケット）で受け付ける。
+
+  - daily_report_writer.py は常駐プロセスがあれば依頼し、なければ従来どおり直接書き込む
+  - 書き込みのたびに保存する（CLI と同じ）
+  - ブックの更新日時・サイズが変わっていれば（Excel で編集・保存した場合など）読み込み直す
+  - 接続先と認証キーはリポジトリ直下の .writer_daemon.json に書き、終了時に削除する
+
+使用例:
+  python src/writer_daemon.py            # 起動（Ctrl+C で終了）
+  python src/writer_daemon.py --status   # 起動しているか確認
+  python src/writer_daemon.py --stop     # 終了
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime as dt
+import json
+import os
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+INFO_FILE = REPO_ROOT / ".writer_daemon.json"
+
+# 書き込み依頼の応答待ち（秒）。保存に時間がかかる大きなブックでも待てる長さ
+DEFAULT_TIMEOUT = 120
+
+
+def _family() -> str:
+    return "AF_PIPE" if sys.platform == "win32" else "AF_UNIX"
+
+
+def request(payload: dict, timeout: float = DEFAULT_TIMEOUT) -> dict | None:
+    """
+    常駐プロセスに payload を送って応答を返す。
+
+    常駐プロセスが起動していない（接続できない）場合は None。
+    接続後に応答がない場合は {"ok": False, "output": ...} を返す（書き込まれたか不明なので直接書き込みはしない）。
+    """
+    try:
+        info = json.loads(INFO_FILE.read_text(encoding="utf-8"))
+        address, authkey = info["address"], bytes.fromhex(info["authkey"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+    from multiprocessing.connection import AuthenticationError, Client
+
+    try:
+        conn = Client(address, family=_family(), authkey=authkey)
+    except (OSError, AuthenticationError, EOFError):
+        return None
+    with conn:
+        try:
+            conn.send(payload)
+            if conn.poll(timeout):
+                return conn.recv()
+        except (OSError, EOFError):
+            pass
+    return {"ok": False, "output": "エラー: 常駐プロセスから応答がありません。Excel を開いて書き込まれたか確認してください。\n"}
+
+
+def request_write(target_date: dt.date, mode: str, summary: str) -> bool | None:
+    """常駐プロセスに書き込みを依頼して出力を表示する。常駐プロセスがなければ None。"""
+    reply = request({"op": "write", "date": target_date.isoformat(), "mode": mode, "summary": summary})
+    if reply is None:
+        return None
+    print(reply.get("output", ""), end="")
+    return bool(reply.get("ok"))
+
+
+# ===== 常駐プロセス =====
+def _handle(pool, payload: dict) -> dict:
+    import io
+    import traceback
+
+    from daily_report_writer import write_to_excel
+
+    op = payload.get("op")
+    if op == "ping":
+        return {"ok": True, "pid": os.getpid(), "books": [str(p) for p in pool.paths()]}
+    if op != "write":
+        return {"ok": False, "output": f"エラー: 不明な依頼です: {op}\n"}
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            ok = write_to_excel(dt.date.fromisoformat(payload["date"]), payload["mode"],
+                                payload["summary"], pool=pool)
+        except Exception as e:
+            print(f"エラー: 常駐プロセスでの書き込みに失敗しました。{type(e).__name__}: {e}")
+            traceback.print_exc(file=sys.stderr)
+            ok = False
+    if not ok:
+        # 保存できなかった書き込みを次の依頼に持ち越さないよう、ブックを読み込み直させる
+        pool.close()
+    return {"ok": ok, "output": output.getvalue()}
+
+
+def serve() -> int:
+    import secrets
+    from multiprocessing.connection import AuthenticationError, Listener
+
+    from settings import load_settings
+    from workbook_pool import WorkbookPool
+
+    if request({"op": "ping"}, timeout=5) is not None:
+        print(f"常駐プロセスはすでに起動しています（{INFO_FILE}）")
+        return 1
+
+    authkey = secrets.token_bytes(32)
+    listener = Listener(family=_family(), authkey=authkey)
+    tmp = INFO_FILE.with_suffix(".tmp")
+    # 認証キーを含むので本人だけが読めるようにする（Windows ではユーザーフォルダーの ACL に従う）
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"address": listener.address, "authkey": authkey.hex(), "pid": os.getpid()}, f)
+    os.replace(tmp, INFO_FILE)
+
+    pool = WorkbookPool(*load_settings().columns, watch=True)
+    print(f"常駐プロセスを起動しました（PID {os.getpid()}、Ctrl+C で終了）")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, AuthenticationError, EOFError):
+                continue
+            with conn:
+                try:
+                    payload = conn.recv()
+                except (OSError, EOFError):
+                    continue
+                if payload.get("op") == "stop":
+                    conn.send({"ok": True})
+                    break
+                reply = _handle(pool, payload)
+                try:
+                    conn.send(reply)
+                except OSError:
+                    pass
+            if payload.get("op") == "write":
+                status = "OK" if reply["ok"] else "失敗"
+                print(f"{dt.datetime.now():%H:%M:%S} {payload.get('mode')} {payload.get('date')}: {status}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.close()
+        listener.close()
+        with contextlib.suppress(OSError, ValueError):
+            if json.loads(INFO_FILE.read_text(encoding="utf-8")).get("pid") == os.getpid():
+                INFO_FILE.unlink()
+    print("常駐プロセスを終了しました")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="daily_report_writer の常駐書き込みプロセス")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--status", action="store_true", help="起動しているか確認します")
+    group.add_argument("--stop", action="store_true", help="起動中の常駐プロセスを終了します")
+    args = parser.parse_args()
+
+    if args.status or args.stop:
+        reply = request({"op": "stop" if args.stop else "ping"}, timeout=10)
+        if reply is None:
+            print("常駐プロセスは起動していません")
+            return 1
+        if args.stop:
+            print("常駐プロセスを終了しました")
+        else:
+            print(f"起動中（PID {reply.get('pid')}）")
+            for path in reply.get("books", []):
+                print(f"  開いているブック: {path}")
+        return 0
+
+    return serve()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,527 @@
+"""
+.xlsx / .xlsm のセル値をその場で書き換える軽量エンジン
+
+openpyxl の load_workbook(keep_vba=True) は全シート・スタイル・VBA パーツを読み込み、
+wb.save() でパッケージ全体を再シリアライズ・再圧縮する。1セル書くだけでも
+マクロ入りの報告書では数秒かかり、OneDrive には全体が書き換わったファイルがアップロードされる。
+
+XlsxPatchWorkbook はブックを zip のまま開き、
+
+  - xl/workbook.xml と rels から シート名 → シート XML のパスを求める
+  - 書き込み対象のシート XML と xl/sharedStrings.xml だけをストリームで読む
+  - 保存時は対象シートの該当セル（<c>）と sharedStrings の末尾だけを書き換え、
+    それ以外の zip メンバー（VBA・スタイル・他のシートなど）は圧縮済みのバイト列をそのままコピーする
+
+openpyxl の Workbook / Worksheet と同じ最小限のインターフェース（sheetnames, wb[title],
+active, save, close / title, max_row, iter_rows, cell）を持つため、SheetIndex・WritePlan・
+WorkbookPool からはそのまま使える（EXCEL_ENGINE=patch）。
+
+対応していない構造（ZIP64・数式セルへの書き込みなど）では RuntimeError を送出する。
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import posixpath
+import re
+import struct
+import xml.etree.ElementTree as ET
+import zlib
+from pathlib import Path
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# 書き換えたパーツの圧縮レベル（Excel の既定と同程度）
+DEFLATE_LEVEL = 6
+
+_CELL_REF = re.compile(r"([A-Z]+)(\d+)")
+# XML 1.0 で使えない制御文字
+_ILLEGAL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _q(tag: str) -> str:
+    return f"{{{NS_MAIN}}}{tag}"
+
+
+def column_index(letters: str) -> int:
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - 64
+    return index
+
+
+def column_letter(index: int) -> str:
+    letters = ""
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _escape(text: str) -> str:
+    text = _ILLEGAL_XML.sub("", text)
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+# ===== zip（メンバー単位のコピー） =====
+class _ZipMember:
+    __slots__ = ("name", "record", "offset", "end")
+
+    def __init__(self, name: str, record: bytes, offset: int):
+        self.name = name
+        self.record = record  # セントラルディレクトリのレコード（ファイル名・拡張フィールド込み）
+        self.offset = offset  # ローカルヘッダーの位置
+        self.end = 0          # ローカルヘッダー + データ (+ データディスクリプター) の終端
+
+
+class _ZipPackage:
+    """zip を丸ごとメモリに読み、メンバーの生バイト列を保持する。"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        eocd = data.rfind(b"PK\x05\x06", max(0, len(data) - 65557))
+        if eocd < 0:
+            raise RuntimeError("zip の終端レコードが見つかりません")
+        (_, _, _, _, total, cd_size, cd_offset, comment_len) = struct.unpack(
+            "<IHHHHIIH", data[eocd:eocd + 22])
+        if total == 0xFFFF or cd_offset == 0xFFFFFFFF:
+            raise RuntimeError("ZIP64 形式のブックには対応していません")
+        self.comment = data[eocd + 22:eocd + 22 + comment_len]
+        self.cd_offset = cd_offset
+
+        self.members: list[_ZipMember] = []
+        pos = cd_offset
+        for _ in range(total):
+            if data[pos:pos + 4] != b"PK\x01\x02":
+                raise RuntimeError("zip のセントラルディレクトリが壊れています")
+            flags, = struct.unpack("<H", data[pos + 8:pos + 10])
+            n, m, k = struct.unpack("<HHH", data[pos + 28:pos + 34])
+            offset, = struct.unpack("<I", data[pos + 42:pos + 46])
+            raw_name = data[pos + 46:pos + 46 + n]
+            name = raw_name.decode("utf-8" if flags & 0x800 else "cp437")
+            self.members.append(_ZipMember(name, data[pos:pos + 46 + n + m + k], offset))
+            pos += 46 + n + m + k
+
+        # 各メンバーの終端は次のローカルヘッダー（またはセントラルディレクトリ）の位置
+        ordered = sorted(self.members, key=lambda mem: mem.offset)
+        for current, following in zip(ordered, ordered[1:] + [None]):
+            current.end = following.offset if following else cd_offset
+        self._by_name = {mem.name: mem for mem in self.members}
+
+    def names(self) -> list[str]:
+        return [mem.name for mem in self.members]
+
+    def read(self, name: str) -> bytes:
+        """メンバーを展開して返す。"""
+        mem = self._by_name.get(name)
+        if mem is None:
+            raise KeyError(name)
+        method, = struct.unpack("<H", mem.record[10:12])
+        csize, = struct.unpack("<I", mem.record[20:24])
+        n, m = struct.unpack("<HH", self.data[mem.offset + 26:mem.offset + 30])
+        start = mem.offset + 30 + n + m
+        raw = self.data[start:start + csize]
+        if method == 0:
+            return raw
+        if method == 8:
+            return zlib.decompress(raw, -15)
+        raise RuntimeError(f"未対応の圧縮方式です: {name} (method={method})")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def write(self, path: Path, replacements: dict[str, bytes]) -> bytes:
+        """
+        replacements のメンバーだけを再圧縮し、それ以外は生バイト列のままコピーして path に書く。
+
+        return 書き込んだ zip のバイト列
+
+        一時ファイルに書いてから置き換えるため、途中で失敗しても元のブックは壊れない。
+        """
+        out = bytearray()
+        central = []
+        for mem in self.members:
+            offset = len(out)
+            record = bytearray(mem.record)
+            if mem.name in replacements:
+                content = replacements[mem.name]
+                compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+                packed = compressor.compress(content) + compressor.flush()
+                crc = zlib.crc32(content) & 0xFFFFFFFF
+                version, flags = struct.unpack("<HH", record[6:10])
+                flags &= ~0x08  # サイズと CRC をローカルヘッダーに書くのでデータディスクリプターは不要
+                mod_time, mod_date = struct.unpack("<HH", record[12:16])
+                n, = struct.unpack("<H", record[28:30])
+                raw_name = bytes(record[46:46 + n])
+                out += struct.pack("<IHHHHHIIIHH", 0x04034B50, version, flags, 8,
+                                   mod_time, mod_date, crc, len(packed), len(content), n, 0)
+                out += raw_name
+                out += packed
+                struct.pack_into("<HH", record, 8, flags, 8)
+                struct.pack_into("<III", record, 16, crc, len(packed), len(content))
+            else:
+                out += self.data[mem.offset:mem.end]
+            struct.pack_into("<I", record, 42, offset)
+            central.append(bytes(record))
+
+        cd_offset = len(out)
+        cd = b"".join(central)
+        out += cd
+        out += struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, len(central), len(central),
+                           len(cd), cd_offset, len(self.comment))
+        out += self.comment
+
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(out)
+        os.replace(tmp, path)
+        return bytes(out)
+
+
+# ===== 共有文字列 =====
+class _SharedStrings:
+    def __init__(self, package: _ZipPackage, part: str | None):
+        self.part = part
+        self.items: list[str] = []
+        self._lookup: dict[str, int] | None = None
+        self.added: list[str] = []
+        # 編集で増減した共有文字列のセル参照の数（<sst count> に反映する）
+        self.refs = 0
+        if part and part in package:
+            self._parse(package.read(part))
+
+    def _parse(self, data: bytes) -> None:
+        """<si> ごとの文字列を items に読み込む（ふりがな <rPh> の文字列は含めない）。"""
+        texts: list[str] = []
+        phonetic = 0
+        for event, elem in ET.iterparse(io.BytesIO(data), events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == _q("si"):
+                    texts = []
+                elif tag == _q("rPh"):
+                    phonetic += 1
+                continue
+            if tag == _q("t") and not phonetic:
+                texts.append(elem.text or "")
+            elif tag == _q("rPh"):
+                phonetic -= 1
+            elif tag == _q("si"):
+                self.items.append("".join(texts))
+                elem.clear()
+
+    def get(self, index: int) -> str:
+        return self.items[index]
+
+    def index_of(self, text: str) -> int:
+        """text の共有文字列番号（なければ末尾に追加）。"""
+        if self._lookup is None:
+            self._lookup = {}
+            for i, item in enumerate(self.items):
+                self._lookup.setdefault(item, i)
+        index = self._lookup.get(text)
+        if index is None:
+            index = self._lookup[text] = len(self.items)
+            self.items.append(text)
+            self.added.append(text)
+        return index
+
+    def patched(self, data: bytes) -> bytes:
+        """
+        sharedStrings.xml の末尾に追加分の <si> を足し、count（セル参照の数）/ uniqueCount（文字列の数）を更新する。
+        """
+        xml = data.decode("utf-8")
+        m = re.search(r"<(\w+:)?sst\b[^>]*>", xml)
+        prefix = (m.group(1) or "") if m else ""
+        si = "".join(
+            f'<{prefix}si><{prefix}t xml:space="preserve">{_escape(t)}</{prefix}t></{prefix}si>'
+            for t in self.added
+        )
+        close = xml.rfind(f"</{prefix}sst>")
+        xml = xml[:close] + si + xml[close:]
+
+        def update(match):
+            tag = match.group(0)
+            for attr, delta in (("count", self.refs), ("uniqueCount", len(self.added))):
+                found = re.search(rf'\b{attr}="(\d+)"', tag)
+                if found:
+                    tag = tag.replace(found.group(0), f'{attr}="{max(0, int(found.group(1)) + delta)}"')
+            return tag
+
+        xml = re.sub(r"<(\w+:)?sst\b[^>]*>", update, xml, count=1)
+        return xml.encode("utf-8")
+
+
+# ===== シート =====
+class _PatchCell:
+    __slots__ = ("_sheet", "row", "column")
+
+    def __init__(self, sheet: PatchWorksheet, row: int, column: int):
+        self._sheet = sheet
+        self.row = row
+        self.column = column
+
+    @property
+    def coordinate(self) -> str:
+        return f"{column_letter(self.column)}{self.row}"
+
+    @property
+    def value(self):
+        return self._sheet._value(self.row, self.column)
+
+    @value.setter
+    def value(self, value) -> None:
+        self._sheet._set(self.row, self.column, value)
+
+
+class PatchWorksheet:
+    """シート XML のセル値（openpyxl の data_only=False と同じく数式は "=..."）。"""
+
+    def __init__(self, workbook: XlsxPatchWorkbook, title: str, part: str):
+        self._workbook = workbook
+        self.title = title
+        self.part = part
+        self._cells: dict[tuple[int, int], object] | None = None
+        self._formulas: set[tuple[int, int]] = set()
+        self._max_row = 0
+        self.edits: dict[tuple[int, int], object] = {}
+
+    def _load(self) -> None:
+        """シートのセルの値と数式を最初の参照時に1回だけ読み込む。"""
+        if self._cells is not None:
+            return
+        strings = self._workbook.shared_strings
+        cells: dict[tuple[int, int], object] = {}
+        data = self._workbook.package.read(self.part)
+        row_number = 0
+        for _, elem in ET.iterparse(io.BytesIO(data), events=("end",)):
+            tag = elem.tag
+            if tag == _q("row"):
+                row_number = int(elem.get("r", row_number + 1))
+                self._max_row = max(self._max_row, row_number)
+                elem.clear()
+                continue
+            if tag != _q("c"):
+                continue
+            ref = _CELL_REF.fullmatch(elem.get("r", ""))
+            if ref is None:
+                continue
+            key = (int(ref.group(2)), column_index(ref.group(1)))
+            formula = elem.find(_q("f"))
+            v = elem.find(_q("v"))
+            kind = elem.get("t", "n")
+            if formula is not None:
+                self._formulas.add(key)
+                cells[key] = "=" + (formula.text or "")
+            elif kind == "s" and v is not None:
+                cells[key] = strings.get(int(v.text))
+            elif kind == "inlineStr":
+                cells[key] = "".join(t.text or "" for t in elem.iter(_q("t")))
+            elif kind in ("str", "e") and v is not None:
+                cells[key] = v.text or ""
+            elif kind == "b" and v is not None:
+                cells[key] = v.text == "1"
+            elif v is not None and v.text:
+                number = float(v.text)
+                cells[key] = int(number) if number.is_integer() else number
+        self._cells = cells
+
+    @property
+    def max_row(self) -> int:
+        self._load()
+        return self._max_row
+
+    def iter_rows(self, min_row=1, max_row=None, min_col=1, max_col=None, values_only=True):
+        self._load()
+        max_row = max_row or self._max_row
+        max_col = max_col or max((c for _, c in self._cells), default=1)
+        for r in range(min_row, max_row + 1):
+            yield tuple(self._cells.get((r, c)) for c in range(min_col, max_col + 1))
+
+    def cell(self, row: int, column: int) -> _PatchCell:
+        return _PatchCell(self, row, column)
+
+    def _value(self, row: int, column: int):
+        self._load()
+        return self._cells.get((row, column))
+
+    def _set(self, row: int, column: int, value) -> None:
+        self._load()
+        if (row, column) in self._formulas:
+            raise RuntimeError(
+                f"数式セルへの書き込みには対応していません: {self.title}!{column_letter(column)}{row}")
+        self._cells[(row, column)] = value
+        self._max_row = max(self._max_row, row)
+        self.edits[(row, column)] = value
+
+    # ----- 保存 -----
+    def patched(self, data: bytes) -> bytes:
+        """シート XML の編集対象セルだけを書き換えたバイト列を返す。"""
+        xml = data.decode("utf-8")
+        m = re.search(r"<(\w+:)?sheetData\b[^>]*?(/?)>", xml)
+        if m is None:
+            raise RuntimeError(f"sheetData が見つかりません: {self.part}")
+        p = m.group(1) or ""
+        if m.group(2):
+            # <sheetData/> → 空の sheetData に展開
+            xml = xml[:m.start()] + f"<{p}sheetData></{p}sheetData>" + xml[m.end():]
+
+        by_row: dict[int, dict[int, object]] = {}
+        strings = self._workbook.shared_strings
+        for (r, c), value in self.edits.items():
+            by_row.setdefault(r, {})[c] = value
+            if strings.part and value not in (None, "") and not isinstance(value, (bool, int, float)):
+                # 共有文字列を参照するセル（置き換えた既存セルの参照は _patch_row() で引く）
+                strings.refs += 1
+
+        # 後ろの行から書き換えると、前の行の位置がずれない
+        rows = {int(rm.group(2)): rm for rm in
+                re.finditer(rf'<{p}row\b([^>]*?)\br="(\d+)"[^>]*?(/?)>', xml)}
+        for r in sorted(by_row, reverse=True):
+            cells_xml = {c: self._cell_xml(p, r, c, v) for c, v in by_row[r].items()}
+            rm = rows.get(r)
+            if rm is None:
+                xml = self._insert_row(xml, p, r, rows, cells_xml)
+                continue
+            if rm.group(3):
+                # <row r="N" .../> → 子要素付きの行に展開
+                open_tag = rm.group(0)[:-2] + ">"
+                body = "".join(cells_xml[c] for c in sorted(cells_xml))
+                xml = xml[:rm.start()] + open_tag + body + f"</{p}row>" + xml[rm.end():]
+                continue
+            end = xml.index(f"</{p}row>", rm.end())
+            body = self._patch_row(xml[rm.end():end], p, r, cells_xml)
+            xml = xml[:rm.end()] + body + xml[end:]
+        return xml.encode("utf-8")
+
+    def _cell_xml(self, p: str, r: int, c: int, value, style: str = "") -> str:
+        ref = f"{column_letter(c)}{r}"
+        style_attr = f' s="{style}"' if style else ""
+        if value is None or value == "":
+            return f'<{p}c r="{ref}"{style_attr}/>'
+        if isinstance(value, bool):
+            return f'<{p}c r="{ref}"{style_attr} t="b"><{p}v>{int(value)}</{p}v></{p}c>'
+        if isinstance(value, (int, float)):
+            return f'<{p}c r="{ref}"{style_attr}><{p}v>{value!r}</{p}v></{p}c>'
+        text = str(value)
+        strings = self._workbook.shared_strings
+        if strings.part:
+            return f'<{p}c r="{ref}"{style_attr} t="s"><{p}v>{strings.index_of(text)}</{p}v></{p}c>'
+        return (f'<{p}c r="{ref}"{style_attr} t="inlineStr"><{p}is>'
+                f'<{p}t xml:space="preserve">{_escape(text)}</{p}t></{p}is></{p}c>')
+
+    def _patch_row(self, body: str, p: str, r: int, cells_xml: dict[int, str]) -> str:
+        cell_re = re.compile(rf'<{p}c\b[^>]*?\br="([A-Z]+){r}"[^>]*?(?:/>|>.*?</{p}c>)', re.S)
+        pieces = []
+        pos = 0
+        pending = dict(cells_xml)
+        for cm in cell_re.finditer(body):
+            c = column_index(cm.group(1))
+            pieces.append(body[pos:cm.start()])
+            pos = cm.end()
+            # 既存セルより左に入る新しいセルを先に出す
+            for new_c in sorted(k for k in pending if k < c):
+                pieces.append(pending.pop(new_c))
+            if c in pending:
+                open_tag = cm.group(0)[:cm.group(0).index(">")]
+                style = re.search(r'\bs="(\d+)"', open_tag)
+                if re.search(r'\bt="s"', open_tag):
+                    self._workbook.shared_strings.refs -= 1
+                pending.pop(c)
+                pieces.append(self._cell_xml(p, r, c, self.edits[(r, c)],
+                                             style.group(1) if style else ""))
+            else:
+                pieces.append(cm.group(0))
+        pieces.append("".join(pending[c] for c in sorted(pending)))
+        pieces.append(body[pos:])
+        return "".join(pieces)
+
+    def _insert_row(self, xml: str, p: str, r: int, rows: dict, cells_xml: dict[int, str]) -> str:
+        new_row = f'<{p}row r="{r}">' + "".join(cells_xml[c] for c in sorted(cells_xml)) + f"</{p}row>"
+        following = [n for n in rows if n > r]
+        if following:
+            pos = rows[min(following)].start()
+        else:
+            pos = xml.index(f"</{p}sheetData>")
+        return xml[:pos] + new_row + xml[pos:]
+
+
+class XlsxPatchWorkbook:
+    """zip のまま開いたブック（openpyxl の Workbook の一部互換）。"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.package = _ZipPackage(self.path.read_bytes())
+
+        rels = self._relationships("xl/_rels/workbook.xml.rels", "xl")
+        workbook = ET.fromstring(self.package.read("xl/workbook.xml"))
+        self._sheets: dict[str, PatchWorksheet] = {}
+        for sheet in workbook.iter(_q("sheet")):
+            target = rels.get(sheet.get(f"{{{NS_REL}}}id"), (None, None))[1]
+            if target:
+                self._sheets[sheet.get("name")] = PatchWorksheet(self, sheet.get("name"), target)
+        view = workbook.find(f"{_q('bookViews')}/{_q('workbookView')}")
+        self._active = int(view.get("activeTab", 0)) if view is not None else 0
+
+        shared = next((target for kind, target in rels.values() if kind.endswith("/sharedStrings")), None)
+        if shared is None and "xl/sharedStrings.xml" in self.package:
+            # openpyxl が保存したブックは rels を持たず [Content_Types].xml だけで参照している
+            shared = "xl/sharedStrings.xml"
+        self._shared_part = shared
+        self._shared_strings: _SharedStrings | None = None
+
+    def _relationships(self, part: str, base: str) -> dict[str, tuple[str, str]]:
+        root = ET.fromstring(self.package.read(part))
+        rels = {}
+        for rel in root.iter(f"{{{NS_PKG_REL}}}Relationship"):
+            target = rel.get("Target", "")
+            target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(
+                posixpath.join(base, target))
+            rels[rel.get("Id")] = (rel.get("Type", ""), target)
+        return rels
+
+    @property
+    def shared_strings(self) -> _SharedStrings:
+        if self._shared_strings is None:
+            self._shared_strings = _SharedStrings(self.package, self._shared_part)
+        return self._shared_strings
+
+    @property
+    def sheetnames(self) -> list[str]:
+        return list(self._sheets)
+
+    def __getitem__(self, title: str) -> PatchWorksheet:
+        return self._sheets[title]
+
+    @property
+    def active(self) -> PatchWorksheet:
+        sheets = list(self._sheets.values())
+        return sheets[self._active] if self._active < len(sheets) else sheets[0]
+
+    def save(self, path=None) -> None:
+        """編集したシートと sharedStrings だけを書き換えて保存する。"""
+        if self._shared_strings is not None:
+            # 保存に失敗した前回の呼び出しで数えた参照は数え直す
+            self._shared_strings.refs = 0
+        replacements = {}
+        for sheet in self._sheets.values():
+            if sheet.edits:
+                replacements[sheet.part] = sheet.patched(self.package.read(sheet.part))
+        strings = self._shared_strings
+        if strings is not None and (strings.added or strings.refs):
+            replacements[strings.part] = strings.patched(self.package.read(strings.part))
+        target = Path(path) if path else self.path
+        data = self.package.write(target, replacements)
+        # 保存後のブックを基準にする（開いたまま続けて書き込み・保存する場合。
+        # WorkbookPool は一時ファイルに保存してから置き換えるため、保存先が self.path でなくても同じ）
+        self.package = _ZipPackage(data)
+        for sheet in self._sheets.values():
+            sheet.edits.clear()
+        if strings is not None:
+            strings.added.clear()
+            strings.refs = 0
+
+    def close(self) -> None:
+        """zip はメモリ上に読み込み済みなので閉じるファイルはない（openpyxl との互換用）。"""
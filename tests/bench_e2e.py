@@ -0,0 +1,328 @@
+"""
+エンドツーエンドのベンチマーク（合成メールボックス・合成の月のブック）
+
+Outlook / Excel なしで（Linux でも）取り込み全体の性能を測る。
+
+  - 合成メールボックス: Teams 通知メール本文を --mails 通、タグの種類の比率（--tag-mix）を指定して生成する
+  - 合成の月のブック  : create_sample_excel.make_month_workbook で --months の各月の全日の日付ブロック・
+                         記入済みの計画・実績・大きな共有文字列テーブル（--filler）・疑似 VBA パーツ付きの .xlsm を作る
+
+段階ごとに時間を測る（--repeat 回の最小値）:
+
+  extract  本文からの日報抽出（report_extractor.extract_daily_reports）
+  load     ブックの読み込み（WorkbookPool.open、EXCEL_ENGINE は --engine）
+  lookup   シートの走査（SheetIndex）と全項目の日付行の検索
+  fill     空き行への割り当てと書き込み（WritePlan.route / apply_pool）
+  save     保存（WorkbookPool.save_all）
+  e2e      .eml に書き出したメールボックスから teams_chat_from_outlook.py を実行した全体の時間
+
+--baseline の JSON（既定 tests/bench_e2e_baseline.json）と比較し、
+許容幅（--tolerance、既定 25%）と --min-delta-ms（既定 10 ms、短い段階の揺らぎを無視する）の
+両方を超えて遅くなった段階があれば終了コード 1。
+基準はマシンごとに --save-baseline で作る（同じ条件で計測した基準とだけ比較する）。
+
+実行方法:
+  python tests/bench_e2e.py --save-baseline
+  python tests/bench_e2e.py
+  python tests/bench_e2e.py --mails 5000 --filler 50000 --engine patch --tag-mix plan=4,result=4,plain=1,none=3
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from email.message import EmailMessage
+from pathlib import Path
+
+TESTS = Path(__file__).resolve().parent
+SRC = TESTS.parent / "src"
+sys.path.insert(0, str(SRC))
+
+from create_sample_excel import make_month_workbook  # noqa: E402
+from report_extractor import extract_daily_reports  # noqa: E402
+
+DEFAULT_BASELINE = TESTS / "bench_e2e_baseline.json"
+STAGES = ("extract", "load", "lookup", "fill", "save", "e2e")
+COLUMNS = ("B", "C", "F", 6)
+
+SUMMARIES = [
+    "設計レビューの準備", "要件定義完了", "テスト完了", "ログ保存先不具合対応",
+    "会議資料作成", "顧客打合せ", "コードレビュー対応", "リリース手順書の更新",
+]
+FILLER = "‌ " * 40
+
+
+# ===== 合成メールボックス =====
+
+def parse_tag_mix(text: str) -> dict[str, float]:
+    """"plan=4,result=4,plain=1,none=1" → 種類ごとの重み"""
+    mix = {"plan": 0.0, "result": 0.0, "plain": 0.0, "none": 0.0}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in mix:
+            raise argparse.ArgumentTypeError(f"--tag-mix の種類が不正です: {name}（plan / result / plain / none）")
+        mix[name.strip()] = float(weight)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("--tag-mix の重みがすべて 0 です")
+    return mix
+
+
+def make_tag_line(rng: random.Random, kind: str, day: dt.date, dated: bool) -> str:
+    summary = f"{rng.choice(SUMMARIES)} {rng.randrange(10 ** 4)}"
+    date_s = f" {day.month}/{day.day}" if dated else ""
+    if kind == "plan":
+        return f"#日報計画{date_s} {rng.choice(['要約: ', '要約：', ''])}{summary}"
+    if kind == "result":
+        return f"#日報結果{date_s} {rng.choice(['要約: ', '要約：', ''])}{summary}"
+    return f"#日報{date_s} {summary}"
+
+
+def make_mailbox(n: int, months: list[tuple[int, int]], mix: dict[str, float], seed: int = 0):
+    """(本文, 受信日時) を n 通。報告日は months の各月に散らばる（8割は日付付きのタグ）。"""
+    rng = random.Random(seed)
+    kinds, weights = list(mix), list(mix.values())
+    days = []
+    for year, month in months:
+        day = dt.date(year, month, 1)
+        while day.month == month:
+            days.append(day)
+            day += dt.timedelta(days=1)
+
+    mails = []
+    for _ in range(n):
+        report_day = rng.choice(days)
+        received = dt.datetime.combine(report_day, dt.time(rng.randint(8, 20), rng.randint(0, 59)))
+        lines = []
+        for _ in range(rng.randint(1, 3)):
+            kind = rng.choices(kinds, weights)[0]
+            if kind != "none":
+                lines.append(make_tag_line(rng, kind, report_day, dated=rng.random() < 0.8))
+        tags = "\n".join(lines)
+        chatter = "\n".join(rng.choice(SUMMARIES) for _ in range(rng.randint(0, 6)))
+        footer = "\n" + FILLER * rng.randint(1, 4) + "\n"
+        preview = f"YAMADA Taro 山田 太郎 {rng.choice(SUMMARIES)} {FILLER}\n"
+        body = f"{preview}{tags}{footer}Microsoft Teams\nYAMADA Taro\n{tags}\n{chatter}{footer}"
+        mails.append((body, received))
+    return mails
+
+
+def write_eml(mails, directory: Path) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    for i, (body, received) in enumerate(mails):
+        msg = EmailMessage()
+        msg["Subject"] = f"チームメンバー: Microsoft Teams でのチャットの会話 {i}"
+        msg["Message-ID"] = f"<bench-{i}@example.invalid>"
+        msg["Date"] = received.astimezone().strftime("%a, %d %b %Y %H:%M:%S %z")
+        msg.set_content(body)
+        (directory / f"{i:06d}.eml").write_bytes(bytes(msg))
+
+
+# ===== 計測 =====
+
+def timed(func):
+    t0 = time.perf_counter()
+    result = func()
+    return time.perf_counter() - t0, result
+
+
+def bench_extract(mails, repeat: int):
+    best, entries = None, []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed, results = timed(lambda: [extract_daily_reports(body, received.date())
+                                              for body, received in mails])
+        best = elapsed if best is None else min(best, elapsed)
+    for (_, received), reports in zip(mails, results):
+        for kind, summary, report_date in reports:
+            entries.append((kind, summary, report_date or received.date()))
+    return best, entries
+
+
+def bench_workbooks(entries, pristine: dict[Path, Path], repeat: int) -> dict[str, float]:
+    """load / lookup / fill / save をブックを作り直しながら repeat 回測り、段階ごとの最小値を返す。"""
+    from workbook_pool import WorkbookPool
+    from write_plan import WritePlan
+
+    best: dict[str, float] = {}
+    for _ in range(repeat):
+        for work, original in pristine.items():
+            shutil.copyfile(original, work)
+        times = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            pool = WorkbookPool(*COLUMNS, max_open=len(pristine))
+            times["load"], _ = timed(lambda: [pool.open(path) for path in pristine])
+
+            def lookup():
+                for kind, _, day in entries:
+                    book = pool.get(day)
+                    if book is not None:
+                        book.index_for(day).find_row(day)
+
+            times["lookup"], _ = timed(lookup)
+
+            def fill():
+                plan = WritePlan()
+                for i, (kind, summary, day) in enumerate(entries):
+                    plan.add(str(i), kind, summary, day)
+                plan.route(pool)
+                return plan.apply_pool(pool)
+
+            times["fill"], written = timed(fill)
+            times["save"], _ = timed(pool.save_all)
+            pool.close()
+        for stage, elapsed in times.items():
+            best[stage] = min(best.get(stage, elapsed), elapsed)
+    best["cells"] = written
+    return best
+
+
+def bench_e2e(eml_dir: Path, pristine: dict[Path, Path], env: dict, repeat: int) -> float:
+    best = None
+    for i in range(repeat):
+        for work, original in pristine.items():
+            shutil.copyfile(original, work)
+        # 処理済みID・出所の記録・スプールは毎回新しいファイルにする（リポジトリ直下の記録には書き込まない。
+        # 実際のスプールを使うと、残っている項目をベンチのブックへ書き込んで消してしまう）
+        state = eml_dir.parent / f"state_{i}.jsonl"
+        provenance = eml_dir.parent / f"provenance_{i}.jsonl"
+        spool = eml_dir.parent / f"spool_{i}.jsonl"
+        run_env = dict(env, STATE_FILE=str(state), PROVENANCE_FILE=str(provenance), WRITE_SPOOL=str(spool))
+        t0 = time.perf_counter()
+        run_import(eml_dir, run_env, "--full-scan")
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    # 新着メールがない2回目の差分取得（スプールも空）も正常に終わること（計測には含めない）
+    output = run_import(eml_dir, run_env)
+    if "エラー" in output:
+        print(output[-2000:])
+        raise RuntimeError("新着なしの差分取得でエラーが表示されました")
+    return best
+
+
+def run_import(eml_dir: Path, env: dict, *args: str) -> str:
+    """teams_chat_from_outlook.py を実行して標準出力を返す（終了コードが 0 以外なら RuntimeError）。"""
+    result = subprocess.run(
+        [sys.executable, str(SRC / "teams_chat_from_outlook.py"), "--source", f"eml:{eml_dir}", *args],
+        env=env, capture_output=True, text=True, encoding="utf-8",
+    )
+    if result.returncode != 0:
+        print(result.stdout[-2000:], result.stderr[-2000:])
+        raise RuntimeError(f"teams_chat_from_outlook.py が失敗しました（終了コード {result.returncode}）")
+    return result.stdout
+
+
+# ===== 基準との比較 =====
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta: float) -> bool:
+    """基準より tolerance（割合）と min_delta（秒）の両方を超えて遅い段階があれば False。"""
+    if baseline.get("params") != results["params"]:
+        print("! 基準と計測条件が異なるため比較しません（--save-baseline で作り直してください）")
+        print(f"  基準: {baseline.get('params')}")
+        return True
+    ok = True
+    print(f"基準との比較（許容 +{tolerance:.0%}、基準 {baseline.get('created', '?')}）:")
+    for stage in STAGES:
+        now, base = results["stages"].get(stage), baseline["stages"].get(stage)
+        if now is None or base is None:
+            continue
+        ratio = now / base if base else 1.0
+        status = "✓"
+        if ratio > 1 + tolerance and now - base > min_delta:
+            status = "✗ 回帰"
+            ok = False
+        print(f"  {status:<4} {stage:<8} {base * 1000:9.1f} ms → {now * 1000:9.1f} ms ({ratio:5.2f}x)")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="エンドツーエンドのベンチマーク（合成メールボックス・月のブック）")
+    parser.add_argument("--mails", type=int, default=2000)
+    parser.add_argument("--months", default="2026-01,2026-02,2026-03", help="YYYY-MM のカンマ区切り")
+    parser.add_argument("--tag-mix", type=parse_tag_mix, default="plan=4,result=4,plain=1,none=1",
+                        help="タグの種類の重み（plan / result / plain / none）")
+    parser.add_argument("--filler", type=int, default=20000, help="1冊あたりの共有文字列の備考の件数")
+    parser.add_argument("--vba-kb", type=int, default=1024)
+    parser.add_argument("--engine", choices=("openpyxl", "patch"), default="openpyxl")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-e2e", action="store_true", help="スクリプト全体の計測（e2e）を省略する")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果を基準として保存する")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="基準に対して許容する遅れ（割合）")
+    parser.add_argument("--min-delta-ms", type=float, default=10,
+                        help="これより小さい遅れは回帰としない（ミリ秒）")
+    args = parser.parse_args()
+
+    months = [tuple(int(part) for part in m.split("-")) for m in args.months.split(",")]
+    os.environ["EXCEL_ENGINE"] = args.engine
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        os.environ["EXCEL_PATH"] = str(tmp / "{month_name}.xlsm")
+        pristine = {}
+        t0 = time.perf_counter()
+        for i, (year, month) in enumerate(months):
+            original = tmp / f"original_{month}.xlsm"
+            make_month_workbook(original, year, month, filler=args.filler, vba_kb=args.vba_kb,
+                                seed=args.seed + i)
+            pristine[tmp / f"{month}月.xlsm"] = original
+        mails = make_mailbox(args.mails, months, args.tag_mix, args.seed)
+        size = sum(p.stat().st_size for p in pristine.values())
+        print(f"メール {len(mails)}通 / ブック {len(pristine)}冊 ({size:,} bytes) / engine={args.engine} "
+              f"(生成 {time.perf_counter() - t0:.1f}秒)")
+
+        stages = {}
+        stages["extract"], entries = bench_extract(mails, args.repeat)
+        stages.update(bench_workbooks(entries, pristine, args.repeat))
+        cells = stages.pop("cells")
+        if not args.no_e2e:
+            write_eml(mails, tmp / "eml")
+            # 実行レポートは一時ディレクトリへ書き、リポジトリ直下の前回分（夜間実行など）を上書きしない
+            # ブックのロックも一時ディレクトリに置き、夜間実行や常駐の書き込みとロックを取り合わない
+            env = dict(os.environ, MAIL_MIRROR="0", RUN_REPORT_DIR=str(tmp / "run_reports"),
+                       WORKBOOK_LOCK=str(tmp / ".workbook.lock"))
+            env.pop("METRICS_FILE", None)
+            stages["e2e"] = bench_e2e(tmp / "eml", pristine, env, args.repeat)
+
+    print(f"項目 {len(entries)}件 / 書き込みセル {cells}件")
+    print()
+    for stage in STAGES:
+        if stage in stages:
+            print(f"  {stage:<8} {stages[stage] * 1000:9.1f} ms")
+    print()
+
+    params = {k: v for k, v in vars(args).items()
+              if k in ("mails", "months", "filler", "vba_kb", "engine", "seed")}
+    params["tag_mix"] = args.tag_mix
+    results = {
+        "params": params,
+        "created": dt.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "stages": stages,
+    }
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"基準を保存しました: {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"基準がありません（--save-baseline で作成）: {args.baseline}")
+        return
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if not compare(results, baseline, args.tolerance, args.min_delta_ms / 1000):
+        exit(1)
+    print()
+    print("✓ 回帰なし")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+extract_daily_reports のマイクロベンチマーク
+
+合成した Teams 通知メール本文のコーパスに対して、
+旧実装（正規表現6回走査）と src/report_extractor.py の1パス実装を比較する。
+計測前に全件の抽出結果が一致することを確認する。
+
+--jobs を指定すると、extract_all（プロセスプールでの並列抽出）の通/秒も計測し、
+結果と並び順が直列実行と一致することを確認する。
+
+実行方法:
+  python tests/bench_extract.py
+  python tests/bench_extract.py --mails 5000 --repeat 5
+  python tests/bench_extract.py --mails 40000 --repeat 1 --jobs 4
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import io
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from report_extractor import extract_all, extract_daily_reports  # noqa: E402
+
+
+def legacy_extract_daily_reports(text: str, mail_received_date=None):
+    """比較用: 集約前の extract_daily_reports（teams_chat_from_outlook_rerun.py 版）"""
+    if "Microsoft Teams" in text:
+        parts = text.split("Microsoft Teams")
+        if len(parts) > 1:
+            text = parts[-1]
+
+    reports = []
+    base_year = mail_received_date.year if mail_received_date else dt.date.today().year
+
+    def year_for(month):
+        year = base_year
+        if mail_received_date:
+            if mail_received_date.month == 12 and month == 1:
+                year = base_year + 1
+            elif mail_received_date.month == 1 and month == 12:
+                year = base_year - 1
+        return year
+
+    for kind, pattern in (
+        ("plan", r"#日報計画\s+(\d{1,2})/(\d{1,2})\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)"),
+        ("result", r"#日報結果\s+(\d{1,2})/(\d{1,2})\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)"),
+    ):
+        for m in re.finditer(pattern, text):
+            month = int(m.group(1))
+            day = int(m.group(2))
+            summary = m.group(3).strip()[:50]
+            if not summary:
+                continue
+            try:
+                reports.append((kind, summary, dt.date(year_for(month), month, day)))
+            except ValueError:
+                print(f"  警告: 無効な日付 {month}/{day}")
+
+    for m in re.finditer(r"#日報\s+(\d{1,2})/(\d{1,2})\s+(.+?)(?:\n|$)", text):
+        month = int(m.group(1))
+        day = int(m.group(2))
+        summary = m.group(3).strip()[:50]
+        if summary and "計画" not in summary and "結果" not in summary:
+            try:
+                reports.append(("result", summary, dt.date(year_for(month), month, day)))
+            except ValueError:
+                print(f"  警告: 無効な日付 {month}/{day}")
+
+    if not reports:
+        for m in re.finditer(r"#日報計画\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)", text):
+            summary = m.group(1).strip()[:50]
+            if summary and not re.match(r"\d{1,2}/\d{1,2}", summary):
+                reports.append(("plan", summary, None))
+        for m in re.finditer(r"#日報結果\s*(?:要約[:：]\s*)?(.+?)(?:\n|$)", text):
+            summary = m.group(1).strip()[:50]
+            if summary and not re.match(r"\d{1,2}/\d{1,2}", summary):
+                reports.append(("result", summary, None))
+        for m in re.finditer(r"#日報\s+(.+?)(?:\n|$)", text):
+            summary = m.group(1).strip()[:50]
+            if (summary and "計画" not in summary and "結果" not in summary
+                    and not re.match(r"\d{1,2}/\d{1,2}", summary)):
+                reports.append(("result", summary, None))
+
+    return reports
+
+
+# ===== 合成コーパス =====
+SUMMARIES = [
+    "設計レビューの準備", "要件定義完了", "テスト完了", "ログ保存先不具合対応",
+    "会議資料作成", "顧客打合せ", "コードレビュー対応", "リリース手順書の更新",
+]
+FILLER = "‌ " * 40
+
+
+def make_tag_line(rng: random.Random, received: dt.date) -> str:
+    summary = rng.choice(SUMMARIES)
+    d = received - dt.timedelta(days=rng.randint(0, 3))
+    date_s = f"{d.month}/{d.day}"
+    return rng.choice([
+        f"#日報計画 {date_s} 要約: {summary}",
+        f"#日報結果 {date_s} 要約：{summary}",
+        f"#日報計画 {date_s} {summary}",
+        f"#日報結果 {date_s} {summary}",
+        f"#日報 {date_s} {summary}",
+        f"#日報計画 {summary}",
+        f"#日報結果 要約: {summary}",
+        f"#日報 {summary}",
+        f"#日報計画 13/45 {summary}",        # 無効な日付
+        f"#日報 {date_s} 計画だけ書いた",     # 単独 #日報 の除外条件
+        f"#日報計画 {date_s}\n{summary}",     # 日付の後で改行
+    ])
+
+
+def make_body(rng: random.Random, received: dt.date) -> str:
+    preview = f"YAMADA Taro 山田 太郎 {rng.choice(SUMMARIES)} {FILLER}\n"
+    tags = "\n".join(make_tag_line(rng, received) for _ in range(rng.randint(0, 4)))
+    chatter = "\n".join(rng.choice(SUMMARIES) for _ in range(rng.randint(0, 6)))
+    footer = "\n" + FILLER * rng.randint(1, 4) + "\n"
+    if rng.random() < 0.8:
+        return f"{preview}{tags}{footer}Microsoft Teams\nYAMADA Taro\n{tags}\n{chatter}{footer}"
+    return f"{chatter}\n{tags}{footer}"
+
+
+def make_corpus(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    start = dt.date(2025, 4, 1)
+    corpus = []
+    for _ in range(n):
+        received = start + dt.timedelta(days=rng.randint(0, 364))
+        corpus.append((make_body(rng, received), received))
+    return corpus
+
+
+def bench(func, corpus, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            for body, received in corpus:
+                func(body, received)
+            best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="extract_daily_reports のベンチマーク")
+    parser.add_argument("--mails", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=0, help="extract_all の並列数（0 で計測しない）")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.mails, args.seed)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        mismatches = [
+            i for i, (body, received) in enumerate(corpus)
+            if extract_daily_reports(body, received) != legacy_extract_daily_reports(body, received)
+        ]
+    if mismatches:
+        print(f"✗ 抽出結果の不一致: {len(mismatches)}件 (先頭: #{mismatches[0]})")
+        exit(1)
+    print(f"✓ 抽出結果一致: {len(corpus)}件")
+
+    legacy = bench(legacy_extract_daily_reports, corpus, args.repeat)
+    current = bench(extract_daily_reports, corpus, args.repeat)
+
+    print(f"旧実装   : {legacy * 1000:8.1f} ms ({len(corpus) / legacy:,.0f} 通/秒)")
+    print(f"1パス実装: {current * 1000:8.1f} ms ({len(corpus) / current:,.0f} 通/秒)")
+    print(f"速度比   : {legacy / current:.2f}x")
+
+    if args.jobs:
+        with contextlib.redirect_stdout(io.StringIO()):
+            serial = [extract_daily_reports(body, received) for body, received in corpus]
+        t0 = time.perf_counter()
+        parallel = [reports for reports, _ in extract_all(corpus, jobs=args.jobs)]
+        elapsed = time.perf_counter() - t0
+        print(f"並列抽出 : {elapsed * 1000:8.1f} ms ({len(corpus) / elapsed:,.0f} 通/秒, jobs={args.jobs}、プロセス起動込み)")
+        if parallel != serial:
+            print("✗ 並列抽出の結果・並び順が直列実行と一致しません")
+            exit(1)
+        print(f"✓ 並列抽出の結果・並び順一致: {len(corpus)}件")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+ローカルメールミラーのベンチマーク
+
+bench_extract.py と同じ合成コーパス（1年度分の受信日）を一時ディレクトリのミラーへ保存し、
+
+  - 保存（圧縮・インデックス追記）
+  - ミラーの読み込み（index.jsonl）
+  - 1年度分の全メールをミラーから読み出して extract_daily_reports で再抽出
+
+の時間と、本文の圧縮率を表示する。再抽出結果が元の本文からの抽出と一致することも確認する。
+
+実行方法:
+  python tests/bench_mail_mirror.py
+  python tests/bench_mail_mirror.py --mails 20000
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bench_extract import make_corpus  # noqa: E402
+from mail_mirror import MailMirror  # noqa: E402
+from report_extractor import extract_daily_reports  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ローカルメールミラーのベンチマーク")
+    parser.add_argument("--mails", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.mails, args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "mirror"
+
+        t0 = time.perf_counter()
+        mirror = MailMirror(root)
+        for i, (body, received) in enumerate(corpus):
+            received_at = dt.datetime.combine(received, dt.time(9)) + dt.timedelta(seconds=i)
+            mirror.put(f"{i:0140X}", received_at, f"Teams チャット {i}", body)
+        mirror.commit()
+        put_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        mirror = MailMirror(root)
+        load_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        results = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for record in mirror.records(dt.date(2025, 4, 1), dt.date(2026, 3, 31), descending=False):
+                results[record.entry_id] = extract_daily_reports(record.body, record.received_date)
+        extract_time = time.perf_counter() - t0
+
+        raw = sum(len(body.encode("utf-8")) for body, _ in corpus)
+        stored = sum(p.stat().st_size for p in (root / "objects").rglob("*.gz"))
+        index_size = (root / "index.jsonl").stat().st_size
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            mismatches = [
+                i for i, (body, received) in enumerate(corpus)
+                if results.get(f"{i:0140X}") != extract_daily_reports(body, received)
+            ]
+
+    print(f"メール数        : {len(corpus)}件")
+    print(f"保存            : {put_time * 1000:8.1f} ms")
+    print(f"ミラー読み込み  : {load_time * 1000:8.1f} ms")
+    print(f"1年度分の再抽出 : {extract_time * 1000:8.1f} ms ({len(results) / extract_time:,.0f} 通/秒)")
+    print(f"本文サイズ      : {raw:,} bytes → 圧縮後 {stored:,} bytes (インデックス {index_size:,} bytes)")
+
+    if mismatches:
+        print(f"✗ 再抽出結果の不一致: {len(mismatches)}件 (先頭: #{mismatches[0]})")
+        exit(1)
+    print(f"✓ 再抽出結果一致: {len(results)}件")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+Outlook メール取得の COM 呼び出し回数比較
+
+Outlook の代わりにローカルの疑似 COM オブジェクト（Folder / Items / Table / MailItem）
+を使い、旧方式（MailItem ごとに EntryID / ReceivedTime / Subject / Body を参照）と
+src/mail_source.py の OutlookMailSource（Table で一括取得、本文は未処理分だけ取得）
+の COM 呼び出し回数を比較する。
+
+疑似オブジェクトへのプロパティ参照・メソッド呼び出し・列挙を全て数えるため、
+OutlookMailSource.com_calls の自己申告値も実測値と照合する。
+
+あわせて、前回の受信日時（watermark）以降だけを取得する差分取得で、
+新着メールがない実行の COM 呼び出し回数がフォルダーの大きさに依存しないことを確認する。
+
+フォルダーに日報以外の Teams 通知（#日報 を含まないメール）が混ざる場合に、
+Outlook 側の絞り込み（OUTLOOK_PREFILTER=dasl / searchfolder）で本文の取得を省けた件数と
+COM 呼び出し回数も比較する（疑似オブジェクトの DASL は本文の部分一致として扱う）。
+
+実行方法:
+  python tests/bench_mail_source.py
+  python tests/bench_mail_source.py --mails 5000 --processed 0.95 --days 30 --notifications 0.8
+"""
+
+import argparse
+import datetime as dt
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import mail_source  # noqa: E402
+from mail_source import OutlookMailSource  # noqa: E402
+from report_extractor import TAG  # noqa: E402
+
+
+class Counter:
+    calls = 0
+
+
+class ComObject:
+    """属性参照ごとに Counter.calls を数える疑似 COM オブジェクト。"""
+
+    def __getattribute__(self, name):
+        if not name.startswith("_"):
+            Counter.calls += 1
+        return object.__getattribute__(self, name)
+
+
+class FakeMail(ComObject):
+    def __init__(self, entry_id, received, subject, body):
+        self.EntryID = entry_id
+        self.ReceivedTime = received
+        self.Subject = subject
+        self.Body = body
+
+    def _received(self):
+        return object.__getattribute__(self, "ReceivedTime")
+
+
+class FakeItems(ComObject):
+    def __init__(self, mails):
+        self._mails = list(mails)
+
+    @property
+    def Count(self):
+        return len(self._mails)
+
+    def Restrict(self, query):
+        return FakeItems(_restrict(self._mails, query))
+
+    def Sort(self, prop, descending):
+        self._mails.sort(key=lambda m: m._received(), reverse=descending)
+
+    def SetColumns(self, columns):
+        pass
+
+    def __iter__(self):
+        for m in self._mails:
+            Counter.calls += 1
+            yield m
+
+
+class FakeColumns(ComObject):
+    def __init__(self):
+        self._names = []
+
+    def RemoveAll(self):
+        self._names = []
+
+    def Add(self, name):
+        self._names.append(name)
+
+
+class FakeTable(ComObject):
+    def __init__(self, mails):
+        self._mails = list(mails)
+        self._pos = 0
+        self._columns = FakeColumns()
+
+    @property
+    def Columns(self):
+        return self._columns
+
+    def GetRowCount(self):
+        return len(self._mails)
+
+    def Restrict(self, query):
+        return FakeTable(_restrict(self._mails, query))
+
+    def Sort(self, prop, descending):
+        self._mails.sort(key=lambda m: m._received(), reverse=descending)
+
+    @property
+    def EndOfTable(self):
+        return self._pos >= len(self._mails)
+
+    def GetArray(self, max_rows):
+        chunk = self._mails[self._pos:self._pos + max_rows]
+        self._pos += len(chunk)
+        return tuple(tuple(object.__getattribute__(m, n) for n in self._columns._names)
+                     for m in chunk)
+
+
+class FlakyTable(FakeTable):
+    """2回目の GetArray で COM エラーになる Table（列挙の途中で Outlook が応答しなくなった場合）。"""
+
+    def GetArray(self, max_rows):
+        if self._pos:
+            raise OSError("(-2147417848, 'The object invoked has disconnected from its clients.')")
+        return super().GetArray(max_rows)
+
+    def Restrict(self, query):
+        return FlakyTable(_restrict(self._mails, query))
+
+
+def _parse_filter(query):
+    since = until = None
+    for clause in filter(None, query.split(" AND ")):
+        value = dt.datetime.strptime(clause.split("'")[1], "%Y/%m/%d %H:%M")
+        if ">=" in clause:
+            since = value
+        else:
+            until = value
+    return since, until
+
+
+def _tagged(mail):
+    return TAG in object.__getattribute__(mail, "Body")
+
+
+def _restrict(mails, query):
+    if query.startswith("@SQL="):
+        # 本文の LIKE '%#日報%' だけを扱う（Outlook では検索インデックスで評価される）
+        return [m for m in mails if _tagged(m)]
+    since, until = _parse_filter(query)
+    return [m for m in mails
+            if (since is None or m._received() >= since)
+            and (until is None or m._received() < until)]
+
+
+class FakeSearchFolder(ComObject):
+    """検索フォルダー（作成時の条件に合うメールだけを持つ）。"""
+
+    def __init__(self, name, mails):
+        self.Name = name
+        self._mails = mails
+
+    def GetTable(self, query, table_contents):
+        return FakeTable(_restrict(self._mails, query))
+
+
+class FakeSearchFolders(ComObject):
+    def __init__(self, folders):
+        self._folders = folders
+
+    def __iter__(self):
+        for f in self._folders:
+            Counter.calls += 1
+            yield f
+
+
+class FakeStore(ComObject):
+    def __init__(self):
+        self._search_folders = []
+
+    def GetSearchFolders(self):
+        return FakeSearchFolders(self._search_folders)
+
+
+class FakeSearch(ComObject):
+    def __init__(self, store, mails):
+        self._store = store
+        self._mails = mails
+
+    def Save(self, name):
+        self._store._search_folders.append(FakeSearchFolder(name, self._mails))
+
+
+class FakeApplication(ComObject):
+    def __init__(self, folder):
+        self._folder = folder
+
+    def AdvancedSearch(self, scope, query, search_subfolders, tag):
+        return FakeSearch(object.__getattribute__(self._folder, "Store"), _restrict(self._folder._mails, "@SQL=" + query))
+
+
+class FakeFolder(ComObject):
+    def __init__(self, name, mails):
+        self.Name = name
+        self.StoreID = "store"
+        self.Store = FakeStore()
+        self.FolderPath = f"\\\\Mailbox\\受信トレイ\\{name}"
+        self._mails = mails
+        self._table = FakeTable
+
+    @property
+    def Items(self):
+        return FakeItems(self._mails)
+
+    def GetTable(self, query, table_contents):
+        return self._table(_restrict(self._mails, query))
+
+
+class FakeInbox(ComObject):
+    def __init__(self, folders):
+        self.Folders = folders
+
+
+class FakeNamespace(ComObject):
+    def __init__(self, folder):
+        self._folder = folder
+        self._by_id = {object.__getattribute__(m, "EntryID"): m for m in folder._mails}
+        self.Application = FakeApplication(folder)
+
+    def GetDefaultFolder(self, kind):
+        return FakeInbox([self._folder])
+
+    def GetItemFromID(self, entry_id, store_id=None):
+        return self._by_id[entry_id]
+
+
+def make_mailbox(n: int, history_days: int, notifications: float = 0.0, seed: int = 0):
+    """
+    受信日時が直近 history_days 日に散らばった n 通のメールを作る。
+
+    notifications の割合は #日報 を含まない Teams 通知（メンション・リアクションなど）にする。
+    """
+    rng = random.Random(seed)
+    end = dt.datetime(2026, 3, 1)
+    mails = []
+    for i in range(n):
+        received = end - dt.timedelta(days=rng.uniform(0, history_days))
+        if rng.random() < notifications:
+            body = f"Microsoft Teams\n山田さんがあなたをメンションしました: 資料の確認をお願いします {i}"
+        else:
+            body = f"Microsoft Teams\n#日報結果 {received.month}/{received.day} 作業{i}"
+        mails.append(FakeMail(f"{i:0140X}", received, f"Teams チャット {i}", body))
+    return mails
+
+
+def legacy_scan(folder, processed, since, until):
+    """旧方式: 全 MailItem を列挙し、プロパティを1つずつ参照する。"""
+    bodies = 0
+    for mail in folder.Items:
+        entry_id = mail.EntryID
+        received = mail.ReceivedTime.date()
+        _ = mail.Subject
+        if received < since or received > until:
+            continue
+        if entry_id in processed:
+            continue
+        _ = mail.Body
+        bodies += 1
+    return bodies
+
+
+def source_scan(source, processed, since, until):
+    bodies = 0
+    for record in source.records(since, until):
+        if record.entry_id in processed:
+            continue
+        _ = record.body
+        bodies += 1
+    return bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outlook メール取得の COM 呼び出し回数比較")
+    parser.add_argument("--mails", type=int, default=3000)
+    parser.add_argument("--days", type=int, default=31, help="取り込み期間の日数")
+    parser.add_argument("--history-days", type=int, default=3 * 365,
+                        help="フォルダー内のメールが散らばる日数")
+    parser.add_argument("--processed", type=float, default=0.9,
+                        help="処理済みとして扱う日報メールの割合")
+    parser.add_argument("--notifications", type=float, default=0.5,
+                        help="#日報 を含まない通知メールの割合（処理済みIDには記録されない）")
+    args = parser.parse_args()
+
+    mails = make_mailbox(args.mails, args.history_days, args.notifications)
+    until = dt.date(2026, 2, 28)
+    since = until - dt.timedelta(days=args.days - 1)
+    rng = random.Random(1)
+    # 項目のないメールは処理済みIDに記録されないため、毎回本文を取得する対象になる
+    processed = {object.__getattribute__(m, "EntryID") for m in mails
+                 if _tagged(m) and rng.random() < args.processed}
+
+    folder = FakeFolder("Teams日報", mails)
+
+    Counter.calls = 0
+    legacy_bodies = legacy_scan(folder, processed, since, until)
+    legacy_calls = Counter.calls
+
+    source = OutlookMailSource("Teams日報", namespace=FakeNamespace(folder))
+    source.folder  # フォルダー検索は両方式で共通なので計測外
+    Counter.calls = 0
+    source_bodies = source_scan(source, processed, since, until)
+    measured = Counter.calls
+
+    print(f"メール数          : {len(mails)}件 (期間 {since} 〜 {until})")
+    print(f"本文取得          : 旧方式 {legacy_bodies}件 / 新方式 {source_bodies}件")
+    print(f"COM 呼び出し(旧)  : {legacy_calls}")
+    print(f"COM 呼び出し(新)  : {measured} (自己申告 {source.com_calls})")
+    print(f"削減率            : {legacy_calls / max(measured, 1):.1f}x")
+
+    # 差分取得: 最新メールの受信日時を watermark とし、24時間の重複確認分だけ列挙する
+    watermark = max(m._received() for m in mails)
+    incremental = OutlookMailSource("Teams日報", namespace=FakeNamespace(folder))
+    incremental.folder
+    Counter.calls = 0
+    overlap = list(incremental.records(watermark - dt.timedelta(hours=24)))
+    print(f"差分取得(新着なし): COM 呼び出し {Counter.calls}回 (重複確認の範囲 {len(overlap)}件)")
+
+    # Outlook 側の絞り込み: #日報 を含まないメールは列挙も本文の取得もしない
+    start, end = dt.datetime.combine(since, dt.time()), dt.datetime.combine(until + dt.timedelta(days=1), dt.time())
+    notices = sum(1 for m in mails if not _tagged(m) and start <= m._received() < end)
+    print(f"通知メール(期間内): {notices}件")
+    ok = legacy_bodies == source_bodies
+    runs = [("dasl", "dasl"), ("searchfolder", "searchfolder(作成)"), ("searchfolder", "searchfolder")]
+    for mode, label in runs:
+        prefiltered = OutlookMailSource("Teams日報", namespace=FakeNamespace(folder), prefilter=mode)
+        prefiltered.folder
+        Counter.calls = 0
+        bodies = source_scan(prefiltered, processed, since, until)
+        print(f"絞り込み {label:<18}: 本文取得 {bodies}件 / 省略 {prefiltered.prefiltered}件, "
+              f"COM 呼び出し {Counter.calls} (自己申告 {prefiltered.com_calls})")
+        ok = ok and bodies == source_bodies - notices and prefiltered.prefiltered == notices
+
+    if not ok:
+        print("✗ 本文取得件数が一致しません")
+        exit(1)
+
+    # Table の GetArray が途中で失敗しても、Items で続きを取得して同じメールを1回ずつ返す
+    folder._table = FlakyTable
+    chunk_rows, mail_source.TABLE_CHUNK_ROWS = mail_source.TABLE_CHUNK_ROWS, 10
+    expected = [record.entry_id for record in OutlookMailSource("Teams日報", namespace=FakeNamespace(
+        FakeFolder("Teams日報", mails))).records(since, until)]
+    flaky = [record.entry_id for record in OutlookMailSource("Teams日報", namespace=FakeNamespace(folder))
+             .records(since, until)]
+    mail_source.TABLE_CHUNK_ROWS = chunk_rows
+    folder._table = FakeTable
+    if flaky != expected:
+        print(f"✗ Table の途中失敗後の列挙が一致しません: {len(flaky)}件 / 期待 {len(expected)}件")
+        exit(1)
+    print(f"Table の途中失敗   : Items で続きを取得 ({len(flaky)}件、重複・欠落なし)")
+
+
+if __name__ == "__main__":
+    main()
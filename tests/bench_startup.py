@@ -0,0 +1,117 @@
+"""
+CLI の起動時間（import 時間）の確認
+
+各スクリプトを新しいプロセスで --help・引数の誤りなどのすぐ終わる経路で起動し、
+
+  - 何もしない python -c "pass" との差（起動にかかった追加時間、最小値）
+  - 重い依存（openpyxl / win32com / python-dotenv）が読み込まれていないこと
+
+を確認する。予算（--budget-ms）を超えるか重い依存が読み込まれていれば終了コード 1。
+スクリプトを import しただけで .env の読み込みや出力が起きないことも確認する。
+
+実行方法:
+  python tests/bench_startup.py
+  python tests/bench_startup.py --repeat 10 --budget-ms 100
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+# 起動直後に終わる経路では読み込まないはずのモジュール
+HEAVY_MODULES = ("openpyxl", "win32com", "dotenv")
+
+# (スクリプト, 引数, 標準入力)
+CASES = [
+    ("daily_report_writer.py", ["--help"], None),
+    ("daily_report_writer.py", ["--mode", "plan"], None),
+    ("daily_report_writer.py", ["--batch", "-"], "plan\t2/30\t日付の誤り\n"),
+    ("teams_chat_from_outlook.py", ["--help"], None),
+    ("teams_chat_from_outlook.py", ["--since", "2026/02/01"], None),
+    ("teams_chat_from_outlook_rerun.py", ["--help"], None),
+    ("writer_daemon.py", ["--help"], None),
+    ("state_store.py", ["--help"], None),
+    ("provenance.py", ["--help"], None),
+    ("write_spool.py", ["--help"], None),
+    ("mail_mirror.py", ["--help"], None),
+]
+
+# スクリプトを実行し、終了後に読み込まれていた重い依存を標準エラーの最終行に出す
+PROBE = r"""
+import json, runpy, sys
+script, *argv = sys.argv[1:]
+sys.path.insert(0, {src!r})
+sys.argv = [script, *argv]
+try:
+    runpy.run_path(script, run_name={run_name!r})
+except SystemExit:
+    pass
+print("\n" + json.dumps(sorted(m for m in {heavy!r} if m in sys.modules)), file=sys.stderr)
+"""
+
+
+def run(cmd, stdin=None):
+    return subprocess.run(cmd, input=stdin, capture_output=True, text=True, encoding="utf-8", cwd=SRC.parent)
+
+
+def best_time(cmd, stdin, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        run(cmd, stdin)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def loaded_heavy(script: str, args, stdin, run_name: str = "__main__"):
+    probe = PROBE.format(src=str(SRC), run_name=run_name, heavy=HEAVY_MODULES)
+    result = run([sys.executable, "-c", probe, str(SRC / script), *args], stdin)
+    return json.loads(result.stderr.strip().splitlines()[-1]), result.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI の起動時間（import 時間）の確認")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=100,
+                        help="python -c pass に対する追加時間の上限（ミリ秒）")
+    args = parser.parse_args()
+
+    baseline = best_time([sys.executable, "-c", "pass"], None, args.repeat)
+    print(f"python -c pass: {baseline * 1000:6.1f} ms（以下はこれとの差）")
+    print()
+
+    ok = True
+    for script, script_args, stdin in CASES:
+        elapsed = best_time([sys.executable, str(SRC / script), *script_args], stdin, args.repeat) - baseline
+        heavy, _ = loaded_heavy(script, script_args, stdin)
+        status = "✓"
+        if elapsed * 1000 > args.budget_ms or heavy:
+            status = "✗"
+            ok = False
+        note = f"  読み込み: {', '.join(heavy)}" if heavy else ""
+        print(f"{status} {elapsed * 1000:6.1f} ms  {script} {' '.join(script_args)}{note}")
+
+    # import だけでは何も実行されない（main() を呼ぶまで .env も読まない）
+    print()
+    for script in dict.fromkeys(case[0] for case in CASES):
+        heavy, stdout = loaded_heavy(script, [], None, run_name="imported")
+        if heavy or stdout:
+            print(f"✗ import 時に実行される処理があります: {script} {heavy or ''} {stdout[:80]!r}")
+            ok = False
+        else:
+            print(f"✓ import のみで副作用なし: {script}")
+
+    if not ok:
+        exit(1)
+    print()
+    print(f"✓ 全経路が予算 {args.budget_ms:g} ms 以内")
+
+
+if __name__ == "__main__":
+    main()
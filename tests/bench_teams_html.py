@@ -0,0 +1,181 @@
+"""
+Teams 通知メールの HTML 本文（src/teams_html.py）のベンチマーク
+
+複数のチャットメッセージをまとめた合成の通知メール（HTMLBody 相当）のコーパスで、
+
+  テキスト : Outlook が作るテキストの本文（Body 相当。ここでは html_to_text で事前に作る）を
+             extract_daily_reports で抽出する現在の経路
+  HTML     : HTML 本文を extract_mail（メッセージごとに分けて抽出）で抽出する経路
+  全体解析 : 比較用に HTML 全体を HTMLParser で最後まで解析する時間（html_to_text）
+
+の通/秒を比較する。計測前に HTML 経路の抽出結果が生成時の正解（全メッセージの項目、
+日付なしの項目はメッセージの投稿日）と一致することを確認し、テキスト経路で失われる項目数と
+受信日で書き込まれる項目数、フッターで解析を打ち切った HTML の割合を表示する。
+
+実行方法:
+  python tests/bench_teams_html.py
+  python tests/bench_teams_html.py --mails 5000 --messages 8 --repeat 5
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from mail_source import html_to_text  # noqa: E402
+from report_extractor import extract_daily_reports, extract_mail  # noqa: E402
+from teams_html import parse_digest  # noqa: E402
+
+SUMMARIES = [
+    "設計レビューの準備", "要件定義完了", "テスト完了", "ログ保存先不具合対応",
+    "会議資料作成", "顧客打合せ", "コードレビュー対応", "リリース手順書の更新",
+]
+AUTHORS = ["山田 太郎", "佐藤 花子", "鈴木 一郎", "YAMADA Taro", "高橋 次郎"]
+CHATTER = ["了解です", "ありがとうございます", "明日の打合せは10時からです", "資料を共有しました"]
+
+STYLE = "<style>" + "".join(f".c{i}{{margin:0;padding:{i}px;font-family:Segoe UI}}" for i in range(80)) + "</style>"
+# フッターの後の配信の説明・通知設定など（Teams の通知メールは本文より長い）
+TRAILER = (
+    "<table>" + "".join(
+        f"<tr><td class=\"c{i % 80}\">このメッセージに関するお知らせ {i}: 通知の頻度は Teams の設定で変更できます。"
+        f"<a href=\"https://teams.example/settings?id={i}\">設定</a></td></tr>" for i in range(120)
+    ) + "</table>"
+)
+
+
+def header_html(rng: random.Random, author: str, sent: dt.datetime) -> str:
+    """投稿者と投稿日時の行（通知メールの書式の揺れを再現する）。"""
+    style = rng.randrange(4)
+    if style == 0:
+        return f"<tr><td><b>{author}</b></td><td>{sent:%Y/%m/%d %H:%M}</td></tr>"
+    if style == 1:
+        return (f"<tr><td>{author} <time datetime=\"{sent.isoformat()}\">"
+                f"{sent:%H:%M}</time></td></tr>")
+    if style == 2:
+        return f"<tr><td>{author}</td></tr><tr><td>{sent.month}/{sent.day} {sent:%H:%M}</td></tr>"
+    return f"<tr><td>{author}　{sent.year}年{sent.month}月{sent.day}日 {sent:%H:%M}</td></tr>"
+
+
+def make_message(rng: random.Random, sent: dt.datetime):
+    """1メッセージの本文の行と、正解の項目 (kind, summary, date)。"""
+    lines, expected = [], []
+    if rng.random() < 0.6:
+        plans, results = [], []
+        for _ in range(rng.randint(1, 3)):
+            summary = rng.choice(SUMMARIES)
+            day = sent.date() - dt.timedelta(days=rng.randint(0, 2))
+            if rng.random() < 0.5:
+                plans.append((f"#日報計画 {day.month}/{day.day} 要約: {summary}", ("plan", summary, day)))
+            else:
+                results.append((f"#日報結果 {day.month}/{day.day} {summary}", ("result", summary, day)))
+        for line, report in plans + results:
+            lines.append(line)
+            expected.append(report)
+    elif rng.random() < 0.7:
+        summary = rng.choice(SUMMARIES)
+        kind = rng.choice(("plan", "result"))
+        lines.append(f"#日報{'計画' if kind == 'plan' else '結果'} 要約: {summary}")
+        expected.append((kind, summary, sent.date()))
+    # 雑談の行は項目の並び順を変えない位置に挟む
+    for _ in range(rng.randint(0, 3)):
+        lines.insert(rng.randint(0, len(lines)), rng.choice(CHATTER))
+    return lines, expected
+
+
+def make_mail(rng: random.Random, received: dt.datetime, messages: int):
+    """合成の通知メール（HTML 本文, 受信日, 正解の項目）。"""
+    parts = [f"<!DOCTYPE html><html><head><meta charset=\"utf-8\">{STYLE}</head><body>"]
+    parts.append(f"<div style=\"display:none;max-height:0;overflow:hidden\">"
+                 f"{rng.choice(AUTHORS)}: {rng.choice(SUMMARIES)}</div>")
+    parts.append("<table><tr><td><h2>Microsoft Teams</h2></td></tr>"
+                 f"<tr><td>{messages} 件の未読メッセージがあります</td></tr></table>")
+    expected = []
+    # 前日の夕方から受信時刻までに投稿されたメッセージ
+    sent = received - dt.timedelta(hours=rng.randint(12, 20))
+    for _ in range(messages):
+        sent += dt.timedelta(minutes=rng.randint(5, 90))
+        lines, reports = make_message(rng, sent)
+        expected.extend(reports)
+        parts.append("<table class=\"card\"><tr><td>Microsoft Teams</td></tr>")
+        parts.append(header_html(rng, rng.choice(AUTHORS), sent))
+        parts.append("<tr><td>" + "".join(f"<p>{line}</p>" for line in lines) + "</td></tr></table>")
+    parts.append("<table><tr><td><a href=\"https://teams.example/reply\">Teams で返信</a></td></tr></table>")
+    parts.append(TRAILER)
+    parts.append("</body></html>")
+    return "".join(parts), received.date(), expected
+
+
+def make_corpus(n: int, messages: int, seed: int = 0):
+    rng = random.Random(seed)
+    start = dt.datetime(2025, 4, 1, 8, 0)
+    corpus = []
+    for _ in range(n):
+        received = start + dt.timedelta(days=rng.randint(0, 364), minutes=rng.randint(0, 600))
+        corpus.append(make_mail(rng, received, rng.randint(1, messages)))
+    return corpus
+
+
+def bench(func, items, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            for body, received in items:
+                func(body, received)
+            best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teams 通知メールの HTML 本文のベンチマーク")
+    parser.add_argument("--mails", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=6, help="1通あたりの最大メッセージ数")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.mails, args.messages, args.seed)
+    html_items = [(html, received) for html, received, _ in corpus]
+    # Outlook の Body 相当（Outlook が作るので計測には含めない）
+    text_items = [(html_to_text(html), received) for html, received, _ in corpus]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        mismatches = [i for i, (html, received, expected) in enumerate(corpus)
+                      if extract_mail(html, received) != expected]
+        text_results = [extract_daily_reports(body, received) for body, received in text_items]
+    if mismatches:
+        print(f"✗ HTML 経路の抽出結果が正解と不一致: {len(mismatches)}件 (先頭: #{mismatches[0]})")
+        exit(1)
+
+    expected_total = sum(len(expected) for _, _, expected in corpus)
+    text_total = sum(len(reports) for reports in text_results)
+    # テキスト経路で受信日が使われる日付なしの項目のうち、投稿日と受信日が異なるもの
+    misdated = sum(1 for (_, received, expected), reports in zip(corpus, text_results)
+                   for kind, summary, date in reports if date is None
+                   and (kind, summary, received) not in expected)
+    consumed = sum(parse_digest(html, received)[1] for html, received in html_items)
+    total_chars = sum(len(html) for html, _ in html_items)
+
+    print(f"✓ HTML 経路の抽出結果が正解と一致: {len(corpus)}通 / {expected_total}項目")
+    print(f"テキスト経路で抽出できた項目: {text_total} / {expected_total}"
+          f"（うち受信日で書き込まれる日付なしの項目 {misdated}）")
+    print(f"HTML の解析範囲: {consumed / total_chars:.0%}（フッター以降は解析しない、"
+          f"平均 {total_chars / len(corpus) / 1024:.1f} KB/通）")
+    print()
+
+    text = bench(extract_daily_reports, text_items, args.repeat)
+    html = bench(extract_mail, html_items, args.repeat)
+    full = bench(lambda body, _received: html_to_text(body), html_items, args.repeat)
+    print(f"テキスト : {text * 1000:8.1f} ms ({len(corpus) / text:,.0f} 通/秒)")
+    print(f"HTML     : {html * 1000:8.1f} ms ({len(corpus) / html:,.0f} 通/秒)")
+    print(f"全体解析 : {full * 1000:8.1f} ms ({len(corpus) / full:,.0f} 通/秒、参考: 打ち切りなしの HTMLParser)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Excel 書き込みエンジンのベンチマーク（openpyxl / xlsx_patch）
+
+12か月分のシートと大きな共有文字列テーブルを持つ報告書ブックに、
+疑似 VBA パーツ（xl/vbaProject.bin）を加えた .xlsm を一時ディレクトリに作り、
+
+  - openpyxl: load_workbook(keep_vba=True) → 書き込み → save
+  - patch   : XlsxPatchWorkbook → 書き込み → save（対象シートと sharedStrings だけ書き換え）
+
+の時間を比較する。どちらも SheetIndex.write で同じ項目を書き込み、
+
+  - 書き込んだセルの値が両エンジンで一致すること（openpyxl で読み直して比較）
+  - patch では書き換えた2パーツ以外の zip メンバーが圧縮済みバイト列ごと元と同一であること
+  - VBA パーツが元と同一であること
+
+を確認する。
+
+実行方法:
+  python tests/bench_xlsx_patch.py
+  python tests/bench_xlsx_patch.py --days 31 --filler 20000 --vba-kb 2048
+"""
+
+import argparse
+import datetime as dt
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from openpyxl import Workbook, load_workbook  # noqa: E402
+
+from create_sample_excel import to_xlsm  # noqa: E402
+from sheet_index import SheetIndex  # noqa: E402
+from xlsx_patch import XlsxPatchWorkbook  # noqa: E402
+
+DATE_COL, PLAN_COL, RESULT_COL = "B", "C", "F"
+ROWS_PER_DAY = 6
+BLOCK_SIZE = 8
+DATE_OFFSET = 3
+FISCAL_MONTHS = [4, 5, 6, 7, 8, 9, 10, 11, 12, 1, 2, 3]
+
+
+def make_workbook(path: Path, fiscal_year: int, days: int, filler: int, vba_kb: int, seed: int):
+    """
+    年度12か月分の月シートを持つ .xlsm を作る。
+
+    各シートには日付ブロック（B列に日付）と過去の記入済み計画・実績、
+    filler 件の一意な文字列（共有文字列テーブルを大きくする）を入れる。
+    """
+    rng = random.Random(seed)
+    wb = Workbook()
+    wb.remove(wb.active)
+    for month in FISCAL_MONTHS:
+        year = fiscal_year if month >= 4 else fiscal_year + 1
+        ws = wb.create_sheet(f"{month}月")
+        ws["B1"], ws["C1"], ws["F1"] = "日付", "業務計画", "業務実績"
+        for i in range(days):
+            start = 2 + i * BLOCK_SIZE
+            try:
+                ws.cell(row=start + DATE_OFFSET, column=2).value = dt.datetime(year, month, i + 1)
+            except ValueError:
+                break
+            for offset in range(rng.randrange(0, ROWS_PER_DAY)):
+                ws.cell(row=start + offset, column=3).value = f"計画 {month}/{i + 1}-{offset} 案件{rng.randrange(10 ** 6)}"
+                ws.cell(row=start + offset, column=6).value = f"実績 {month}/{i + 1}-{offset} 案件{rng.randrange(10 ** 6)}"
+        for j in range(filler // len(FISCAL_MONTHS)):
+            ws.cell(row=300 + j, column=8).value = f"備考 {month}月 {j} {rng.randrange(10 ** 9)}"
+    wb.active = FISCAL_MONTHS.index(2)
+    wb.save(path)
+
+    # Excel が保存したブックと同じく共有文字列テーブルに集め、疑似 vbaProject.bin を加えて .xlsm にする
+    to_xlsm(path, vba_kb, rng)
+
+
+def write_entries(wb, entries):
+    """entries（日付, 種別, 要約）を SheetIndex.write で書き込む。"""
+    indexes = {}
+    for day, kind, summary in entries:
+        title = f"{day.month}月"
+        index = indexes.get(title)
+        if index is None:
+            index = indexes[title] = SheetIndex(wb[title], DATE_COL, PLAN_COL, RESULT_COL, ROWS_PER_DAY)
+        index.write(index.find_row(day), kind, summary, start_offset=1 if kind == "result" else 0)
+
+
+def raw_members(path: Path) -> dict[str, tuple[int, int, int]]:
+    """メンバー名 → (CRC, 圧縮後サイズ, 圧縮方式)"""
+    with zipfile.ZipFile(path) as zf:
+        return {i.filename: (i.CRC, i.compress_size, i.compress_type) for i in zf.infolist()}
+
+
+def raw_bytes(path: Path, name: str) -> bytes:
+    """メンバーの圧縮済みバイト列（ローカルヘッダーの後ろ）"""
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        info = zf.getinfo(name)
+        f.seek(info.header_offset + 26)
+        n, m = int.from_bytes(f.read(2), "little"), int.from_bytes(f.read(2), "little")
+        f.seek(info.header_offset + 30 + n + m)
+        return f.read(info.compress_size)
+
+
+def shared_string_counts(path: Path) -> tuple[int, int, int, int]:
+    """(<sst count>, <sst uniqueCount>, t="s" のセル数, <si> の数)"""
+    with zipfile.ZipFile(path) as zf:
+        xml = zf.read("xl/sharedStrings.xml").decode("utf-8")
+        refs = sum(len(re.findall(r'<c\b[^>]*\bt="s"', zf.read(name).decode("utf-8")))
+                   for name in zf.namelist() if name.startswith("xl/worksheets/sheet"))
+    sst = re.search(r"<sst\b[^>]*>", xml).group(0)
+    count, unique = (int(re.search(rf'\b{attr}="(\d+)"', sst).group(1)) for attr in ("count", "uniqueCount"))
+    return count, unique, refs, len(re.findall(r"<si\b", xml))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Excel 書き込みエンジンのベンチマーク")
+    parser.add_argument("--days", type=int, default=31, help="1シートあたりの日付ブロック数")
+    parser.add_argument("--filler", type=int, default=12000, help="共有文字列を増やすための文字列数（全シート合計）")
+    parser.add_argument("--vba-kb", type=int, default=1024, help="疑似 VBA パーツのサイズ")
+    parser.add_argument("--entries", type=int, default=5, help="書き込む項目数")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fiscal_year = 2025
+    entries = [
+        (dt.date(2026, 2, 1 + i % 20), "plan" if i % 2 else "result", f"ベンチ項目 {i} <&> 新規")
+        for i in range(args.entries)
+    ]
+    # 既存の共有文字列を参照する書き込み（<sst count> だけが増える）
+    entries.append((dt.date(2026, 2, 21), "plan", entries[0][2]))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        original = Path(tmp) / "report.xlsm"
+        make_workbook(original, fiscal_year, args.days, args.filler, args.vba_kb, args.seed)
+        print(f"ブック: {original.stat().st_size:,} bytes / シート {len(FISCAL_MONTHS)}枚 / 書き込み {len(entries)}件")
+
+        timings = {}
+        outputs = {}
+        for engine in ("openpyxl", "patch"):
+            best = None
+            for _ in range(args.repeat):
+                target = Path(tmp) / f"{engine}.xlsm"
+                shutil.copy(original, target)
+                t0 = time.perf_counter()
+                if engine == "openpyxl":
+                    wb = load_workbook(target, keep_vba=True, data_only=False)
+                else:
+                    wb = XlsxPatchWorkbook(target)
+                write_entries(wb, entries)
+                wb.save(target)
+                wb.close()
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+            timings[engine] = best
+            outputs[engine] = target
+
+        for engine, elapsed in timings.items():
+            size = outputs[engine].stat().st_size
+            print(f"{engine:8}: {elapsed * 1000:8.1f} ms  (保存後 {size:,} bytes)")
+        print(f"速度比  : {timings['openpyxl'] / timings['patch']:.1f} 倍")
+
+        # 書き込み結果の比較（両方とも openpyxl で読み直す）
+        ok = True
+        books = {engine: load_workbook(path, data_only=False) for engine, path in outputs.items()}
+        for month in FISCAL_MONTHS:
+            title = f"{month}月"
+            a = [[c.value for c in row] for row in books["openpyxl"][title].iter_rows(min_col=2, max_col=8)]
+            b = [[c.value for c in row] for row in books["patch"][title].iter_rows(min_col=2, max_col=8)]
+            if a != b:
+                print(f"✗ セル値の不一致: シート {title}")
+                ok = False
+
+        # patch では書き換えたパーツ以外を圧縮済みバイト列ごとコピーしているか
+        before = raw_members(original)
+        after = raw_members(outputs["patch"])
+        changed = sorted(name for name in before if before[name] != after.get(name))
+        untouched = [name for name in before if name not in changed]
+        mismatched = [name for name in untouched if raw_bytes(original, name) != raw_bytes(outputs["patch"], name)]
+        print(f"patch で書き換えたパーツ: {', '.join(changed)}")
+        if set(changed) - {"xl/worksheets/sheet11.xml", "xl/sharedStrings.xml"} or mismatched:
+            print(f"✗ 想定外のパーツが変化: {sorted(set(changed) | set(mismatched))}")
+            ok = False
+        else:
+            print(f"✓ ほかの {len(untouched)} パーツは圧縮済みバイト列ごと同一")
+
+        with zipfile.ZipFile(original) as zo, zipfile.ZipFile(outputs["openpyxl"]) as zx:
+            vba_kept = zo.read("xl/vbaProject.bin") == zx.read("xl/vbaProject.bin")
+        print(f"VBA パーツ: openpyxl {'保持' if vba_kept else '変化'} / patch "
+              f"{'保持' if 'xl/vbaProject.bin' in untouched else '変化'}")
+
+        # count はセル参照の数、uniqueCount は文字列の数だけ増えているか
+        count0, unique0, refs0, si0 = shared_string_counts(original)
+        count1, unique1, refs1, si1 = shared_string_counts(outputs["patch"])
+        if (count1 - count0, unique1 - unique0) != (refs1 - refs0, si1 - si0):
+            print(f"✗ <sst> の count / uniqueCount の増分が一致しません: "
+                  f"+{count1 - count0} / +{unique1 - unique0}（参照 +{refs1 - refs0} / 文字列 +{si1 - si0}）")
+            ok = False
+        else:
+            print(f"✓ <sst> count +{count1 - count0}（参照） / uniqueCount +{unique1 - unique0}（文字列）")
+
+        with zipfile.ZipFile(outputs["patch"]) as zf:
+            if zf.testzip() is not None:
+                print("✗ patch の出力 zip の CRC が一致しません")
+                ok = False
+
+    if not ok:
+        exit(1)
+    print("✓ 書き込み結果一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,13 +13,24 @@ Excel 構造（ROWS_PER_DAY=6, 各日付ブロック=8行）:
 
 生成ファイル: tests/sample_report.xlsx
 シート名   : 2月  （SHEET_NAME_PATTERN と一致させる）
+
+--month YYYY-MM を指定すると、その月の全日の日付ブロックを持つ実運用に近い月のブックを作る
+（記入済みの計画・実績、大きな共有文字列テーブル、--xlsm なら疑似 VBA パーツ付きの .xlsm）。
+ベンチマーク（tests/bench_e2e.py）もこの関数でブックを作る:
+
+  python tests/create_sample_excel.py --month 2026-02 --xlsm --filler 20000 --vba-kb 1024
 """
 
+import argparse
+import calendar
 import datetime as dt
+import os
+import random
+import re
+import zipfile
 from pathlib import Path
 from openpyxl import Workbook
 from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
 
 OUTPUT_PATH = Path(__file__).parent / "sample_report.xlsx"
 
@@ -44,17 +55,24 @@ TARGET_DATES = [
 HEADER_ROW = 1   # 1行目にヘッダー
 DATA_START = 2   # データは2行目から
 
+# 共有文字列テーブルを大きくするための備考を書く列・開始行
+FILLER_COL = 8
+FILLER_START = 300
+
+# --- .xlsm への変換 ---
+VBA_CONTENT_TYPE = "application/vnd.ms-office.vbaProject"
+XLSM_CONTENT_TYPE = "application/vnd.ms-excel.sheet.macroEnabled.main+xml"
+SST_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"
+INLINE_STR = re.compile(r'<c( r="[A-Z]+\d+"(?: s="\d+")?) t="inlineStr"><is><t[^>]*>(.*?)</t></is></c>')
+
 
 def thin_border():
     s = Side(style="thin")
     return Border(left=s, right=s, top=s, bottom=s)
 
 
-def make_sample_excel():
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "2月"
-
+def fill_month_sheet(ws, dates):
+    """ws にヘッダーと dates の日付ブロックを配置する。"""
     # --- 列幅 ---
     ws.column_dimensions["A"].width = 4
     ws.column_dimensions["B"].width = 14
@@ -85,7 +103,7 @@ def make_sample_excel():
     date_font  = Font(bold=True)
     input_fill = PatternFill("solid", fgColor="EBF3FB")
 
-    for i, target_date in enumerate(TARGET_DATES):
+    for i, target_date in enumerate(dates):
         input_start_row = DATA_START + i * BLOCK_SIZE
         date_row        = input_start_row + DATE_OFFSET
 
@@ -115,6 +133,13 @@ def make_sample_excel():
         for gap in range(GAP_ROWS):
             ws.row_dimensions[input_start_row + ROWS_PER_DAY + gap].height = 6
 
+
+def make_sample_excel():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "2月"
+    fill_month_sheet(ws, TARGET_DATES)
+
     wb.save(OUTPUT_PATH)
     print(f"サンプル Excel を生成しました: {OUTPUT_PATH}")
     print(f"シート名: {ws.title}")
@@ -126,5 +151,106 @@ def make_sample_excel():
         print(f"  {d}  → B{date_row}  (入力開始: 行{input_start}〜{input_start + ROWS_PER_DAY - 1})")
 
 
+def make_month_workbook(path: Path, year: int, month: int, history: float = 0.5,
+                        filler: int = 0, vba_kb: int = 0, seed: int = 0):
+    """
+    year 年 month 月の全日の日付ブロックを持つ月のブックを作る（シート名「◯月」）。
+
+    history: 入力行のうち記入済みにする割合（過去の計画・実績）
+    filler : H列に書く一意な備考の件数（共有文字列テーブルを大きくする）
+    vba_kb : 0 より大きければ疑似 VBA パーツ付きの .xlsm にする（to_xlsm）
+    """
+    rng = random.Random(seed)
+    days = calendar.monthrange(year, month)[1]
+    dates = [dt.date(year, month, day) for day in range(1, days + 1)]
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = f"{month}月"
+    fill_month_sheet(ws, dates)
+    for i, day in enumerate(dates):
+        input_start_row = DATA_START + i * BLOCK_SIZE
+        for offset in range(ROWS_PER_DAY):
+            for col, label in ((PLAN_COL, "計画"), (RESULT_COL, "実績")):
+                if rng.random() < history:
+                    ws[f"{col}{input_start_row + offset}"] = (
+                        f"{label} {day.month}/{day.day}-{offset} 案件{rng.randrange(10 ** 6)}"
+                    )
+    for j in range(filler):
+        ws.cell(row=FILLER_START + j, column=FILLER_COL).value = f"備考 {month}月 {j} {rng.randrange(10 ** 9)}"
+    wb.save(path)
+    if vba_kb > 0:
+        to_xlsm(path, vba_kb, rng)
+
+
+def to_xlsm(path: Path, vba_kb: int, rng: random.Random):
+    """
+    openpyxl で保存したブックを、Excel が保存した .xlsm に近い形へ変換する。
+
+    openpyxl は文字列をインライン文字列で保存し、VBA パーツも作れないため、
+    文字列を共有文字列テーブルに集め、疑似 vbaProject.bin（vba_kb KB）を加える。
+    """
+    strings: dict[str, int] = {}
+
+    def shared(match):
+        index = strings.setdefault(match.group(2), len(strings))
+        return f'<c{match.group(1)} t="s"><v>{index}</v></c>'
+
+    tmp = path.with_suffix(".tmp")
+    with zipfile.ZipFile(path) as src, zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as dst:
+        items = sorted(src.infolist(), key=lambda i: not i.filename.startswith("xl/worksheets/"))
+        for item in items:
+            data = src.read(item.filename)
+            if item.filename.startswith("xl/worksheets/"):
+                data = INLINE_STR.sub(shared, data.decode("utf-8")).encode("utf-8")
+            elif item.filename == "[Content_Types].xml":
+                data = data.decode("utf-8").replace(
+                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml",
+                    XLSM_CONTENT_TYPE,
+                ).replace(
+                    "</Types>",
+                    f'<Default Extension="bin" ContentType="{VBA_CONTENT_TYPE}"/>'
+                    f'<Override PartName="/xl/sharedStrings.xml" ContentType="{SST_CONTENT_TYPE}"/></Types>',
+                ).encode("utf-8")
+            elif item.filename == "xl/_rels/workbook.xml.rels":
+                data = data.decode("utf-8").replace(
+                    "</Relationships>",
+                    '<Relationship Id="rIdVba" Type="http://schemas.microsoft.com/office/2006/'
+                    'relationships/vbaProject" Target="vbaProject.bin"/>'
+                    '<Relationship Id="rIdSst" Type="http://schemas.openxmlformats.org/officeDocument/'
+                    '2006/relationships/sharedStrings" Target="sharedStrings.xml"/></Relationships>',
+                ).encode("utf-8")
+            dst.writestr(item, data)
+        sst = "".join(f"<si><t>{text}</t></si>" for text in strings)
+        dst.writestr("xl/sharedStrings.xml",
+                     f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                     f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                     f'count="{len(strings)}" uniqueCount="{len(strings)}">{sst}</sst>')
+        dst.writestr("xl/vbaProject.bin", rng.randbytes(vba_kb * 1024 // 2) * 2)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="テスト用サンプル Excel ファイルを生成します")
+    parser.add_argument("--month", help="YYYY-MM: その月の全日分の月のブックを作る（省略時は 2月のサンプル）")
+    parser.add_argument("--output", type=Path, help="出力先（--month のとき。省略時は tests/ に作成）")
+    parser.add_argument("--xlsm", action="store_true", help="疑似 VBA パーツ付きの .xlsm にする")
+    parser.add_argument("--filler", type=int, default=0, help="共有文字列テーブルを大きくする備考の件数")
+    parser.add_argument("--vba-kb", type=int, default=512, help="--xlsm のときの疑似 VBA パーツの大きさ")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not args.month:
+        make_sample_excel()
+        return
+
+    year, month = (int(part) for part in args.month.split("-"))
+    suffix = ".xlsm" if args.xlsm else ".xlsx"
+    path = args.output or Path(__file__).parent / f"sample_{year}_{month:02d}{suffix}"
+    make_month_workbook(path, year, month, filler=args.filler,
+                        vba_kb=args.vba_kb if args.xlsm else 0, seed=args.seed)
+    print(f"月のブックを生成しました: {path}")
+
+
 if __name__ == "__main__":
-    make_sample_excel()
+    main()
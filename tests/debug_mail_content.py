@@ -1,12 +1,59 @@
 """
 メールの詳細内容を確認するスクリプト
+
+--source を指定すると Outlook の代わりにそのメールソースから読む。
+ローカルミラー（--source mirror）なら Outlook 不要・COM 呼び出しなしで確認できる:
+  python tests/debug_mail_content.py --source mirror --since 2026-02-01 --until 2026-02-28
 """
 
-import win32com.client
+import argparse
 import datetime as dt
+import sys
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description="メールの詳細内容を表示します")
+parser.add_argument("--source", help="outlook 以外のメールソース（mirror / eml:<ディレクトリ> など）")
+parser.add_argument("--since", type=dt.date.fromisoformat, help="YYYY-MM-DD（--source 指定時）")
+parser.add_argument("--until", type=dt.date.fromisoformat, help="YYYY-MM-DD（--source 指定時）")
+args = parser.parse_args()
 
 OUTLOOK_FOLDER = "Teams日報"
 
+
+def print_body(body):
+    print(f"本文全体（{len(body)}文字）:")
+    print("-" * 80)
+    print(body)
+    print("-" * 80)
+    print()
+
+    # #日報が何回出現するか
+    count = body.count("#日報")
+    print(f"#日報の出現回数: {count}回")
+    print()
+
+
+if args.source and args.source != "outlook":
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+    from mail_source import open_mail_source
+
+    source = open_mail_source(args.source, OUTLOOK_FOLDER)
+    info = source.describe()
+    print(f"メールソース: {info['folder_path']}")
+    print(f"メール件数: {info['count']}")
+    print("=" * 80)
+
+    for idx, mail in enumerate(source.records(args.since, args.until, descending=False), 1):
+        print(f"\n--- メール {idx} ---")
+        print(f"件名: {mail.subject}")
+        print(f"受信日時: {mail.received}")
+        print(f"EntryID: {mail.entry_id}")
+        print()
+        print_body(mail.body)
+    exit(0)
+
+import win32com.client
+
 outlook = win32com.client.Dispatch("Outlook.Application")
 namespace = outlook.GetNamespace("MAPI")
 inbox = namespace.GetDefaultFolder(6)
@@ -32,14 +79,4 @@ for idx, mail in enumerate(target_folder.Items, 1):
     print(f"送信日時: {mail.SentOn}")
     print(f"作成日時: {mail.CreationTime}")
     print()
-    body = mail.Body or ""
-    print(f"本文全体（{len(body)}文字）:")
-    print("-" * 80)
-    print(body)
-    print("-" * 80)
-    print()
-    
-    # #日報が何回出現するか
-    count = body.count("#日報")
-    print(f"#日報の出現回数: {count}回")
-    print()
+    print_body(mail.Body or "")
@@ -1,9 +1,17 @@
 """
 Teamsチャットメールの詳細なMAPIプロパティを調査
+
+HTMLBody を src/teams_html.py でメッセージ（投稿者・投稿日時・本文）に分けた結果も表示する。
 """
 import win32com.client
 import datetime
 import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from teams_html import split_messages
 
 def debug_mapi_properties():
     outlook = win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
@@ -40,6 +48,14 @@ def debug_mapi_properties():
         print("HTMLBody全文:")
         print(html_body)
         print()
+
+        print("=" * 80)
+        print("メッセージ分割（MAIL_BODY_FORMAT=html のときの抽出単位）:")
+        for message in split_messages(html_body, mail.ReceivedTime.date()):
+            print(f"  {message.sent or '(投稿日時なし)'} {message.author or '(投稿者なし)'}")
+            for line in message.text.splitlines():
+                print(f"    {line}")
+        print()
         
         # タイムスタンプのパターンを検索
         # 例: "2025年12月20日 10:30" や "12/20 10:30" など